@@ -0,0 +1,63 @@
+"""Check that ``python -c "import toymc"`` stays fast.
+
+Runs ``import toymc`` in fresh interpreters and reports the median wall
+time of the whole process. Exits with status 1 if the median exceeds the
+budget, or if importing toymc also imports ROOT, root_util or one of the
+optional output libraries, which should only be loaded when a run uses
+them.
+
+Usage::
+
+    python benchmarks/import_time.py [--budget SECONDS] [--repeat N]
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+
+DEFAULT_BUDGET_S = 0.5
+DEFAULT_REPEAT = 7
+HEAVY_MODULES = ("ROOT", "root_util", "uproot", "pyarrow", "h5py")
+
+
+def process_time(code):
+    """Return the wall time, in seconds, to run ``python -c code``."""
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", code], check=True)
+    return time.perf_counter() - start
+
+
+def main(budget_s, repeat):
+    """Measure the import time and compare it to the budget."""
+    bare = statistics.median(process_time("pass") for _ in range(repeat))
+    full = statistics.median(process_time("import toymc") for _ in range(repeat))
+    check_modules = (
+        "import sys, toymc; "
+        f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    )
+    loaded = subprocess.run(
+        [sys.executable, "-c", check_modules],
+        check=True,
+        stdout=subprocess.PIPE,
+        universal_newlines=True,
+    ).stdout.strip()
+    print(f"python -c 'pass':         {bare:.3f} s")
+    print(f"python -c 'import toymc': {full:.3f} s (budget {budget_s:.3f} s)")
+    failed = False
+    if full > budget_s:
+        print("FAIL: import time is over budget")
+        failed = True
+    if loaded:
+        print(f"FAIL: import toymc also imported {loaded}")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--budget", type=float, default=DEFAULT_BUDGET_S)
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT)
+    args = parser.parse_args()
+    sys.exit(main(args.budget, args.repeat))
@@ -0,0 +1,400 @@
+"""Benchmark event generation, ordering and writing throughput.
+
+Each benchmark case runs in a fresh interpreter and reports its
+throughput in events per second (the median of several repeats), the peak
+memory traced by ``tracemalloc`` during one timed call, and the peak
+resident set size of the whole process. The cases are:
+
+``generate/<type>``
+    ``generate_batch`` for each built-in event type (and a whole
+    :py:class:`~toymc.hall.Hall`) at Daya Bay EH1 rates
+``order/sort`` and ``order/merge``
+    The two ordering steps of ``ToyMC.run``: sorting each event type's
+    batch by timestamp, and merging the sorted streams of all event types
+``run/generate``
+    Everything in ``ToyMC.run`` except writing, for the example
+    configuration
+``write/<format>/<seconds>s``
+    Writing the example configuration's events for runs of several
+    lengths with each output backend, including the file size in bytes
+    per event. Backends whose libraries are not installed are skipped.
+
+The results are compared to ``benchmarks/baseline.json``, and any case
+that is slower, or uses more memory or disk space, than the baseline by
+more than the tolerance is reported as a regression (exit status 1).
+Cases that have no baseline (e.g. a backend that was not installed on
+the reference machine) are listed as missing from the baseline instead.
+After an intentional change, or on a new reference machine, update the
+baseline with ``--save`` and commit it. Skipped cases are not saved.
+
+Usage (with toymc importable, e.g. after ``pip install -e .``)::
+
+    python benchmarks/suite.py [--cases PATTERN] [--tolerance FRACTION]
+        [--save] [--output RESULTS.json]
+"""
+
+import argparse
+import fnmatch
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(BENCHMARKS_DIR, "baseline.json")
+EXAMPLE_CONFIG = os.path.join(os.path.dirname(BENCHMARKS_DIR), "example.py")
+DEFAULT_REPEAT = 7
+DEFAULT_TOLERANCE = 0.3
+SEED = 20120308
+WRITE_DURATIONS_S = (300, 3000, 15000)
+# Event type, duration in seconds (about a million events each)
+GENERATE_CASES = {
+    "single": 50000,
+    "correlated": 7.2e7,
+    "muon": 5000,
+    "hall": 5000,
+}
+
+
+def make_event_type(name):
+    """Create one of the event types of the ``generate/<name>`` cases."""
+    # pylint: disable=import-outside-toplevel
+    from toymc.correlated import Correlated
+    from toymc.hall import Hall
+    from toymc.muon import Muon
+    from toymc.single import Single
+
+    if name == "single":
+        event_type = Single("Single_event", 20, 1, 1)
+        event_type.truth_label = 0
+    elif name == "correlated":
+        event_type = Correlated("IBD_nGd", 1, 1, 0.007, 28000)
+        event_type.truth_label_prompt = 1
+        event_type.truth_label_delayed = 2
+    elif name == "muon":
+        event_type = Muon("Muon", 1, 200)
+        event_type.truth_label_WP = 5
+        event_type.truth_label_AD = 6
+        event_type.truth_label_shower = 7
+    else:
+        event_type = Hall("EH1", 1, {1: 20, 2: 19.5}, muon_rate_Hz=200)
+        event_type.add_correlated("IBD_nGd", 28000, {1: 0.007, 2: 0.007})
+        event_type.add_correlated("IBD_nH", 150000, {1: 0.006, 2: 0.006})
+        event_type.assign_labels(0)
+    return event_type
+
+
+def example_mc(duration_s):
+    """Return a ToyMC object with the configuration from example.py."""
+    # pylint: disable=import-outside-toplevel
+    from toymc import ToyMC
+    from toymc.config import load_config
+
+    mc = ToyMC(os.devnull, duration_s, 0, seed=SEED)
+    load_config(EXAMPLE_CONFIG)(mc)
+    return mc
+
+
+def measure(func, repeat):
+    """Time ``func()`` and trace its memory use.
+
+    Returns the median time of ``repeat`` calls, so that a single
+    unusually fast or slow call does not set the result, the peak memory
+    traced by ``tracemalloc`` during one more call, and that call's
+    return value.
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    result = func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return statistics.median(times), peak, result
+
+
+def case_generate(name, scale, repeat):
+    """Benchmark ``generate_batch`` for one event type."""
+    event_type = make_event_type(name)
+    duration_s = GENERATE_CASES[name] * scale
+
+    def generate():
+        rng = np.random.default_rng(SEED)
+        return len(event_type.generate_batch(rng, duration_s, 0))
+
+    seconds, peak, events = measure(generate, repeat)
+    return {"events": events, "seconds": seconds, "peak_traced_mb": peak / 2**20}
+
+
+def case_order(name, scale, repeat):
+    """Benchmark sorting each event type's batch or merging the streams."""
+    # pylint: disable=import-outside-toplevel
+    from toymc.batch import CHUNK_SIZE, merge_sorted
+
+    mc = example_mc(5000 * scale)
+    rng = np.random.default_rng(SEED)
+    batches = [
+        event_type.generate_batch(rng, mc.duration, 0) for event_type in mc.event_types
+    ]
+    events = sum(len(batch) for batch in batches)
+    if name == "sort":
+
+        def order():
+            return [batch.sorted() for batch in batches]
+
+    else:
+        sorted_batches = [batch.sorted() for batch in batches]
+
+        def order():
+            streams = [batch.split(CHUNK_SIZE) for batch in sorted_batches]
+            return sum(len(batch) for batch in merge_sorted(streams))
+
+    seconds, peak, _ = measure(order, repeat)
+    return {"events": events, "seconds": seconds, "peak_traced_mb": peak / 2**20}
+
+
+def case_run(scale, repeat):
+    """Benchmark ``ToyMC.generate``: generation and ordering, but no writing."""
+
+    def run():
+        mc = example_mc(5000 * scale)
+        return sum(len(batch) for batch in mc.generate())
+
+    seconds, peak, events = measure(run, repeat)
+    return {"events": events, "seconds": seconds, "peak_traced_mb": peak / 2**20}
+
+
+def case_write(output_format, duration_s, repeat, tmpdir):
+    """Benchmark writing the example configuration's events with one backend."""
+    # pylint: disable=import-outside-toplevel
+    from toymc.output import collect_labels, make_writer
+
+    mc = example_mc(duration_s)
+    batches = list(mc.generate())
+    labels = collect_labels(mc.event_types)
+    events = sum(len(batch) for batch in batches)
+    outfile = os.path.join(tmpdir, "benchmark." + output_format)
+
+    def write():
+        writer = make_writer(output_format, outfile, mc.reco_name, mc.calib_name)
+        writer.begin(labels)
+        for batch in batches:
+            writer.add_batch(batch)
+        writer.close()
+        return os.path.getsize(outfile)
+
+    try:
+        seconds, peak, size = measure(write, repeat)
+    except ImportError as error:
+        return {"skipped": f"{type(error).__name__}: {error}"}
+    finally:
+        if os.path.exists(outfile):
+            os.remove(outfile)
+    return {
+        "events": events,
+        "seconds": seconds,
+        "peak_traced_mb": peak / 2**20,
+        "bytes_per_event": size / events,
+    }
+
+
+def case_names():
+    """Return the names of all of the benchmark cases, in order."""
+    # pylint: disable=import-outside-toplevel
+    from toymc.output import WRITERS
+
+    names = ["generate/" + name for name in GENERATE_CASES]
+    names += ["order/sort", "order/merge", "run/generate"]
+    for output_format in sorted(WRITERS):
+        names += [
+            f"write/{output_format}/{duration_s}s" for duration_s in WRITE_DURATIONS_S
+        ]
+    return names
+
+
+def run_case(name, scale, repeat, tmpdir):
+    """Run one benchmark case in this process and return its results."""
+    kind, _, rest = name.partition("/")
+    if kind == "generate":
+        result = case_generate(rest, scale, repeat)
+    elif kind == "order":
+        result = case_order(rest, scale, repeat)
+    elif kind == "run":
+        result = case_run(scale, repeat)
+    elif kind == "write":
+        output_format, duration = rest.split("/")
+        duration_s = float(duration.rstrip("s")) * scale
+        result = case_write(output_format, duration_s, repeat, tmpdir)
+    else:
+        raise ValueError(f"Unknown benchmark case {name!r}")
+    if "skipped" not in result:
+        result["events_per_second"] = result["events"] / result["seconds"]
+        # ru_maxrss is in kilobytes on Linux and bytes on macOS
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        result["peak_rss_mb"] = maxrss / (2**20 if sys.platform == "darwin" else 2**10)
+    return result
+
+
+def run_in_subprocess(name, scale, repeat, tmpdir):
+    """Run one benchmark case in a fresh interpreter and return its results."""
+    output = subprocess.run(
+        [
+            sys.executable,
+            os.path.abspath(__file__),
+            "--case",
+            name,
+            "--scale",
+            str(scale),
+            "--repeat",
+            str(repeat),
+            "--tmpdir",
+            tmpdir,
+        ],
+        check=True,
+        stdout=subprocess.PIPE,
+        universal_newlines=True,
+    ).stdout
+    return json.loads(output)
+
+
+def compare(results, baseline, tolerance):
+    """Return a list of descriptions of the regressions from the baseline."""
+    regressions = []
+    for name, result in results.items():
+        reference = baseline.get(name)
+        if reference is None or "skipped" in result or "skipped" in reference:
+            continue
+        if result["events_per_second"] < reference["events_per_second"] * (
+            1 - tolerance
+        ):
+            regressions.append(
+                f"{name}: {result['events_per_second']:.3g} events/s, "
+                f"baseline {reference['events_per_second']:.3g}"
+            )
+        for key in ("peak_traced_mb", "peak_rss_mb", "bytes_per_event"):
+            if key in reference and result[key] > reference[key] * (1 + tolerance):
+                regressions.append(
+                    f"{name}: {key} {result[key]:.4g}, baseline {reference[key]:.4g}"
+                )
+    return regressions
+
+
+def missing(results, baseline):
+    """Return the names of the cases that ran but have no baseline."""
+    return [
+        name
+        for name, result in results.items()
+        if "skipped" not in result and name not in baseline
+    ]
+
+
+def describe(name, result):
+    """Return a one-line summary of a case's results."""
+    if "skipped" in result:
+        return f"{name:<26} skipped ({result['skipped']})"
+    line = (
+        f"{name:<26} {result['events_per_second']:>12,.0f} events/s "
+        f"{result['peak_traced_mb']:>9.1f} MB traced "
+        f"{result['peak_rss_mb']:>9.1f} MB RSS"
+    )
+    if "bytes_per_event" in result:
+        line += f" {result['bytes_per_event']:>7.1f} B/event"
+    return line
+
+
+def main(args):
+    """Run the selected benchmark cases and compare them to the baseline."""
+    if args.case is not None:
+        json.dump(run_case(args.case, args.scale, args.repeat, args.tmpdir), sys.stdout)
+        return 0
+    names = [name for name in case_names() if fnmatch.fnmatch(name, args.cases)]
+    results = {}
+    with tempfile.TemporaryDirectory(dir=args.tmpdir) as tmpdir:
+        for name in names:
+            results[name] = run_in_subprocess(name, args.scale, args.repeat, tmpdir)
+            print(describe(name, results[name]), flush=True)
+    report = {
+        "machine": {
+            "platform": platform.platform(),
+            "processor": platform.processor(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+        },
+        "scale": args.scale,
+        "results": results,
+    }
+    if args.output is not None:
+        with open(args.output, "w", encoding="utf-8") as outfile:
+            json.dump(report, outfile, indent=2, sort_keys=True)
+            outfile.write("\n")
+    if args.save:
+        results = {
+            name: result for name, result in results.items() if "skipped" not in result
+        }
+        if os.path.exists(args.baseline):
+            with open(args.baseline, encoding="utf-8") as infile:
+                saved = json.load(infile)
+            if saved["scale"] == args.scale:
+                saved["results"].update(results)
+                results = saved["results"]
+        report["results"] = results
+        with open(args.baseline, "w", encoding="utf-8") as outfile:
+            json.dump(report, outfile, indent=2, sort_keys=True)
+            outfile.write("\n")
+        print(f"Saved the baseline to {args.baseline}")
+        return 0
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; run with --save to create one")
+        return 0
+    with open(args.baseline, encoding="utf-8") as infile:
+        baseline = json.load(infile)
+    if baseline["scale"] != args.scale:
+        print(
+            f"The baseline was measured with --scale {baseline['scale']}, not comparing"
+        )
+        return 0
+    for name in missing(results, baseline["results"]):
+        print("MISSING FROM BASELINE: " + name)
+    regressions = compare(results, baseline["results"], args.tolerance)
+    for regression in regressions:
+        print("REGRESSION: " + regression)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--cases", default="*", help="run only the cases matching this glob pattern"
+    )
+    parser.add_argument(
+        "--scale",
+        type=float,
+        default=1,
+        help="multiply all run lengths by this factor (only comparable to a "
+        "baseline with the same scale)",
+    )
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT)
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=DEFAULT_TOLERANCE,
+        help="allowed fractional slowdown or growth before reporting a regression",
+    )
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument(
+        "--save", action="store_true", help="save the results as the new baseline"
+    )
+    parser.add_argument("--output", help="also write the results to this file")
+    parser.add_argument("--tmpdir", help="directory for the output files")
+    parser.add_argument("--case", help=argparse.SUPPRESS)
+    sys.exit(main(parser.parse_args()))
@@ -1,4 +1,9 @@
-"""A script that uses the toymc package."""
+"""A script that uses the toymc package.
+
+Run it directly (``python example.py out.root -t 86400``), or use it as
+a configuration file for the ``toymc`` command, which calls
+:py:func:`configure` (``toymc run example.py out.root -t 86400``).
+"""
 
 import argparse
 
@@ -6,11 +11,11 @@ from toymc.single import Single
 from toymc.correlated import Correlated
 from toymc.muon import Muon
 from toymc import ToyMC
+from toymc.output import WRITERS
 
 
-def main(outfile, runtime, t0, seed):
-    """Run the ToyMC with the given configuration."""
-    toymc = ToyMC(outfile, runtime, t0, seed=seed)
+def configure(mc):
+    """Add the example event types to the ToyMC object ``mc``."""
     # Single(name, rate_Hz, EH, AD)
     single = Single("Single_event", 20, 1, 1)
     single.truth_label = 0
@@ -30,11 +35,37 @@ def main(outfile, runtime, t0, seed):
     muon.truth_label_WP = 5
     muon.truth_label_AD = 6
     muon.truth_label_shower = 7
-    toymc.add_event_type(single)
-    toymc.add_event_type(ibd_nGd)
-    toymc.add_event_type(ibd_nH)
-    toymc.add_event_type(muon)
-    toymc.run()
+    mc.add_event_type(single)
+    mc.add_event_type(ibd_nGd)
+    mc.add_event_type(ibd_nH)
+    mc.add_event_type(muon)
+
+
+def main(
+    outfile,
+    runtime,
+    t0,
+    seed,
+    *,
+    chunk_seconds=None,
+    output_format="root",
+    workers=None,
+    task_seconds=None,
+    shards=None,
+):
+    """Run the ToyMC with the configuration from :py:func:`configure`."""
+    toymc = ToyMC(
+        outfile,
+        runtime,
+        t0,
+        seed=seed,
+        chunk_seconds=chunk_seconds,
+        output_format=output_format,
+        task_seconds=task_seconds,
+        shards=shards,
+    )
+    configure(toymc)
+    toymc.run(workers)
 
 
 if __name__ == "__main__":
@@ -43,5 +74,34 @@ if __name__ == "__main__":
     parser.add_argument("-t", "--runtime", type=int, help="DAQ runtime in seconds")
     parser.add_argument("--t0", type=int, help="Start time of run in seconds")
     parser.add_argument("-s", "--seed", default=None, type=int, help="random seed")
+    parser.add_argument(
+        "--chunk-seconds",
+        type=float,
+        help="generate and write the run in time windows of this length",
+    )
+    parser.add_argument(
+        "--format", default="root", choices=sorted(WRITERS), help="output backend"
+    )
+    parser.add_argument(
+        "-j", "--workers", type=int, help="number of processes to generate events in"
+    )
+    parser.add_argument(
+        "--task-seconds",
+        type=float,
+        help="split each event type into pieces of this length, for --workers",
+    )
+    parser.add_argument(
+        "--shards", type=int, help="generate the run in this many time shards"
+    )
     args = parser.parse_args()
-    main(args.outfile, args.runtime, args.t0, args.seed)
+    main(
+        args.outfile,
+        args.runtime,
+        args.t0,
+        args.seed,
+        chunk_seconds=args.chunk_seconds,
+        output_format=args.format,
+        workers=args.workers,
+        task_seconds=args.task_seconds,
+        shards=args.shards,
+    )
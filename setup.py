@@ -18,4 +18,15 @@ setup(
     author_email="skohn@lbl.gov",
     packages=find_packages(),
     install_requires=["numpy >= 1.18"],
+    extras_require={
+        "uproot": ["uproot >= 4"],
+        "parquet": ["pyarrow"],
+        "hdf5": ["h5py"],
+    },
+    entry_points={
+        "console_scripts": [
+            "toymc = toymc.cli:main",
+            "toymc-merge = toymc.merge:main",
+        ]
+    },
 )
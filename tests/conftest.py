@@ -0,0 +1,68 @@
+"""Shared fixtures for the toymc tests."""
+
+import pytest
+
+from toymc import ToyMC
+from toymc.batch import EventBatch
+from toymc.correlated import Correlated
+from toymc.muon import Muon
+from toymc.readers import open_reader
+from toymc.single import Single
+
+
+def configure(mc):
+    """Add a small version of the example event types to ``mc``."""
+    single = Single("Single_event", 20, 1, 1)
+    single.truth_label = 0
+    ibd = Correlated("IBD", 1, 1, 0.5, 28000)
+    ibd.truth_label_prompt = 1
+    ibd.truth_label_delayed = 2
+    muon = Muon("Muon", 1, 5)
+    muon.truth_label_WP = 3
+    muon.truth_label_AD = 4
+    muon.truth_label_shower = 5
+    mc.add_event_type(single)
+    mc.add_event_type(ibd)
+    mc.add_event_type(muon)
+
+
+def read_events(path, input_format=None):
+    """Read all of the events in an output file into one batch."""
+    with open_reader(path, input_format) as reader:
+        return EventBatch.concatenate(list(reader))
+
+
+@pytest.fixture
+def generate(tmp_path):
+    """Return a function that runs a ToyMC and returns its events.
+
+    The function takes the event types (or a configure function), the
+    duration, the ``workers`` and ``shard`` for :py:meth:`toymc.ToyMC.run`
+    and any :py:class:`~toymc.ToyMC` options, and writes the run to an
+    NPZ file in a temporary directory.
+    """
+    runs = []
+
+    def run(
+        setup=configure, duration=100, *, seed=1, workers=None, shard=None, **options
+    ):
+        outfile = str(tmp_path / f"run{len(runs)}.npz")
+        runs.append(outfile)
+        mc = ToyMC(
+            outfile,
+            duration,
+            seed=seed,
+            output_format="npz",
+            write_report=False,
+            cache=False,
+            **options,
+        )
+        if callable(setup):
+            setup(mc)
+        else:
+            for event_type in setup:
+                mc.add_event_type(event_type)
+        mc.run(workers, shard)
+        return read_events(outfile)
+
+    return run
@@ -0,0 +1,76 @@
+"""Tests for toymc.batch."""
+
+import numpy as np
+
+import toymc
+from toymc.batch import EVENT_DTYPE, EventBatch, merge_sorted, merge_windows
+
+
+def batch_at(*timestamps, truth_index=0):
+    """Return a batch of events at the given timestamps (in ns)."""
+    return EventBatch.from_columns(
+        len(timestamps), timestamp=timestamps, truth_index=truth_index
+    )
+
+
+def test_from_events_round_trip():
+    # Values that float32 holds exactly, so that the events compare equal
+    quantities = (2.5, 192, 425.0, 1.0, 2.0, 3.0, 0.5, 0.5, 0.25, 0.25, 0.0)
+    events = [
+        toymc.Event(1, 1, 5, 1, 0x10001100, 1, *quantities),
+        toymc.Event(2, 2, 3, 2, 0x10001100, 1, *quantities),
+    ]
+    batch = EventBatch.from_events(events)
+    assert batch.array.dtype == EVENT_DTYPE
+    assert list(batch.events()) == events
+
+
+def test_from_events_empty():
+    assert len(EventBatch.from_events([])) == 0
+
+
+def test_from_energies_matches_event_constants():
+    energies = np.array([1.0, 2.0])
+    positions = np.array([[1.0, 2.0, 3.0], [4.0, 5.0, 6.0]])
+    batch = EventBatch.from_energies(2, energies, positions, truth_index=7)
+    assert batch["nHit"].tolist() == [192, 192]
+    assert batch["charge"].tolist() == [170, 340]
+    assert batch["z"].tolist() == [3, 6]
+    assert batch["truth_index"].tolist() == [7, 7]
+
+
+def test_sorted_is_stable():
+    batch = EventBatch.concatenate(
+        [batch_at(5, 1, truth_index=1), batch_at(1, 5, truth_index=2)]
+    ).sorted()
+    assert batch["timestamp"].tolist() == [1, 1, 5, 5]
+    assert batch["truth_index"].tolist() == [1, 2, 1, 2]
+
+
+def test_split_covers_batch():
+    batch = batch_at(*range(10))
+    chunks = list(batch.split(4))
+    assert [len(chunk) for chunk in chunks] == [4, 4, 2]
+    assert EventBatch.concatenate(chunks)["timestamp"].tolist() == list(range(10))
+
+
+def test_merge_sorted():
+    streams = [
+        [batch_at(1, 4), batch_at(9)],
+        [batch_at(2, 3, 10)],
+        [],
+        [batch_at(4, truth_index=1)],
+    ]
+    merged = EventBatch.concatenate(list(merge_sorted(streams)))
+    assert merged["timestamp"].tolist() == [1, 2, 3, 4, 4, 9, 10]
+    # Ties keep the order of the streams
+    assert merged["truth_index"].tolist() == [0, 0, 0, 0, 1, 0, 0]
+
+
+def test_merge_windows_carries_events_past_window_end():
+    windows = [(0, 1), (1, 1)]
+    # The first window's stream has an event past its end (e.g. a delayed
+    # event), which must come out after the second window's earlier events
+    streams = [[[batch_at(10, 1_500_000_000)]], [[batch_at(1_000_000_000)]]]
+    merged = EventBatch.concatenate(list(merge_windows(windows, iter(streams))))
+    assert merged["timestamp"].tolist() == [10, 1_000_000_000, 1_500_000_000]
@@ -0,0 +1,29 @@
+"""Tests for the dataset cache keys."""
+
+from toymc import ToyMC
+from toymc.dataset_cache import dataset_key
+
+from .conftest import configure
+
+
+def key(seed=1, rate_hz=20, **options):
+    """Return the cache key of a configured run."""
+    mc = ToyMC("out.npz", 100, seed=seed, output_format="npz", **options)
+    configure(mc)
+    mc.event_types[0].rate_hz = rate_hz
+    return dataset_key(mc)
+
+
+def test_identical_runs_share_a_key():
+    assert key() == key()
+
+
+def test_key_changes_with_settings():
+    keys = {key(), key(seed=2), key(rate_hz=21), key(chunk_seconds=10)}
+    assert len(keys) == 4
+
+
+def test_key_ignores_outfile():
+    mc = ToyMC("other.npz", 100, seed=1, output_format="npz")
+    configure(mc)
+    assert dataset_key(mc) == key()
@@ -0,0 +1,215 @@
+"""Tests for the EventType base class and the built-in event types."""
+
+import numpy as np
+import pytest
+
+import toymc
+from toymc.batch import EventBatch
+from toymc.correlated import Correlated
+from toymc.muon import Muon
+from toymc.single import Single
+
+
+class LegacyType(toymc.EventType):
+    """An event type that only implements the original list interface."""
+
+    def __init__(self, name, events_per_second):
+        super().__init__(name)
+        self.events_per_second = events_per_second
+
+    def generate_events(self, rng, duration_s, t0_s):
+        number = self.actual_event_count(rng, duration_s, self.events_per_second)
+        timestamps = rng.integers(
+            int(1e9 * t0_s), int(1e9 * (t0_s + duration_s)), number
+        )
+        return [
+            toymc.Event(9, 1, int(t), 1, 0, 1, 42.0, 7, 0, 0, 0, 0, 0, 0, 0, 0, 0)
+            for t in timestamps
+        ]
+
+    def labels(self):
+        return {9: self.name}
+
+
+class BatchType(toymc.EventType):
+    """An event type that only implements generate_batch."""
+
+    def generate_batch(self, rng, duration_s, t0_s, count=None):
+        return EventBatch.from_columns(3, truth_index=8, timestamp=[3, 1, 2])
+
+    def labels(self):
+        return {8: self.name}
+
+
+class NoEvents(toymc.EventType):
+    """An event type that implements neither interface."""
+
+    def labels(self):
+        return {}
+
+
+def test_legacy_generate_batch_wraps_generate_events():
+    legacy = LegacyType("legacy", 10)
+    events = legacy.generate_events(np.random.default_rng(1), 2, 5)
+    batch = legacy.generate_batch(np.random.default_rng(1), 2, 5)
+    assert list(batch.events()) == events
+
+
+def test_legacy_generate_stream_is_sorted():
+    legacy = LegacyType("legacy", 10)
+    stream = legacy.generate_stream(np.random.default_rng(1), 2, 0)
+    timestamps = EventBatch.concatenate(list(stream))["timestamp"]
+    assert len(timestamps) == 20
+    assert np.all(np.diff(timestamps) >= 0)
+
+
+def test_legacy_count_not_supported():
+    with pytest.raises(ValueError):
+        LegacyType("legacy", 10).generate_batch(np.random.default_rng(1), 2, 0, 5)
+
+
+def test_generate_events_wraps_generate_batch():
+    events = BatchType("batch").generate_events(np.random.default_rng(1), 1, 0)
+    assert [event.timestamp for event in events] == [3, 1, 2]
+
+
+def test_neither_interface_raises():
+    rng = np.random.default_rng(1)
+    with pytest.raises(NotImplementedError):
+        NoEvents("none").generate_batch(rng, 1, 0)
+    with pytest.raises(NotImplementedError):
+        NoEvents("none").generate_events(rng, 1, 0)
+
+
+def test_legacy_type_in_run(generate):
+    events = generate([LegacyType("legacy", 10)], duration=5)
+    assert len(events) == 50
+    assert set(events["energy"].tolist()) == {42.0}
+
+
+def energies(event_type, duration=10):
+    """Return the energies of the events that an event type generates."""
+    stream = event_type.generate_stream(np.random.default_rng(1), duration, 0)
+    return EventBatch.concatenate(list(stream))["energy"]
+
+
+class SingleEvents(Single):
+    """Overrides generate_events."""
+
+    def generate_events(self, rng, duration_s, t0_s):
+        return [
+            event._replace(energy=42.0)
+            for event in super().generate_events(rng, duration_s, t0_s)
+        ]
+
+
+class SingleNewEvent(Single):
+    """Overrides new_event."""
+
+    def new_event(self, rng, timestamp):
+        return super().new_event(rng, timestamp)._replace(energy=42.0)
+
+
+class SinglePhysics(Single):
+    """Overrides physical_quantities."""
+
+    def physical_quantities(self, rng):
+        return (42.0,) + super().physical_quantities(rng)[1:]
+
+
+@pytest.mark.parametrize("cls", [SingleEvents, SingleNewEvent, SinglePhysics])
+def test_single_overrides_are_used(cls, generate):
+    single = cls("single", 10, 1, 1)
+    single.truth_label = 0
+    assert set(energies(single).tolist()) == {42.0}
+    assert set(generate([single], duration=10)["energy"].tolist()) == {42.0}
+
+
+def test_plain_single_uses_arrays():
+    single = Single("single", 10, 1, 1)
+    single.truth_label = 0
+    assert not single.overrides(Single, Single.EVENT_METHODS)
+    assert len(set(energies(single).tolist())) == 100
+
+
+class CorrelatedEvents(Correlated):
+    """Overrides generate_events."""
+
+    def generate_events(self, rng, duration_s, t0_s):
+        events = super().generate_events(rng, duration_s, t0_s)
+        return [event._replace(energy=42.0) for event in events]
+
+
+class CorrelatedPrompt(Correlated):
+    """Overrides new_prompt_event."""
+
+    def new_prompt_event(self, rng, timestamp):
+        return super().new_prompt_event(rng, timestamp)._replace(energy=42.0)
+
+
+class CorrelatedDelayed(Correlated):
+    """Overrides new_delayed_event."""
+
+    def new_delayed_event(self, rng, timestamp, prompt_position):
+        event = super().new_delayed_event(rng, timestamp, prompt_position)
+        return event._replace(energy=42.0)
+
+
+class CorrelatedPromptPhysics(Correlated):
+    """Overrides prompt_physical_quantities."""
+
+    def prompt_physical_quantities(self, rng):
+        return (42.0,) + super().prompt_physical_quantities(rng)[1:]
+
+
+class CorrelatedDelayedPhysics(Correlated):
+    """Overrides delayed_physical_quantities."""
+
+    def delayed_physical_quantities(self, rng, prompt_position):
+        quantities = super().delayed_physical_quantities(rng, prompt_position)
+        return (42.0,) + quantities[1:]
+
+
+@pytest.mark.parametrize(
+    "cls",
+    [
+        CorrelatedEvents,
+        CorrelatedPrompt,
+        CorrelatedDelayed,
+        CorrelatedPromptPhysics,
+        CorrelatedDelayedPhysics,
+    ],
+)
+def test_correlated_overrides_are_used(cls, generate):
+    ibd = cls("ibd", 1, 1, 5, 28000)
+    ibd.truth_label_prompt = 1
+    ibd.truth_label_delayed = 2
+    assert 42.0 in energies(ibd).tolist()
+    events = generate([ibd], duration=10)
+    assert len(events) == 100
+    assert 42.0 in events["energy"].tolist()
+
+
+def muon_events(name, method):
+    """Return a Muon subclass whose ``method`` sets each energy to 42."""
+
+    def override(self, rng, *args):
+        result = getattr(Muon, method)(self, rng, *args)
+        if method == "generate_events":
+            return [event._replace(energy=42.0) for event in result]
+        if method.endswith("_event"):
+            return result._replace(energy=42.0)
+        return (42.0,) + result[1:]
+
+    return type(name, (Muon,), {method: override})
+
+
+@pytest.mark.parametrize("method", Muon.EVENT_METHODS)
+def test_muon_overrides_are_used(method, generate):
+    muon = muon_events("CustomMuon", method)("muon", 1, 50)
+    muon.truth_label_WP = 3
+    muon.truth_label_AD = 4
+    muon.truth_label_shower = 5
+    muon.prob_WP_and_shower = 0.1
+    assert 42.0 in energies(muon).tolist()
+    assert 42.0 in generate([muon], duration=10)["energy"].tolist()
@@ -0,0 +1,36 @@
+"""Tests for the Hall event type."""
+
+import numpy as np
+
+from toymc.hall import Hall
+
+from .test_event_types import SingleNewEvent
+
+
+def make_hall():
+    """Return a hall with two ADs, one correlated process and muons."""
+    hall = Hall("EH1", 1, singles_Hz={1: 20, 2: 10}, muon_rate_Hz=5)
+    hall.add_correlated("IBD", 28000, {1: 0.5, 2: 0.5})
+    hall.assign_labels(0)
+    return hall
+
+
+def test_hall_counts(generate):
+    hall = make_hall()
+    events = generate([hall], duration=100)
+    counts = np.bincount(events["truth_index"])
+    assert counts[0] == 2000
+    assert counts[1] == 1000
+    assert np.all(np.diff(events["timestamp"]) >= 0)
+
+
+def test_hall_uses_single_overrides(generate):
+    hall = make_hall()
+    custom = SingleNewEvent("EH1_AD2_single", 10, 1, 2)
+    custom.truth_label = hall.singles[2].truth_label
+    hall.singles[2] = custom
+    events = generate([hall], duration=100)
+    energies = events["energy"][events["truth_index"] == custom.truth_label]
+    assert len(energies) == 1000
+    assert set(energies.tolist()) == {42.0}
+    assert len(events[events["truth_index"] == 0]) == 2000
@@ -0,0 +1,66 @@
+"""Round trips through the output backends and their readers."""
+
+import importlib.util
+
+import numpy as np
+import pytest
+
+from toymc import ToyMC
+from toymc.batch import EventBatch
+from toymc.output import make_writer
+from toymc.readers import open_reader
+
+from .conftest import read_events
+
+BACKENDS = {
+    "uproot": ("uproot", ".root"),
+    "parquet": ("pyarrow", ".parquet"),
+    "hdf5": ("h5py", ".h5"),
+    "npz": ("numpy", ".npz"),
+}
+
+
+def sample_batch(size=1000):
+    """Return a time-ordered batch with varied values in every column."""
+    rng = np.random.default_rng(1)
+    return EventBatch.from_energies(
+        size,
+        rng.uniform(1, 10, size),
+        rng.uniform(-2000, 2000, (size, 3)),
+        truth_index=rng.integers(0, 3, size),
+        timestamp=np.sort(rng.integers(0, 10**12, size)),
+        detector=rng.integers(1, 5, size),
+        trigger_type=0x10001100,
+        site=1,
+    )
+
+
+@pytest.mark.parametrize("output_format", sorted(BACKENDS))
+def test_round_trip(tmp_path, output_format):
+    module, extension = BACKENDS[output_format]
+    if importlib.util.find_spec(module) is None:
+        pytest.skip(f"{module} is not installed")
+    outfile = str(tmp_path / f"events{extension}")
+    batch = sample_batch()
+    labels = {0: "zero", 1: "one", 2: "two"}
+    writer = make_writer(output_format, outfile, "AdSimpleNL", "CalibStats")
+    writer.begin(labels)
+    for chunk in batch.split(300):
+        writer.add_batch(chunk)
+    writer.close()
+    assert np.array_equal(read_events(outfile).array, batch.array)
+    with open_reader(outfile) as reader:
+        assert reader.labels == labels
+
+
+@pytest.mark.parametrize("output_format", sorted(BACKENDS))
+def test_empty_run(tmp_path, output_format):
+    module, extension = BACKENDS[output_format]
+    if importlib.util.find_spec(module) is None:
+        pytest.skip(f"{module} is not installed")
+    outfile = str(tmp_path / f"empty{extension}")
+    mc = ToyMC(outfile, 10, seed=1, output_format=output_format, write_report=False)
+    assert mc.run()["events"] == 0
+    with open_reader(outfile) as reader:
+        assert reader.labels == {}
+        assert not list(reader)
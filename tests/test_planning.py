@@ -0,0 +1,23 @@
+"""Tests for the dry-run planner."""
+
+from toymc import ToyMC
+from toymc.planning import predict_counts
+
+from .conftest import configure
+
+
+def test_predicted_counts():
+    mc = ToyMC("out.npz", 1000, seed=1, output_format="npz")
+    configure(mc)
+    single, ibd, muon = predict_counts(mc.event_types, 1000)
+    assert single == {0: 20000}
+    assert ibd == {1: 500, 2: 500}
+    assert muon[3] == 5000
+
+
+def test_plan_matches_run(generate):
+    mc = ToyMC("out.npz", 100, seed=1, output_format="npz")
+    configure(mc)
+    plan = mc.plan(calibration_events=1000)
+    events = generate(duration=100)
+    assert plan["events"] == len(events)
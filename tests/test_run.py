@@ -0,0 +1,91 @@
+"""Tests for generating whole runs with toymc.ToyMC."""
+
+import numpy as np
+
+from toymc import ToyMC
+from toymc.merge import merge_files
+
+from .conftest import configure, read_events
+from .test_event_types import LegacyType, SingleNewEvent
+
+
+def test_run_is_time_ordered(generate):
+    events = generate()
+    assert len(events) > 0
+    assert np.all(np.diff(events["timestamp"]) >= 0)
+
+
+def test_same_seed_same_events(generate):
+    assert np.array_equal(generate(seed=3).array, generate(seed=3).array)
+    assert not np.array_equal(generate(seed=3).array, generate(seed=4).array)
+
+
+def test_workers_do_not_change_events(generate):
+    serial = generate(chunk_seconds=10, task_seconds=5)
+    parallel = generate(chunk_seconds=10, task_seconds=5, workers=2)
+    assert np.array_equal(serial.array, parallel.array)
+
+
+def test_chunked_run_keeps_all_events(generate):
+    one_shot = generate(duration=200)
+    chunked = generate(duration=200, chunk_seconds=7)
+    counts = np.bincount(one_shot["truth_index"], minlength=6)
+    chunked_counts = np.bincount(chunked["truth_index"], minlength=6)
+    # The counts are drawn for the whole run either way; only the
+    # singles, which are not rounded, are exactly the same
+    assert chunked_counts[0] == counts[0] == 20 * 200
+    assert np.array_equal(chunked_counts[1:], counts[1:])
+
+
+def test_merged_shards_match_sharded_run(tmp_path):
+    def shard_run(outfile, shard=None):
+        mc = ToyMC(
+            str(outfile),
+            90,
+            seed=5,
+            shards=3,
+            chunk_seconds=20,
+            output_format="npz",
+            write_report=False,
+            cache=False,
+        )
+        configure(mc)
+        mc.run(shard=shard)
+        return str(outfile)
+
+    whole = read_events(shard_run(tmp_path / "whole.npz"))
+    parts = [shard_run(tmp_path / f"part{i}.npz", i) for i in range(3)]
+    merged = tmp_path / "merged.npz"
+    merge_files(parts, str(merged))
+    assert np.array_equal(read_events(str(merged)).array, whole.array)
+
+
+def test_chunked_legacy_type_matches_one_shot(generate):
+    legacy = LegacyType("legacy", 0.007)
+    one_shot = generate([legacy], duration=86400)
+    assert len(one_shot) == 604
+    for options in (
+        {"chunk_seconds": 60},
+        {"task_seconds": 3600},
+        {"chunk_seconds": 600, "task_seconds": 60, "workers": 2},
+        {"chunk_seconds": 600, "shards": 4},
+    ):
+        chunked = generate([legacy], duration=86400, **options)
+        assert np.array_equal(chunked.array, one_shot.array), options
+
+
+def test_chunked_single_subclass_matches_one_shot(generate):
+    def setup(mc):
+        single = SingleNewEvent("single", 0.5, 1, 1)
+        single.truth_label = 0
+        mc.add_event_type(single)
+        configure(mc)
+        mc.event_types[1].truth_label = 6
+
+    one_shot = generate(setup, duration=101)
+    chunked = generate(setup, duration=101, chunk_seconds=10)
+    assert np.sum(one_shot["truth_index"] == 0) == 50
+    assert np.array_equal(
+        chunked[chunked["truth_index"] == 0].array,
+        one_shot[one_shot["truth_index"] == 0].array,
+    )
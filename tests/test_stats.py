@@ -0,0 +1,44 @@
+"""Tests for the run report."""
+
+import sys
+
+import numpy as np
+
+from toymc import ToyMC, progress, stats
+
+from .conftest import configure
+
+
+def run_report(outfile, duration):
+    """Run the test configuration and return its report."""
+    mc = ToyMC(str(outfile), duration, seed=1, output_format="npz", cache=False)
+    configure(mc)
+    return mc.run()
+
+
+def test_report_counts(generate, tmp_path):
+    report = run_report(tmp_path / "out.npz", 50)
+    events = generate(duration=50)
+    assert report["events"] == len(events)
+    assert report["subtypes"]["Single_event"] == np.sum(events["truth_index"] == 0)
+    assert report["event_types"]["Single_event"]["counters"]["events"] == 1000
+
+
+def test_without_resource_module(monkeypatch, tmp_path):
+    # Importing a module that is None in sys.modules raises ImportError,
+    # as importing resource does on Windows
+    monkeypatch.setitem(sys.modules, "resource", None)
+    monkeypatch.setattr(progress, "current_rss_mb", stats.peak_rss_mb)
+    assert stats.peak_rss_mb() is None
+    assert stats.children_cpu_s() is None
+    report = run_report(tmp_path / "out.npz", 10)
+    assert report["events"] > 0
+    assert report["peak_rss_mb"] is None
+    assert report["workers_cpu_s"] is None
+    updates = []
+    mc = ToyMC(str(tmp_path / "hooks.npz"), 10, seed=1, output_format="npz")
+    configure(mc)
+    mc.add_progress_hook(updates.append, 0)
+    mc.run()
+    assert updates[-1].rss_mb is None
+    assert "RSS ? MB" in progress.ProgressReporter(None).format(updates[-1])
@@ -0,0 +1,33 @@
+"""Tests for the spectrum helpers in toymc.util."""
+
+import numpy as np
+import pytest
+
+from toymc import util
+
+
+class Histogram:
+    """A stand-in for an uproot histogram."""
+
+    def __init__(self, counts, edges):
+        self.counts = np.asarray(counts, dtype=float)
+        self.edges = np.asarray(edges, dtype=float)
+
+    def to_numpy(self):
+        return self.counts, self.edges
+
+
+@pytest.mark.parametrize("offset", [0, -0.5])
+def test_rng_th1_discrete_gives_bin_integers(offset):
+    edges = np.arange(15, 21) + offset
+    spectrum = util.rng_th1(Histogram([1, 0, 2, 0, 1], edges), True, cache=False)
+    values = spectrum(np.random.default_rng(1), 1000)
+    assert values.dtype.kind == "i"
+    assert set(values.tolist()) == {15, 17, 19}
+
+
+def test_rng_th1_continuous_stays_in_bins():
+    spectrum = util.rng_th1(Histogram([1, 0, 1], [0, 1, 2, 3]), cache=False)
+    values = spectrum(np.random.default_rng(1), 1000)
+    assert np.all((values < 1) | (values >= 2))
+    assert values.min() >= 0 and values.max() < 3
@@ -12,8 +12,8 @@ The steps for generating this data stream are relatively simple:
     4. For correlated event chains, generate the time delay for delayed
        events and repeat steps 3 and 4 until all desired events have been
        generated.
-    5. Aggregate all events into a list, sort by timestamp, and save
-       to a file.
+    5. Sort the events from each event type by timestamp, merge the
+       sorted streams from all event types, and save them to a file.
 
 Physically-correlated events (e.g. prompt-delayed or WPMuon-ADMuon) are
 treated as a single event type. Their occurrence is determined by the
@@ -32,7 +32,8 @@ event's position. This treatment is sufficient to handle the variety of
 correlations that appear in the Daya Bay data stream.
 
 Because Daya Bay data files use the ROOT format, this Toy Monte Carlo
-only outputs ROOT files.
+outputs ROOT files. They can be written either with PyROOT or, if ROOT
+is not installed, with uproot. See :py:mod:`toymc.output`.
 
 Running the Toy Monte Carlo
 ---------------------------
@@ -62,6 +63,31 @@ Lastly, run the Toy Monte Carlo by calling the :py:meth:`ToyMC.run`
 method. The output file is automatically saved and closed at the end of
 execution.
 
+For long runs, pass ``chunk_seconds`` to the :py:class:`ToyMC`
+constructor to generate and write the run one time window at a time.
+Memory usage then depends on the window length instead of the run
+duration, and the output has the same distribution as a run generated
+all at once.
+
+To use several CPU cores, pass ``workers`` to :py:meth:`ToyMC.run`. The
+event types (and, with ``task_seconds``, pieces of the run for each
+event type) are then generated in separate processes, with results that
+depend only on the seed. For very long runs, also pass ``shards`` to the
+constructor to generate consecutive spans of time in separate processes
+instead.
+
+:py:meth:`ToyMC.run` returns a report of the time spent generating,
+sorting, merging and writing events, the number of events of each
+subtype, and the peak memory use, and also writes it as JSON next to the
+output file. See :py:mod:`toymc.stats`. To follow the progress of a long run, add a
+progress hook with :py:meth:`ToyMC.add_progress_hook`, e.g. the progress
+bar and status file of :py:class:`toymc.progress.ProgressReporter`.
+
+When the same run (same configuration, seed and duration) is generated
+over and over, e.g. in tests, pass ``cache=True`` to the
+:py:class:`ToyMC` constructor to reuse the output file of an earlier
+identical run from a local cache. See :py:mod:`toymc.dataset_cache`.
+
 For a simple working example with all the different event types, see
 example.py in the dyb-toymc repository.
 
@@ -171,8 +197,9 @@ fancy way, and return the desired value.
 
 .. warning::
    do *not* create your own random generator instance via NumPy or the
-   Python random module. The ToyMC library creates a single internal RNG
-   that is used for all random number generation.
+   Python random module. The ToyMC library derives the RNG of each part
+   of the run from the seed (see :py:mod:`toymc.parallel`) and passes it
+   to your function, so that the output depends only on the seed.
 
 To customize the behavior (again, for an example, the energy spectrum),
 simply define your own function that takes ``rng`` as a parameter and
@@ -188,12 +215,34 @@ on hydrogen (nH)::
 Now each time the Toy Monte Carlo needs a value for an nH delayed
 energy, it will run the function ``nH_delayed_spectrum`` and supply the
 RNG. The returned value in this case is simply chosen uniformly at
-random, but it could be quite complicated, e.g. weighted by a histogram.
+random, but it could be quite complicated, e.g. weighted by a histogram
+(see :py:func:`toymc.util.rng_histogram` and :py:func:`toymc.util.rng_th1`).
 
 The documentation for each built-in class specifies the available
 attributes that can be customized. A small number of helper methods are
 available in the :py:mod:`toymc.util` module.
 
+Generating many values at once
+^^^^^^^^^^^^^^^^^^^^^^^^^^^^^^
+
+Calling a Python function once per event is slow when there are
+millions of events. So there is a second, opt-in contract for these
+functions: ``func(rng, size)`` returns a NumPy array of ``size`` values
+(or an ``(size, 3)`` array for positions). To declare that your function
+follows it, decorate it with :py:func:`toymc.util.vectorized`::
+
+    >>> @toymc.util.vectorized
+    >>> def nH_delayed_spectrum(rng, size=None):
+    >>>     return rng.uniform(1.9, 2.3, size)
+
+Giving ``size`` a default of ``None`` (and returning a single value in
+that case) means the function still works anywhere the original
+contract is expected. The built-in event types call vectorized
+functions once per batch of events. Functions that are not decorated
+are detected and wrapped by :py:func:`toymc.util.as_batch`, which calls
+them once per event, so existing configurations keep working without
+changes. All of the default functions are vectorized.
+
 Creating new event types
 ------------------------
 
@@ -213,15 +262,43 @@ also immutable, so you cannot change values from an existing Event
 object. You shouldn't have to, though, if you follow the pattern for
 generating events from the built-in event types. See the :py:class:`API
 documentation for Event <toymc.Event>` for more details.
+
+Internally, the Toy MC passes events around in columnar
+:py:class:`EventBatch` objects, which store every
+:py:class:`~toymc.Event` field as a NumPy array. The list returned by
+``generate_events`` is converted automatically by the default
+implementation of :py:meth:`EventType.generate_batch`. If you have many
+events to generate, you can instead override ``generate_batch`` and
+build the batch directly from arrays using
+:py:meth:`EventBatch.from_columns`, which avoids creating a Python
+object for every event.
+
+The built-in event types build their batches from arrays in this way.
+If you subclass one of them and override ``generate_events`` or one of
+the methods it uses to make each event (e.g.
+:py:meth:`Single.new_event <toymc.single.Single.new_event>`), the
+events are generated with your methods instead, one at a time.
 """
+
 import argparse
+import contextlib
+import json
+import os
+import time
 from collections import namedtuple
-from operator import attrgetter
 from abc import ABC, abstractmethod
-from numpy.random import default_rng
+from numpy.random import SeedSequence
 import numpy as np
 
-import root_util
+from toymc.batch import (
+    CHUNK_SIZE,
+    EVENT_DTYPE,
+    EventBatch,
+    merge_sorted,
+    merge_windows,
+)
+from toymc.output import MCOutput, collect_labels, make_writer
+from toymc import parallel, progress, stats
 
 
 class ToyMC:
@@ -233,7 +310,7 @@ class ToyMC:
     Parameters
     ----------
     outfile : str
-        The file name/location for the output ROOT file
+        The file name/location for the output file
     duration : number
         The duration of data taking to generate data for, **in seconds**
     t0 : integer
@@ -251,6 +328,44 @@ class ToyMC:
         The seed to use for the random number generator. If ``None`` or
         not specified, the random number generator will use a seed
         generated by the system.
+    chunk_seconds : number
+        If given, generate and write the run one time window of this
+        length (**in seconds**) at a time, so that memory usage depends
+        on the window length rather than the run duration. See
+        :py:meth:`ToyMC.generate`. Default: ``None`` (generate the whole
+        run at once).
+    output_format : str
+        The output backend to use, from :py:data:`toymc.output.WRITERS`.
+        Default: ``"root"`` (PyROOT).
+    task_seconds : number
+        Also divide the run into pieces of at most this length (**in
+        seconds**) for each event type, so that a single high-rate event
+        type can be spread over several processes (see
+        :py:meth:`ToyMC.run`). The pieces are used with or without
+        worker processes, so the output depends on this value but not
+        on the number of workers. Default: ``None`` (one piece per event
+        type and time window).
+    shards : int
+        Divide the run into this many consecutive time shards of equal
+        length, each generated in its own process and written to a
+        temporary file next to ``outfile``. The files are then combined
+        in time order into the output. See :py:meth:`ToyMC.run`.
+        Default: ``None`` (no sharding).
+    write_report : bool
+        Whether :py:meth:`ToyMC.run` writes its report (see
+        :py:mod:`toymc.stats`) as JSON to ``outfile + ".report.json"``.
+        Default: ``True``.
+    profile_callbacks : bool
+        Whether to time every generator function attribute of every
+        event type during :py:meth:`ToyMC.run`, and print a table of
+        them ranked by time at the end of the run. See
+        :py:mod:`toymc.profiling`. Default: ``False``.
+    cache : bool or :py:class:`toymc.dataset_cache.DatasetCache`
+        Whether :py:meth:`ToyMC.run` reuses the output of an identical
+        earlier run from the dataset cache, or the cache to use. See
+        :py:mod:`toymc.dataset_cache`. Runs without a ``seed`` are never
+        cached. Default: ``None`` (use the default cache if the
+        ``TOYMC_DATASET_CACHE`` environment variable is ``1``).
     """
 
     def __init__(
@@ -261,316 +376,356 @@ class ToyMC:
         reco_name="AdSimpleNL",
         calib_name="CalibStats",
         seed=None,
+        *,
+        chunk_seconds=None,
+        output_format="root",
+        task_seconds=None,
+        shards=None,
+        write_report=True,
+        profile_callbacks=False,
+        cache=None,
     ):
-        from ROOT import TFile  # pylint: disable=no-name-in-module
-
-        self.outfile = TFile(outfile, "RECREATE")
+        self.outfile = outfile
+        self.output_format = output_format
+        self.writer = None
         self.event_types = []
         self.duration = duration
         self.t0 = t0
-        self.rng = default_rng(seed)
+        self.seed = SeedSequence(seed).entropy
         self.reco_name = reco_name
         self.calib_name = calib_name
+        self.chunk_seconds = chunk_seconds
+        self.task_seconds = task_seconds
+        self.shards = shards
+        self.write_report = write_report
+        self.profile_callbacks = profile_callbacks
+        self.cache = False if seed is None else cache
+        self.progress_hooks = []
 
     def add_event_type(self, event_type):
         """Add the specified event type to the ToyMC."""
         self.event_types.append(event_type)
 
-    def run(self):
-        """Run the ToyMC and save the output."""
-        output = MCOutput(
-            self.outfile, self.reco_name, self.calib_name, self.event_types,
-        )
-        events = []
-        for event_type in self.event_types:
-            new_events = event_type.generate_events(self.rng, self.duration,
-                    self.t0)
-            events.extend(new_events)
-        events.sort(key=attrgetter("timestamp"))
-        for event in events:
-            output.add(event)
-        self.finalize()
-
-    def finalize(self):
-        """Safely save and close out all ToyMC resources."""
-        self.outfile.Write()
-        self.outfile.Close()
+    def add_progress_hook(self, hook, interval_s=1.0):
+        """Call ``hook`` with the progress of the run while it runs.
 
-
-class MCOutput:
-    """The ToyMC output data structure (internal class).
-
-    This class is used internally to prepare and fill the output ROOT
-    TTrees.
-
-    The required ``event_types`` parameter is necessary to generate the
-    MC Truth lookup TTree.
-
-    Parameters
-    ----------
-    container : ROOT.TFile
-        The ``TFile`` that will host the ToyMC output data structures
-    reco_name : str
-        The name of the reconstructed data TTree
-    calib_name : str
-        The name of the calibrated statistics TTree
-    event_types : list of :py:class:`EventType`
-        The list of EventType objects to add to the lookup table
-    """
-
-    def __init__(self, container, reco_name, calib_name, event_types):
-        from ROOT import TTree  # pylint: disable=no-name-in-module
-
-        self.container = container
-        self.container.cd()
-        self.reco_ttree, self.reco_buf = self.prep_reco(
-            TTree, self.container, reco_name
-        )
-        self.calib_ttree, self.calib_buf = self.prep_calib(
-            TTree, self.container, calib_name
-        )
-        self.truth_ttree, self.truth_buf = self.prep_truth(TTree, self.container)
-        self.truth_lookup_ttree, _ = self.prep_truth_lookup(
-            TTree, self.container, event_types
-        )
-
-    def add(self, event):
-        """Add the given event to the output data structure.
+        See :py:mod:`toymc.progress`.
 
         Parameters
         ----------
-        event : :py:class:`Event`
-            The event to fill into the ToyMC output
+        hook : function of :py:class:`toymc.progress.Progress`
+            The function to call, e.g. a
+            :py:class:`~toymc.progress.ProgressReporter`
+        interval_s : number, optional
+            The minimum wall time between calls, **in seconds**.
+            Default: 1.
         """
-        rb = self.reco_buf
-        cb = self.calib_buf
-        assign_value = root_util.assign_value
-        assign_value(cb.triggerNumber, event.trigger_number)
-        assign_value(cb.detector, event.detector)
-        timestamp_seconds = event.timestamp // 1000000000
-        timestamp_nanoseconds = event.timestamp % 1000000000
-        assign_value(cb.timestamp_seconds, timestamp_seconds)
-        assign_value(cb.timestamp_nanoseconds, timestamp_nanoseconds)
-        assign_value(cb.nHit, event.nHit)
-        assign_value(cb.charge, event.charge)
-        assign_value(cb.fQuad, event.fQuad)
-        assign_value(cb.fMax, event.fMax)
-        assign_value(cb.fPSD_t1, event.fPSD_t1)
-        assign_value(cb.fPSD_t2, event.fPSD_t2)
-        assign_value(cb.f2inch_maxQ, event.f2inch_maxQ)
-
-        assign_value(rb.triggerType, event.trigger_type)
-        assign_value(rb.site, event.site)
-        assign_value(rb.energy, event.energy)
-        assign_value(rb.x, event.x)
-        assign_value(rb.y, event.y)
-        assign_value(rb.z, event.z)
-
-        assign_value(self.truth_buf.truth_index, event.truth_index)
-
-        self.reco_ttree.Fill()
-        self.calib_ttree.Fill()
-        self.truth_ttree.Fill()
+        self.progress_hooks.append((hook, interval_s))
 
-    @staticmethod
-    def prep_calib(TTree, host_file, name):
-        """Create the "calib" (~CalibStats) TTree and fill buffer.
+    def plan(self, workers=None, memory_budget_mb=None, calibration_events=None):
+        """Predict the size and cost of the run without running it.
+
+        The events per subtype, the output file size for each backend,
+        and the peak memory and runtime (calibrated on this machine with
+        a short sample of each event type) are predicted as described in
+        :py:mod:`toymc.planning`. No output file is created, and the
+        random numbers of the run are not affected.
 
         Parameters
         ----------
-        host_file : ROOT.TFile
-            The TFile that will hold the calib TTree
-        name : str
-            The name of this TTree
+        workers : int, optional
+            The number of workers to estimate the memory and runtime
+            for, as for :py:meth:`ToyMC.run`
+        memory_budget_mb : number, optional
+            If given, also recommend a ``chunk_seconds`` and number of
+            workers for which the run fits in this much memory, in MiB
+        calibration_events : int, optional
+            The number of events to generate of each event type to
+            calibrate. Default:
+            :py:data:`toymc.planning.CALIBRATION_EVENTS`.
 
         Returns
         -------
-        (calib_ttree, buffer) : tuple
-            The TTree object and the buffer used to fill its TBranches
+        dict
+            The plan, which :py:func:`toymc.planning.format_plan` formats
+            as text
         """
-        buf = root_util.TreeBuffer()
-        buf.triggerNumber = root_util.int_value()
-        buf.detector = root_util.int_value()
-        buf.timestamp_seconds = root_util.int_value()
-        buf.timestamp_nanoseconds = root_util.int_value()
-        buf.nHit = root_util.int_value()
-        buf.charge = root_util.float_value()
-        buf.fQuad = root_util.float_value()
-        buf.fMax = root_util.float_value()
-        buf.fPSD_t1 = root_util.float_value()
-        buf.fPSD_t2 = root_util.float_value()
-        buf.f2inch_maxQ = root_util.float_value()
-
-        host_file.cd()
-        event_subdir = host_file.Get("Event")
-        if not bool(event_subdir):
-            event_subdir = host_file.mkdir("Event")
-        event_subdir.cd()
-        data_subdir = event_subdir.Get("Data")
-        if not bool(data_subdir):
-            data_subdir = event_subdir.mkdir("Data")
-        data_subdir.cd()
-        long_name = "Tree at /Event/Data/{name} holding Data_{name}".format(name=name)
-        calib = TTree(name, long_name)
-        calib.Branch("triggerNumber", buf.triggerNumber, "triggerNumber/I")
-        calib.Branch(
-            "context.mTimeStamp.mSec",
-            buf.timestamp_seconds,
-            "context.mTimeStamp.mSec/I",
-        )
-        calib.Branch(
-            "context.mTimeStamp.mNanoSec",
-            buf.timestamp_nanoseconds,
-            "context.mTimeStamp.mNanoSec/I",
-        )
-        calib.Branch("context.mDetId", buf.detector, "context.mDetId/I")
-        calib.Branch("nHit", buf.nHit, "nHit/I")
-        calib.Branch("NominalCharge", buf.charge, "NominalCharge/F")
-        calib.Branch("Quadrant", buf.fQuad, "Quadrant/F")
-        calib.Branch("MaxQ", buf.fMax, "MaxQ/F")
-        calib.Branch("time_PSD", buf.fPSD_t1, "time_PSD/F")
-        calib.Branch("time_PSD1", buf.fPSD_t2, "time_PSD1/F")
-        calib.Branch("MaxQ_2inchPMT", buf.f2inch_maxQ, "MaxQ_2inchPMT/F")
-        return calib, buf
+        from toymc import planning  # pylint: disable=import-outside-toplevel
 
-    @staticmethod
-    def prep_reco(TTree, host_file, name):
-        """Create the "reco" (~AdSimple) TTree and fill buffer.
+        return planning.plan_run(self, workers, memory_budget_mb, calibration_events)
+
+    def run(self, workers=None, shard=None, writer=None):
+        """Run the ToyMC and save the output.
+
+        The output file is created when this method is called, not when
+        the :py:class:`ToyMC` object is constructed. If generating or
+        writing the events fails, the incomplete output file is removed
+        (see :py:meth:`toymc.output.Writer.abort`).
 
         Parameters
         ----------
-        host_file : ROOT.TFile
-            The TFile that will hold the reco TTree
-        name : str
-            The name of this TTree
+        workers : int, optional
+            The number of processes to generate events in. If given, the
+            run is divided into tasks (one per event type and time
+            window, or per piece of ``task_seconds``) and each task gets
+            its own random number stream spawned from the seed, so the
+            output for a given seed is identical for any number of
+            workers. The default of ``None`` runs the same tasks one
+            window at a time in this process, without starting any
+            worker processes, and gives the same output. See
+            :py:mod:`toymc.parallel`.
+
+            If ``shards`` was given, each worker generates whole shards
+            (and the default is 1 worker). The output then depends on
+            the number of shards, but not on the number of workers.
+        shard : int, optional
+            If given, generate only the shard with this (0-based) index
+            out of the ``shards`` shards of the run, e.g. as one job of
+            a job array. The events, seeds and counts are exactly those
+            of the shard in a full sharded run, so each shard can be
+            generated (or regenerated) independently. Events generated
+            in the shard that land past its end (e.g. delayed events
+            near the end) are included in the shard's output, so the
+            shard outputs overlap slightly in time and must be merged
+            (e.g. with :py:mod:`toymc.merge`), not just concatenated, to
+            get a time-ordered stream.
+        writer : :py:class:`toymc.output.Writer`, optional
+            Write the events with this writer instead of creating one
+            for ``outfile`` and ``output_format``. The dataset cache is
+            not used with a custom writer.
 
         Returns
         -------
-        (reco_ttree, buffer) : tuple
-            The TTree object and the buffer used to fill its TBranches
+        dict
+            The run report: the time spent in each stage and generating
+            each event type, the number of events of each subtype, the
+            counters, the file size and the peak memory use. See
+            :py:mod:`toymc.stats`. If the output was taken from the
+            dataset cache (see :py:mod:`toymc.dataset_cache`), the
+            events, subtypes, counters and file size are those of the
+            run that generated it, but the rest describes this call:
+            ``wall_s`` is the time taken to fetch the file, the timing
+            of the stages and event types is empty, and the ``"cache"``
+            entry is marked as a ``"hit"``. No progress hooks are called
+            in that case.
         """
-        buf = root_util.TreeBuffer()
-        buf.triggerType = root_util.unsigned_int_value()
-        buf.site = root_util.int_value()
-        buf.energy = root_util.float_value()
-        buf.x = root_util.float_value()
-        buf.y = root_util.float_value()
-        buf.z = root_util.float_value()
-
-        host_file.cd()
-        event_subdir = host_file.Get("Event")
-        if not bool(event_subdir):
-            event_subdir = host_file.mkdir("Event")
-        event_subdir.cd()
-        rec_subdir = event_subdir.Get("Rec")
-        if not bool(rec_subdir):
-            rec_subdir = event_subdir.mkdir("Rec")
-        rec_subdir.cd()
-        long_name = "Tree at /Event/Rec/{name} holding Rec_{name}".format(name=name)
-        reco = TTree(name, long_name)
-        reco.Branch("context.mSite", buf.site, "context.mSite/I")
-        reco.Branch("triggerType", buf.triggerType, "triggerType/i")
-        reco.Branch("energy", buf.energy, "energy/F")
-        reco.Branch("x", buf.x, "x/F")
-        reco.Branch("y", buf.y, "y/F")
-        reco.Branch("z", buf.z, "z/F")
-        return reco, buf
+        cache_key = None
+        if writer is None and self.cache is not False and not self.profile_callbacks:
+            from toymc import (  # pylint: disable=import-outside-toplevel
+                dataset_cache,
+            )
+
+            cache_key, cached = dataset_cache.fetch_run(self, shard)
+            if cached is not None:
+                report = dataset_cache.hit_report(self, cache_key, cached, workers)
+                self.write_report_file(report)
+                return report
+        labels = collect_labels(self.event_types)
+        if writer is None:
+            writer = make_writer(
+                self.output_format, self.outfile, self.reco_name, self.calib_name
+            )
+        self.writer = writer
+        run_stats = stats.RunStats()
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        children_cpu_start = stats.children_cpu_s()
+        instrumented = contextlib.nullcontext()
+        if self.profile_callbacks:
+            from toymc import profiling  # pylint: disable=import-outside-toplevel
+
+            instrumented = profiling.instrumented(self.event_types)
+        tracker = self.progress_tracker(shard, run_stats)
+        with stats.collecting(run_stats), instrumented:
+            try:
+                self.writer.begin(labels)
+                for events in run_stats.timed("merge", self.generate(workers, shard)):
+                    run_stats.count_truth(events["truth_index"])
+                    with run_stats.stage("write"):
+                        self.writer.add_batch(events)
+                    if tracker is not None:
+                        tracker.written(events)
+                with run_stats.stage("write"):
+                    self.finalize()
+            except BaseException:
+                try:
+                    self.writer.abort()
+                finally:
+                    if tracker is not None:
+                        tracker.finish("failed")
+                raise
+        report = {
+            "outfile": self.outfile,
+            "format": self.output_format,
+            "seed": self.seed,
+            "t0": self.t0,
+            "duration": self.duration,
+            "chunk_seconds": self.chunk_seconds,
+            "task_seconds": self.task_seconds,
+            "shards": self.shards,
+            "shard": shard,
+            "workers": workers,
+            "events": sum(run_stats.truth_counts.values()),
+            "wall_s": time.perf_counter() - wall_start,
+            "cpu_s": time.process_time() - cpu_start,
+            "workers_cpu_s": (
+                None
+                if children_cpu_start is None
+                else stats.children_cpu_s() - children_cpu_start
+            ),
+            "stages": run_stats.stages,
+            "event_types": run_stats.event_types,
+            "subtypes": {
+                labels.get(number, str(number)): count
+                for number, count in sorted(run_stats.truth_counts.items())
+            },
+            "counters": run_stats.counters,
+            "callbacks": run_stats.callbacks,
+            "bytes_written": (
+                os.path.getsize(self.outfile) if os.path.isfile(self.outfile) else None
+            ),
+            "peak_rss_mb": stats.peak_rss_mb(),
+            "workers_peak_rss_mb": stats.peak_rss_mb(children=True),
+            "cache": None if cache_key is None else {"key": cache_key, "hit": False},
+        }
+        self.write_report_file(report)
+        if cache_key is not None:
+            dataset_cache.store_run(self, cache_key, {"report": report})
+        if self.profile_callbacks:
+            profiling.print_table(run_stats.callbacks, report["wall_s"])
+        if tracker is not None:
+            tracker.finish()
+        return report
+
+    def progress_tracker(self, shard, run_stats):
+        """Return a tracker for the progress hooks, or ``None`` if there are none.
 
-    @staticmethod
-    def prep_truth(TTree, host_file):
-        """Create the MC Truth TTree (named MCTruth) and fill buffer.
+        This is an internal function and is not intended to be called
+        by users of the Toy Monte Carlo.
 
-        Parameters
-        ----------
-        host_file : ROOT.TFile
-            The TFile that will hold the MC Truth TTree
+        The progress is measured over the time span of ``shard``, or of
+        the whole run if ``shard`` is ``None``.
+        """
+        if not self.progress_hooks:
+            return None
+        span_t0, span_duration = self.t0, self.duration
+        if shard is not None and 0 <= shard < (self.shards or 0):
+            windows = self.shard_windows()[shard]
+            span_t0 = windows[0][0]
+            span_duration = sum(duration for _, duration in windows)
+        return progress.ProgressTracker(
+            self.progress_hooks, span_t0, span_duration, run_stats
+        )
+
+    def write_report_file(self, report):
+        """Write a run report to ``outfile + ".report.json"``, if enabled."""
+        if self.write_report:
+            path = self.outfile + ".report.json"
+            with open(path, "w", encoding="utf-8") as report_file:
+                json.dump(report, report_file, indent=2)
+                report_file.write("\n")
+
+    def shard_windows(self):
+        """Return the ``(t0, duration)`` time windows of each shard of this run.
+
+        The run is a single shard unless ``shards`` was given, in which
+        case it is divided into that many shards of equal length. Each
+        shard is a single window unless ``chunk_seconds`` was given, in
+        which case the shard is divided into windows of that length
+        (the last one may be shorter).
 
         Returns
         -------
-        (mc_truth_ttree, buffer) : tuple
-            The TTree object and the buffer used to fill its TBranches
+        list of list of (number, number)
+            The windows of each shard
         """
-        buf = root_util.TreeBuffer()
-        buf.truth_index = root_util.unsigned_int_value()
-        host_file.cd()
-        name = "MCTruth"
-        long_name = "Monte Carlo Truth information for each entry"
-        mc_truth = TTree(name, long_name)
-        mc_truth.Branch("truth_index", buf.truth_index, "truth_index/i")
-        return mc_truth, buf
+        if self.shards is None:
+            spans = [(self.t0, self.duration)]
+        else:
+            spans = parallel.shard_spans(self.t0, self.duration, self.shards)
+        return [
+            parallel.divide(span_t0, span_duration, self.chunk_seconds)
+            for span_t0, span_duration in spans
+        ]
+
+    def windows(self):
+        """Return the list of ``(t0, duration)`` time windows for this run.
+
+        This is the windows of all of the shards from
+        :py:meth:`ToyMC.shard_windows`, in time order.
+        """
+        return [window for shard in self.shard_windows() for window in shard]
 
-    @staticmethod
-    def prep_truth_lookup(TTree, host_file, event_types):
-        """Create the MC Truth Lookup TTree (named MCTruthLookup) and fill buffer.
+    def generate(self, workers=None, shard=None):
+        """Generate all of the events for this run, in timestamp order.
+
+        This is an internal function and is not intended to be called
+        by users of the Toy Monte Carlo.
 
-        Each TBranch has a name which is either an integer, in which
-        case the value on that TBranch is an array of chars describing
-        the event subtype represented by that integer, or the converse:
-        a subtype name with an integer value. This way the expression
-        ``MCTruthLookup->Show(0)`` will print out both directions of
-        lookup.
+        The events are generated one time window (see
+        :py:meth:`ToyMC.windows`) at a time. When there is more than one
+        window, the number of events for each event type is determined
+        for the whole run first, using :py:meth:`EventType.event_count`,
+        and then divided up among the windows using
+        :py:meth:`EventType.split_count`, so that the total has the same
+        distribution as for a single window (event types that cannot
+        tell their counts are generated for the whole run at once, see
+        :py:func:`toymc.parallel.pregenerate`). Events that land past the
+        end of their window (e.g. delayed events whose prompt event was
+        near the end of the window) are held back and merged into the
+        next window. See :py:func:`toymc.batch.merge_windows`. Time
+        shards are combined in the same way.
 
         Parameters
         ----------
-        host_file : ROOT.TFile
-            The TFile that will hold the MC Truth Lookup TTree
-        event_types : list of :py:class:`EventType`
-            The list of EventType objects to add to the lookup table
-
-
-        Returns
-        -------
-        (mc_truth_lookup ttree, buffer) : tuple
-            The TTree object and the buffer used to fill its TBranches
+        workers : int, optional
+            If given, generate the events in this many processes, as
+            described in :py:meth:`ToyMC.run`.
+        shard : int, optional
+            If given, generate only this shard, as described in
+            :py:meth:`ToyMC.run`.
+
+        Yields
+        ------
+        :py:class:`EventBatch`
+            The generated events, in timestamp order
         """
-        labels_by_number = []
-        numbers_by_label = []
-        for event_type in event_types:
-            event_labels = event_type.labels()
-            for number, label in event_labels.items():
-                if number is None or number < 0 or not isinstance(number, int):
-                    raise InvalidLookupError(event_type.name, label, number)
-                numbers_by_label.append((label, number))
-                labels_by_number.append((number, label))
-        numbers_by_label.sort()
-        labels_by_number.sort()
-        max_label_length = max(len(x[0]) for x in numbers_by_label)
-        buf_size = max_label_length + 1
-
-        buf = root_util.TreeBuffer()
-
-        def new_singleton_array(value):
-            """Return a simple singleton array with value of type
-            char*.
-
-            There's no root-util function for char arrays so I'm making my
-            own here. Further, python's built-in array.arrays are super
-            inconvenient for bytestrings/char arrays so I'm using
-            numpy.array instead. The "S{}" typecode means null-terminated
-            bytes array with max length of buf_size.
-            """
-            type_format = "S{}".format(buf_size)
-            return np.array([value], type_format)
-
-        # Create and initialize the TreeBuffer buffers to the only
-        # values they'll ever take
-        for label, number in numbers_by_label:
-            setattr(buf, label, root_util.unsigned_int_value())
-            root_util.assign_value(getattr(buf, label), number)
-        for number, label in labels_by_number:
-            setattr(buf, "_{}".format(number), new_singleton_array(label))
-
-        host_file.cd()
-        name = "MCTruthLookup"
-        long_name = "Monte Carlo Truth lookup table"
-        mc_truth = TTree(name, long_name)
-        for label, number in numbers_by_label:
-            mc_truth.Branch(label, getattr(buf, label), "{}/i".format(label))
-        for number, label in labels_by_number:
-            name = "_{}".format(number)
-            mc_truth.Branch(name, getattr(buf, name), "{}[{}]/C".format(name, buf_size))
-        mc_truth.Fill()
-        return mc_truth, buf
+        windows = self.windows()
+        with stats.stage("plan"):
+            tasks = parallel.plan_tasks(
+                self.event_types, windows, self.seed, self.task_seconds
+            )
+        if shard is not None:
+            if self.shards is None:
+                raise ValueError("Cannot generate a shard of a run without shards")
+            if not 0 <= shard < self.shards:
+                raise ValueError(
+                    f"Shard index must be between 0 and {self.shards - 1}, got {shard}"
+                )
+            shard_windows = self.shard_windows()
+            start = sum(len(windows) for windows in shard_windows[:shard])
+            windows = shard_windows[shard]
+            tasks = tasks[start : start + len(windows)]
+            streams = parallel.window_streams(self.event_types, tasks, workers or 1)
+        elif self.shards is not None:
+            streams = parallel.shard_streams(
+                self.event_types,
+                self.shard_windows(),
+                tasks,
+                workers or 1,
+                os.path.dirname(os.path.abspath(self.outfile)),
+            )
+            windows = parallel.shard_spans(self.t0, self.duration, self.shards)
+        else:
+            streams = parallel.window_streams(self.event_types, tasks, workers or 1)
+        try:
+            yield from merge_windows(windows, streams)
+        finally:
+            streams.close()
+
+    def finalize(self):
+        """Safely save and close out all ToyMC resources."""
+        self.writer.close()
 
 
 class EventType(ABC):
@@ -591,7 +746,6 @@ class EventType(ABC):
     def __init__(self, name):
         self.name = name
 
-    @abstractmethod
     def generate_events(self, rng, duration_s, t0_s):
         """Generate a list of :py:class:`Event` objects for the given
         duration.
@@ -599,8 +753,10 @@ class EventType(ABC):
         This is an internal function and is not intended to be called
         by users of the Toy Monte Carlo.
 
-        This method should be overridden by any subclasses. The
-        overriding method should use the ``rng`` parameter for any
+        Subclasses must override either this method or
+        :py:meth:`generate_batch`. The default implementation converts
+        the output of ``generate_batch``. The overriding method should
+        use the ``rng`` parameter for any
         randomness that is needed, and should generate events between
         ``t=t0_s`` and ``t=t0+duration_s`` (**in seconds**). The events do not
         need to be sorted or in any particular order. Note that this
@@ -625,7 +781,193 @@ class EventType(ABC):
         list of :py:class:`Event`
             The generated events
         """
-        return []
+        if type(self).generate_batch is EventType.generate_batch:
+            raise NotImplementedError(
+                f"{type(self).__name__} must override generate_events or generate_batch"
+            )
+        return list(self.generate_batch(rng, duration_s, t0_s).events())
+
+    def generate_batch(self, rng, duration_s, t0_s, count=None):
+        """Generate an :py:class:`EventBatch` for the given duration.
+
+        This is an internal function and is not intended to be called
+        by users of the Toy Monte Carlo.
+
+        This is the method the :py:class:`ToyMC` calls to generate
+        events. The default implementation calls
+        :py:meth:`generate_events` and converts the resulting list, so
+        subclasses that only override ``generate_events`` keep working.
+        Subclasses that generate many events should override this method
+        instead and build the batch from arrays.
+
+        The parameters have the same meaning as for
+        :py:meth:`generate_events`, plus:
+
+        Parameters
+        ----------
+        count : object, optional
+            The number of events to generate, as produced by
+            :py:meth:`event_count` and :py:meth:`split_count`. If
+            ``None``, the event type determines the number itself (as
+            ``generate_events`` does). Subclasses that support counts
+            must override ``event_count`` and this method.
+
+        Returns
+        -------
+        :py:class:`EventBatch`
+            The generated events, in any order
+        """
+        if count is not None:
+            raise ValueError(
+                f"{type(self).__name__} does not support generating a given count"
+            )
+        if type(self).generate_events is EventType.generate_events:
+            raise NotImplementedError(
+                f"{type(self).__name__} must override generate_events or generate_batch"
+            )
+        return EventBatch.from_events(self.generate_events(rng, duration_s, t0_s))
+
+    def overrides(self, base, names):
+        """Return whether this event type's class overrides any of ``base``'s methods.
+
+        This is an internal function and is not intended to be called
+        by users of the Toy Monte Carlo.
+
+        The built-in event types generate their events from arrays in
+        ``generate_batch``, without calling ``generate_events`` or the
+        methods that build each :py:class:`Event`. Subclasses that
+        override any of those methods (listed in ``names``) must be
+        generated with them instead, through
+        :py:meth:`EventType.generate_batch`.
+
+        Parameters
+        ----------
+        base : type
+            The built-in event type class
+        names : iterable of str
+            The names of the methods that ``base.generate_batch`` does
+            not call
+        """
+        cls = type(self)
+        return any(getattr(cls, name) is not getattr(base, name) for name in names)
+
+    def generate_stream(self, rng, duration_s, t0_s, count=None):
+        """Generate the events for the given duration as a time-ordered stream.
+
+        This is an internal function and is not intended to be called
+        by users of the Toy Monte Carlo.
+
+        The default implementation calls :py:meth:`generate_batch`, sorts
+        the result by timestamp, and splits it into chunks of
+        :py:data:`toymc.batch.CHUNK_SIZE` events. All of the random
+        numbers are drawn before this method returns, so the order in
+        which the stream is consumed does not affect the results.
+
+        The parameters have the same meaning as for
+        :py:meth:`generate_batch`.
+
+        Returns
+        -------
+        iterator of :py:class:`EventBatch`
+            The generated events, in timestamp order across all batches
+        """
+        batch = self.generate_batch(rng, duration_s, t0_s, count)
+        stats.count("events", len(batch))
+        with stats.stage("sort"):
+            batch = batch.sorted()
+        return batch.split(CHUNK_SIZE)
+
+    def event_count(self, rng, duration_s):  # pylint: disable=unused-argument
+        """Determine the number of events to generate over the given duration.
+
+        This is an internal function and is not intended to be called
+        by users of the Toy Monte Carlo.
+
+        This is used when a run is generated in pieces (e.g. with
+        ``ToyMC(..., chunk_seconds=...)``), so that the number of events
+        can be determined once for the whole run and then divided among
+        the pieces with :py:meth:`split_count`. The returned "count" can
+        be any object that the subclass's :py:meth:`generate_batch`
+        understands (e.g. an int, or a tuple of subtype counts).
+
+        The default implementation returns ``None``, meaning that the
+        event type does not support counts. The whole run is then
+        generated at once, as if it were not divided, and the events are
+        divided among the pieces by timestamp (see
+        :py:func:`toymc.parallel.pregenerate`), so all of them are held
+        in memory.
+
+        Parameters
+        ----------
+        rng : numpy.random.Generator
+            The random number generator to use
+        duration_s : number
+            The length of time the DAQ is being run, **in seconds**
+
+        Returns
+        -------
+        count : object or None
+            The count to pass to :py:meth:`split_count`
+        """
+        return None
+
+    def split_count(self, rng, count, durations_s):
+        """Divide an event count among consecutive pieces of a run.
+
+        This is an internal function and is not intended to be called
+        by users of the Toy Monte Carlo.
+
+        The default implementation treats ``count`` as an integer number
+        of events with timestamps distributed uniformly at random, so
+        the counts for each piece follow a multinomial distribution with
+        probabilities proportional to the piece durations. Subclasses
+        with more complicated counts (like :py:class:`~toymc.muon.Muon`)
+        should override this method.
+
+        Parameters
+        ----------
+        rng : numpy.random.Generator
+            The random number generator to use
+        count : object or None
+            The count for the whole run, from :py:meth:`event_count` (or
+            from a previous call to this method)
+        durations_s : list of number
+            The durations of the pieces, **in seconds**
+
+        Returns
+        -------
+        list
+            The count for each piece, in the same order as
+            ``durations_s``
+        """
+        if count is None:
+            return [None] * len(durations_s)
+        durations = np.asarray(durations_s, dtype=float)
+        return rng.multinomial(count, durations / durations.sum()).tolist()
+
+    def subtype_counts(self, count):  # pylint: disable=unused-argument
+        """Return the number of events of each subtype for a given count.
+
+        This is an internal function and is not intended to be called
+        by users of the Toy Monte Carlo.
+
+        This is used by :py:meth:`ToyMC.plan` to predict the size of a
+        run without generating it. The default implementation returns
+        ``None``, meaning that the event type cannot tell, and the
+        planner estimates the numbers from a short generated sample
+        instead.
+
+        Parameters
+        ----------
+        count : object or None
+            The count for the whole run, from :py:meth:`event_count`
+
+        Returns
+        -------
+        dict or None
+            The number of events for each truth label number
+        """
+        return None
 
     @abstractmethod
     def labels(self):
@@ -0,0 +1,287 @@
+"""Columnar storage for blocks of triggered events.
+
+A :py:class:`EventBatch` holds the same information as a list of
+:py:class:`toymc.Event` objects, but stores it as a single NumPy
+structured array with one field per :py:class:`~toymc.Event` attribute.
+Each event occupies :py:data:`EVENT_DTYPE.itemsize <EVENT_DTYPE>` (72)
+bytes, rather than the several hundred bytes needed for a namedtuple of
+NumPy scalars, and operations like sorting and writing can act on whole
+columns at once.
+
+The field types match the types of the output TBranches, so no
+precision is lost relative to what ends up in the output file.
+
+Streams of events
+-----------------
+
+Rather than collecting every event of a run into one batch and sorting
+it, the Toy MC treats the output of each event type as a *stream*: an
+iterable of batches which, taken together, are in timestamp order. The
+streams are combined by :py:func:`merge_sorted`, which yields the
+merged events a chunk at a time so that they can be written out as
+soon as they are ready.
+"""
+
+import numpy as np
+
+import toymc
+
+EVENT_DTYPE = np.dtype(
+    [
+        ("truth_index", np.uint32),
+        ("trigger_number", np.int32),
+        ("timestamp", np.int64),
+        ("detector", np.int32),
+        ("trigger_type", np.uint32),
+        ("site", np.int32),
+        ("energy", np.float32),
+        ("nHit", np.int32),
+        ("charge", np.float32),
+        ("x", np.float32),
+        ("y", np.float32),
+        ("z", np.float32),
+        ("fMax", np.float32),
+        ("fQuad", np.float32),
+        ("fPSD_t1", np.float32),
+        ("fPSD_t2", np.float32),
+        ("f2inch_maxQ", np.float32),
+    ]
+)
+"""The NumPy structured dtype used to store events in an EventBatch.
+
+The field names and order are identical to those of
+:py:class:`toymc.Event`.
+"""
+
+CHUNK_SIZE = 100000
+"""The default number of events per chunk when splitting up streams."""
+
+
+class EventBatch:
+    """A columnar block of triggered events.
+
+    Parameters
+    ----------
+    array : numpy.ndarray with dtype :py:data:`EVENT_DTYPE`, optional
+        The structured array holding the events. If not provided, the
+        batch is empty.
+
+    Attributes
+    ----------
+    array : numpy.ndarray
+        The underlying structured array. Individual columns can be
+        accessed either as ``batch.array["energy"]`` or as
+        ``batch["energy"]``.
+    """
+
+    def __init__(self, array=None):
+        if array is None:
+            array = np.empty(0, dtype=EVENT_DTYPE)
+        if array.dtype != EVENT_DTYPE:
+            raise ValueError(
+                f"EventBatch requires dtype EVENT_DTYPE, got {array.dtype}"
+            )
+        self.array = array
+
+    @classmethod
+    def empty(cls, size):
+        """Create a zero-initialized batch with room for ``size`` events."""
+        return cls(np.zeros(size, dtype=EVENT_DTYPE))
+
+    @classmethod
+    def from_columns(cls, size, **columns):
+        """Create a batch of ``size`` events from the given columns.
+
+        Each keyword argument must be the name of an
+        :py:class:`~toymc.Event` field. Its value may be an array of
+        length ``size`` or a single number, which is used for every
+        event. Fields that are not given are filled with 0.
+
+        Example::
+
+            >>> batch = EventBatch.from_columns(
+            ...     len(timestamps),
+            ...     truth_index=self.truth_label,
+            ...     timestamp=timestamps,
+            ...     energy=energies,
+            ... )
+        """
+        batch = cls.empty(size)
+        for name, values in columns.items():
+            batch.array[name] = values
+        return batch
+
+    @classmethod
+    def from_energies(cls, size, energy, positions=None, **columns):
+        """Create a batch of ``size`` AD events with the given energies.
+
+        The other reconstructed quantities get the same constant values
+        as in the :py:class:`~toymc.Event` objects made by the built-in
+        event types: a trigger number of 1, 192 hits, a charge of 170
+        PE per MeV and fixed values of ``fMax``, ``fQuad``,
+        ``fPSD_t1``, ``fPSD_t2`` and ``f2inch_maxQ``. If given,
+        ``positions`` is an array of shape ``(size, 3)`` with the ``x``,
+        ``y`` and ``z`` coordinates. The remaining columns are given as
+        for :py:meth:`from_columns`.
+        """
+        pe_per_mev = 170
+        if positions is not None:
+            columns.update(x=positions[:, 0], y=positions[:, 1], z=positions[:, 2])
+        return cls.from_columns(
+            size,
+            trigger_number=1,
+            energy=energy,
+            nHit=192,
+            charge=energy * pe_per_mev,
+            fMax=0.1,
+            fQuad=0.1,
+            fPSD_t1=0.99,
+            fPSD_t2=0.99,
+            f2inch_maxQ=0,
+            **columns,
+        )
+
+    @classmethod
+    def from_events(cls, events):
+        """Create a batch from an iterable of :py:class:`~toymc.Event` objects."""
+        events = [tuple(event) for event in events]
+        if not events:
+            return cls()
+        return cls(np.array(events, dtype=EVENT_DTYPE))
+
+    @classmethod
+    def concatenate(cls, batches):
+        """Join the given batches (in the given order) into a new batch."""
+        arrays = [batch.array for batch in batches]
+        if not arrays:
+            return cls()
+        return cls(np.concatenate(arrays))
+
+    def __len__(self):
+        return len(self.array)
+
+    def __getitem__(self, key):
+        """Return a column (for a field name) or a sub-batch (for anything else)."""
+        if isinstance(key, str):
+            return self.array[key]
+        return EventBatch(np.atleast_1d(self.array[key]))
+
+    @property
+    def nbytes(self):
+        """The memory used by this batch's events, in bytes."""
+        return self.array.nbytes
+
+    def sorted(self):
+        """Return a new batch ordered by timestamp.
+
+        The sort is stable, so events with identical timestamps keep
+        their relative order.
+        """
+        order = np.argsort(self.array["timestamp"], kind="stable")
+        return EventBatch(self.array[order])
+
+    def split(self, chunk_size=CHUNK_SIZE):
+        """Iterate over consecutive sub-batches of at most ``chunk_size`` events.
+
+        The sub-batches are views into this batch's array, so no event
+        data is copied.
+        """
+        for start in range(0, len(self), chunk_size):
+            yield EventBatch(self.array[start : start + chunk_size])
+
+    def events(self):
+        """Iterate over the batch as :py:class:`~toymc.Event` objects.
+
+        The values are plain Python numbers rather than NumPy scalars.
+        """
+        Event = toymc.Event
+        for row in self.array.tolist():
+            yield Event(*row)
+
+
+def merge_sorted(streams):
+    """Merge time-ordered streams of batches into one time-ordered stream.
+
+    This is a k-way merge that works on whole arrays: at each step, it
+    takes the events from the front of every stream up to the earliest
+    "last timestamp" among the streams' current batches, which are
+    exactly the events that can be emitted without looking further
+    ahead. Those pieces are already sorted, so ordering them only
+    requires merging ``k`` sorted runs, which NumPy's stable sort does
+    efficiently. Only one batch per stream is held at a time.
+
+    Events with identical timestamps are emitted in the order of the
+    streams in ``streams``.
+
+    Parameters
+    ----------
+    streams : list of iterables of :py:class:`EventBatch`
+        The streams to merge. Within each stream, the events (across all
+        of its batches) must be in timestamp order.
+
+    Yields
+    ------
+    :py:class:`EventBatch`
+        The merged events, in timestamp order
+    """
+    iterators = [iter(stream) for stream in streams]
+    buffers = [np.empty(0, dtype=EVENT_DTYPE) for _ in iterators]
+    while True:
+        for i, iterator in enumerate(iterators):
+            while iterator is not None and len(buffers[i]) == 0:
+                try:
+                    buffers[i] = next(iterator).array
+                except StopIteration:
+                    iterators[i] = iterator = None
+        active = [buffer for buffer in buffers if len(buffer) > 0]
+        if not active:
+            return
+        cutoff = min(buffer["timestamp"][-1] for buffer in active)
+        pieces = []
+        for i, buffer in enumerate(buffers):
+            end = np.searchsorted(buffer["timestamp"], cutoff, side="right")
+            pieces.append(buffer[:end])
+            buffers[i] = buffer[end:]
+        merged = np.concatenate(pieces)
+        order = np.argsort(merged["timestamp"], kind="stable")
+        yield EventBatch(merged[order])
+
+
+def merge_windows(windows, window_streams):
+    """Merge the streams of consecutive time windows into one stream.
+
+    For each window, the streams are combined with
+    :py:func:`merge_sorted`. Events that land at or past the end of their
+    window (e.g. delayed events whose prompt event was near the end of
+    the window) are held back and merged into the next window, so the
+    output is in timestamp order across windows. Events past the end of
+    the last window are kept.
+
+    Parameters
+    ----------
+    windows : list of (number, number)
+        The ``(t0, duration)`` time windows, **in seconds**
+    window_streams : iterable of lists of streams
+        For each window, the list of time-ordered streams to merge. Only
+        one window's streams are requested at a time.
+
+    Yields
+    ------
+    :py:class:`EventBatch`
+        The merged events, in timestamp order
+    """
+    carry = EventBatch()
+    for i, ((window_t0, window_duration), streams) in enumerate(
+        zip(windows, window_streams)
+    ):
+        last_window = i == len(windows) - 1
+        window_end_ns = int(1e9) * (window_t0 + window_duration)
+        held = []
+        for events in merge_sorted([[carry]] + list(streams)):
+            if not last_window:
+                end = np.searchsorted(events["timestamp"], window_end_ns)
+                held.append(events[end:])
+                events = events[:end]
+            if len(events) > 0:
+                yield events
+        carry = EventBatch.concatenate(held)
@@ -0,0 +1,370 @@
+"""Running many independent Toy MC runs on a pool of processes.
+
+A *campaign* is one configuration (a file defining ``configure(mc)``,
+as for the ``toymc`` command, or the ``configure`` function itself) run
+many times with different seeds, start times, durations and output
+files, e.g. for a sensitivity study::
+
+    >>> runs = [Run(seed, seed * 86400, 86400, f"toy_{seed}.root")
+    ...         for seed in range(1, 201)]
+    >>> results = run_campaign("example.py", runs, workers=32)
+
+or, with the runs listed in a CSV file with the columns ``seed``,
+``t0``, ``duration`` and ``outfile`` (or a JSON list of objects with
+those keys)::
+
+    toymc campaign example.py runs.csv -j 32 --summary campaign.json
+
+The runs are executed on a pool of worker processes that live for the
+whole campaign, so Python, NumPy, ROOT and the configuration are only
+imported once per worker rather than once per run. Each run generates
+its events in its worker with ``ToyMC.run()``, so its output is the
+same as that of a standalone script with the same seed.
+
+Finished runs and retries
+-------------------------
+
+When a run finishes, a small JSON record is written next to its output
+file (``<outfile>.done.json``), holding the run's parameters, the
+number of events, the time taken, the throughput, and a hash of
+everything else that determines its output: the configuration's event
+types and the options such as ``output_format`` and ``chunk_seconds``
+(see :py:func:`toymc.dataset_cache.describe_run`). Runs with a matching
+record are skipped when the campaign is started again, so an
+interrupted campaign can simply be rerun, while editing the
+configuration or changing the options makes the runs be generated
+again.
+
+A run that raises an exception is retried, up to ``retries`` more
+times, without affecting the other runs. If a worker process dies (e.g.
+in a crash inside ROOT), the pool is restarted, and each run that was
+in progress counts as having failed once.
+"""
+
+import csv
+import hashlib
+import json
+import multiprocessing
+import os
+import time
+from collections import deque, namedtuple
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from toymc import ToyMC, dataset_cache
+from toymc.config import load_config
+
+Run = namedtuple("Run", ["seed", "t0", "duration", "outfile"])
+Run.__doc__ = """The parameters of one run of a campaign.
+
+Attributes
+----------
+seed : int or None
+    The random seed
+t0 : number
+    The start time of the run, **in seconds**
+duration : number
+    The length of the run, **in seconds**
+outfile : str
+    The output file
+"""
+
+_worker_configure = None
+
+
+def marker_path(outfile):
+    """Return the location of the record written when a run finishes."""
+    return outfile + ".done.json"
+
+
+def settings_sha256(mc):
+    """Return a hash of everything that determines a run's output.
+
+    The hash covers the run's event types and settings, as described by
+    :py:func:`toymc.dataset_cache.describe_run`. If they cannot be
+    fingerprinted, ``None`` is returned, and the run is never considered
+    finished by :py:func:`is_finished`.
+    """
+    try:
+        description = dataset_cache.describe_run(mc)
+    except dataset_cache.Uncacheable:
+        return None
+    encoded = json.dumps(description, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode()).hexdigest()
+
+
+def configured(configure, run, options):
+    """Return the :py:class:`~toymc.ToyMC` object for a run, configured."""
+    mc = ToyMC(run.outfile, run.duration, run.t0, seed=run.seed, **options)
+    configure(mc)
+    return mc
+
+
+def is_finished(run, settings):
+    """Return whether the run has already been completed.
+
+    A run is complete if its output file exists and the record written
+    by :py:func:`execute_run` matches its parameters and its
+    ``settings`` hash (see :py:func:`settings_sha256`).
+    """
+    path = marker_path(run.outfile)
+    if settings is None or not (os.path.exists(run.outfile) and os.path.exists(path)):
+        return False
+    with open(path, encoding="utf-8") as marker:
+        try:
+            record = json.load(marker)
+        except ValueError:
+            return False
+    keys = ("seed", "t0", "duration")
+    return record.get("settings_sha256") == settings and all(
+        record.get(key) == getattr(run, key) for key in keys
+    )
+
+
+def execute_run(configure, run, options):
+    """Generate one run in the current process.
+
+    Parameters
+    ----------
+    configure : callable
+        The function that adds event types to a :py:class:`~toymc.ToyMC`
+    run : :py:class:`Run`
+        The run to generate
+    options : dict
+        Additional keyword arguments for :py:class:`~toymc.ToyMC`
+
+    Returns
+    -------
+    dict
+        The record describing the finished run, which is also written to
+        :py:func:`marker_path`
+    """
+    path = marker_path(run.outfile)
+    if os.path.exists(path):
+        os.remove(path)
+    start = time.perf_counter()
+    mc = configured(configure, run, options)
+    settings = settings_sha256(mc)
+    events = mc.run()["events"]
+    seconds = time.perf_counter() - start
+    record = dict(run._asdict())
+    record.update(
+        events=events,
+        seconds=seconds,
+        events_per_second=events / seconds if seconds > 0 else None,
+        pid=os.getpid(),
+        settings_sha256=settings,
+    )
+    partial_path = path + ".partial"
+    with open(partial_path, "w", encoding="utf-8") as marker:
+        json.dump(record, marker, indent=2)
+        marker.write("\n")
+    os.replace(partial_path, path)
+    return record
+
+
+def _init_worker(config):
+    """Load the configuration in a newly started worker process."""
+    global _worker_configure  # pylint: disable=global-statement
+    _worker_configure = load_config(config) if isinstance(config, str) else config
+
+
+def _run_in_worker(run, options):
+    """Generate a run in a worker process."""
+    return execute_run(_worker_configure, run, options)
+
+
+def describe(result):
+    """Return a one-line summary of a run's result."""
+    outfile = result["outfile"]
+    if result["status"] == "failed":
+        return (
+            f"{outfile}: failed after {result['attempts']} attempt(s): "
+            f"{result['error']}"
+        )
+    if result["status"] == "skipped":
+        return f"{outfile}: already finished"
+    return (
+        f"{outfile}: {result['events']} events in {result['seconds']:.1f} s "
+        f"({result['events_per_second']:.0f} events/s)"
+    )
+
+
+def run_campaign(
+    config, runs, workers=None, *, retries=1, skip_finished=True, report=None, **options
+):
+    """Execute the given runs on a pool of worker processes.
+
+    Parameters
+    ----------
+    config : str or callable
+        The configuration: a file defining ``configure(mc)``, or the
+        ``configure`` function itself
+    runs : list of :py:class:`Run` or tuples
+        The runs to execute, as ``(seed, t0, duration, outfile)``
+    workers : int, optional
+        The number of worker processes. Default: the number of CPUs.
+    retries : int, optional
+        The number of times to retry a run that fails. Default: 1.
+    skip_finished : bool, optional
+        Whether to skip runs that have already been completed (see
+        :py:func:`is_finished`). Default: ``True``.
+    report : callable, optional
+        If given, called with a one-line progress message (including
+        the throughput) each time a run finishes or fails
+    options
+        Additional keyword arguments for :py:class:`~toymc.ToyMC`, e.g.
+        ``output_format`` or ``chunk_seconds``
+
+    Returns
+    -------
+    list of dict
+        The result for each run, in the order of ``runs``. Each result
+        holds the run's parameters and a ``status`` of ``"done"``,
+        ``"skipped"`` or ``"failed"``. Finished runs also have the
+        ``events``, ``seconds`` and ``events_per_second`` of the run,
+        and failed runs the ``error``.
+    """
+    runs = [Run(*run) for run in runs]
+    outfiles = [run.outfile for run in runs]
+    if len(set(outfiles)) != len(outfiles):
+        raise ValueError("Each run of a campaign needs its own output file")
+    state = _CampaignState(runs, retries, report)
+    configure = None
+    if skip_finished:
+        configure = load_config(config) if isinstance(config, str) else config
+    for i, run in enumerate(runs):
+        if configure is not None and is_finished(
+            run, settings_sha256(configured(configure, run, options))
+        ):
+            state.skip(i)
+        else:
+            state.todo.append(i)
+    _execute_pool(config, state, workers or os.cpu_count() or 1, options)
+    return state.results
+
+
+class _CampaignState:
+    """The runs of a campaign and their results, for :py:func:`run_campaign`."""
+
+    def __init__(self, runs, retries, report):
+        self.runs = runs
+        self.retries = retries
+        self.report = report
+        self.results = [None] * len(runs)
+        self.attempts = [0] * len(runs)
+        self.todo = deque()
+
+    def skip(self, i):
+        """Record that run ``i`` has already been completed."""
+        self.results[i] = dict(self.runs[i]._asdict(), status="skipped", attempts=0)
+        if self.report is not None:
+            self.report(describe(self.results[i]))
+
+    def finish(self, i, result):
+        """Record the final result of run ``i``."""
+        self.results[i] = result
+        if self.report is not None:
+            done = sum(result is not None for result in self.results)
+            self.report(f"[{done}/{len(self.runs)}] {describe(result)}")
+
+    def collect(self, i, future):
+        """Record the outcome of an attempt at run ``i``.
+
+        A failed run is put back on :py:attr:`todo` if it has retries
+        left. Returns whether the worker process died.
+        """
+        self.attempts[i] += 1
+        try:
+            record = future.result()
+        except Exception as error:  # pylint: disable=broad-except
+            if self.attempts[i] <= self.retries:
+                self.todo.append(i)
+            else:
+                self.finish(
+                    i,
+                    dict(
+                        self.runs[i]._asdict(),
+                        status="failed",
+                        attempts=self.attempts[i],
+                        error=f"{type(error).__name__}: {error}",
+                    ),
+                )
+            return isinstance(error, BrokenProcessPool)
+        self.finish(i, dict(record, status="done", attempts=self.attempts[i]))
+        return False
+
+
+def _execute_pool(config, state, workers, options):
+    """Execute the runs in ``state.todo``, restarting the pool if it breaks."""
+    context = multiprocessing.get_context("fork")
+    executor = None
+    broken = False
+    pending = {}
+    try:
+        while state.todo or pending:
+            if executor is None:
+                executor = ProcessPoolExecutor(
+                    workers,
+                    mp_context=context,
+                    initializer=_init_worker,
+                    initargs=(config,),
+                )
+                broken = False
+            while not broken and state.todo and len(pending) < workers:
+                i = state.todo.popleft()
+                try:
+                    future = executor.submit(_run_in_worker, state.runs[i], options)
+                except BrokenProcessPool:
+                    state.todo.appendleft(i)
+                    broken = True
+                else:
+                    pending[future] = i
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                broken = state.collect(pending.pop(future), future) or broken
+            if broken and not pending:
+                executor.shutdown()
+                executor = None
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+
+def read_runs(path):
+    """Read the list of runs for a campaign from a CSV or JSON file.
+
+    A CSV file must have a header row naming the columns ``seed``,
+    ``t0``, ``duration`` and ``outfile``. A JSON file must hold a list
+    of objects with those keys. An empty seed means ``None``.
+
+    Returns
+    -------
+    list of :py:class:`Run`
+        The runs, in file order
+    """
+
+    def number(value):
+        if value in (None, ""):
+            return None
+        if isinstance(value, str):
+            try:
+                return int(value)
+            except ValueError:
+                return float(value)
+        return value
+
+    with open(path, newline="", encoding="utf-8") as infile:
+        if path.lower().endswith(".json"):
+            rows = json.load(infile)
+        else:
+            rows = list(csv.DictReader(infile))
+    return [
+        Run(
+            number(row["seed"]),
+            number(row["t0"]),
+            number(row["duration"]),
+            row["outfile"],
+        )
+        for row in rows
+    ]
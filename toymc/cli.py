@@ -0,0 +1,529 @@
+"""The ``toymc`` command-line interface.
+
+The ``toymc`` command runs a Toy MC configuration without a dedicated
+script. The configuration is a Python file that defines a function
+``configure(mc)``, which creates the event types and adds them to the
+:py:class:`~toymc.ToyMC` object ``mc`` (see example.py in the dyb-toymc
+repository)::
+
+    toymc run example.py out.root --runtime 86400 --seed 1
+
+Job arrays
+----------
+
+A run can be split into ``N`` time shards that are generated by
+independent jobs, e.g. the elements of a batch system job array, with
+``--shard i --of N``::
+
+    toymc run example.py out.root --runtime 8640000 --seed 1 \\
+        --shard $SLURM_ARRAY_TASK_ID --of 100
+
+Each job writes the shard's events to its own file (``out_042of100.root``
+for shard 42 here). The number of events and the random number streams
+of each shard are derived from the seed alone, as for
+``ToyMC(..., shards=N)``, so the jobs need no coordination, and any shard
+can be rerun by itself with identical results. A seed is required for
+sharded runs.
+
+Next to each output file, the job writes a manifest (e.g.
+``out_042of100.root.manifest.json``) recording the configuration,
+seed, shard, time range, event count, and two SHA-256 checksums: one of
+the output file, and one of the event data as raw
+:py:data:`~toymc.batch.EVENT_DTYPE` records. The second one does not
+depend on the output format or on details like file creation times, so
+it is the one to compare when checking that a shard was reproduced.
+The shard manifests can be collected into one campaign manifest with::
+
+    toymc manifest out_*of100.root.manifest.json -o campaign.json
+
+A shard's file also holds the events generated in the shard that land
+past its end, so the shard files overlap slightly in time. To combine
+them into one time-ordered file, use ``toymc-merge`` (see
+:py:mod:`toymc.merge`)::
+
+    toymc-merge out.root out_*of100.root
+
+Dry runs
+--------
+
+To see how big a run will be before running it, add ``--dry-run``. The
+events of each subtype, the output file size, the peak memory and the
+runtime are predicted and printed, and nothing is written (see
+:py:mod:`toymc.planning`). With ``--memory-budget``, a
+``--chunk-seconds`` and number of ``--workers`` that fit in that many
+MiB are also recommended::
+
+    toymc run example.py out.root --runtime 8640000 --dry-run --memory-budget 4000
+
+Dataset cache
+-------------
+
+With ``--cache`` (or the ``TOYMC_DATASET_CACHE`` environment variable set
+to ``1``), a run that was already generated with the same configuration,
+seed and settings is copied from the dataset cache instead of being
+generated again, along with its manifest information (see
+:py:mod:`toymc.dataset_cache`). ``--no-cache`` bypasses the cache, and
+``--refresh-cache`` regenerates the run and replaces its cached copy.
+``toymc cache`` lists the cached files, and ``toymc cache --remove KEY``
+and ``toymc cache --clear`` remove them.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+
+from toymc import ToyMC, progress
+from toymc.config import load_config
+from toymc.output import WRITERS, Writer, make_writer
+
+
+class ChecksumWriter(Writer):
+    """A writer that passes events on to another writer and summarizes them.
+
+    Parameters
+    ----------
+    writer : :py:class:`~toymc.output.Writer`
+        The writer that actually writes the events
+    checksum : bool, optional
+        Whether to compute :py:attr:`digest`. Default: ``True``.
+
+    Attributes
+    ----------
+    events : int
+        The number of events written so far
+    first_timestamp, last_timestamp : int or None
+        The first and last timestamps written so far
+    digest : hashlib.sha256 or None
+        The SHA-256 hash of the events written so far, as raw
+        :py:data:`~toymc.batch.EVENT_DTYPE` records
+    """
+
+    def __init__(self, writer, checksum=True):
+        super().__init__(writer.outfile, writer.reco_name, writer.calib_name)
+        self.writer = writer
+        self.events = 0
+        self.first_timestamp = None
+        self.last_timestamp = None
+        self.digest = hashlib.sha256() if checksum else None
+
+    def begin(self, labels):
+        self.writer.begin(labels)
+
+    def add_batch(self, batch):
+        if len(batch) == 0:
+            return
+        timestamps = batch["timestamp"]
+        if self.first_timestamp is None:
+            self.first_timestamp = int(timestamps[0])
+        self.last_timestamp = int(timestamps[-1])
+        self.events += len(batch)
+        if self.digest is not None:
+            self.digest.update(batch.array.tobytes())
+        self.writer.add_batch(batch)
+
+    def close(self):
+        self.writer.close()
+
+    def abort(self):
+        self.writer.abort()
+
+
+def file_sha256(path):
+    """Return the hex SHA-256 checksum of the given file."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as infile:
+        for block in iter(lambda: infile.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def shard_path(outfile, shard, of):
+    """Return the output file name for shard ``shard`` of ``of``.
+
+    Example::
+
+        >>> shard_path("out.root", 42, 100)
+        'out_042of100.root'
+    """
+    root, ext = os.path.splitext(outfile)
+    width = len(str(of))
+    return f"{root}_{shard:0{width}d}of{of}{ext}"
+
+
+def run(args):
+    """Run a configuration (the ``toymc run`` subcommand)."""
+    sharded = args.of is not None
+    outfile = args.outfile
+    if sharded:
+        outfile = shard_path(outfile, args.shard, args.of)
+    configure = load_config(args.config)
+    mc = ToyMC(
+        outfile,
+        args.runtime,
+        args.t0,
+        seed=args.seed,
+        chunk_seconds=args.chunk_seconds,
+        output_format=args.format,
+        task_seconds=args.task_seconds,
+        shards=args.of,
+        profile_callbacks=args.profile_callbacks,
+        cache=True if args.refresh_cache and args.cache is None else args.cache,
+    )
+    configure(mc)
+    if args.dry_run:
+        from toymc import planning  # pylint: disable=import-outside-toplevel
+
+        plan = mc.plan(args.workers, args.memory_budget)
+        print(planning.format_plan(plan))
+        return plan
+    cache_key = cached = None
+    if mc.cache is not False and not args.profile_callbacks:
+        from toymc import (  # pylint: disable=import-outside-toplevel
+            dataset_cache,
+        )
+
+        cache_key, cached = dataset_cache.fetch_run(
+            mc,
+            args.shard,
+            required=("report", "output"),
+            refresh=args.refresh_cache,
+        )
+    if cached is not None:
+        output = cached["output"]
+        mc.write_report_file(
+            dataset_cache.hit_report(mc, cache_key, cached, args.workers)
+        )
+    else:
+        output, report = generate(mc, args, outfile)
+        if cache_key is not None:
+            report["cache"] = {"key": cache_key, "hit": False}
+            mc.write_report_file(report)
+            dataset_cache.store_run(mc, cache_key, {"report": report, "output": output})
+    if sharded:
+        shard_t0 = mc.shard_windows()[args.shard][0][0]
+        shard_duration = sum(d for _, d in mc.shard_windows()[args.shard])
+    else:
+        shard_t0, shard_duration = mc.t0, mc.duration
+    manifest_data = {
+        "config": os.path.abspath(args.config),
+        "config_sha256": file_sha256(args.config),
+        "seed": mc.seed,
+        "shard": args.shard if sharded else 0,
+        "of": args.of if sharded else 1,
+        "t0": mc.t0,
+        "runtime": mc.duration,
+        "shard_t0": shard_t0,
+        "shard_runtime": shard_duration,
+        "chunk_seconds": mc.chunk_seconds,
+        "task_seconds": mc.task_seconds,
+        "output": os.path.basename(outfile),
+        "format": mc.output_format,
+    }
+    manifest_data.update(output)
+    with open(outfile + ".manifest.json", "w", encoding="utf-8") as manifest_file:
+        json.dump(manifest_data, manifest_file, indent=2)
+        manifest_file.write("\n")
+    return manifest_data
+
+
+def generate(mc, args, outfile):
+    """Generate a run's output file for :py:func:`run`.
+
+    Returns
+    -------
+    output : dict
+        The ``events``, ``first_timestamp``, ``last_timestamp``,
+        ``sha256`` and ``content_sha256`` of the output, for the manifest
+    report : dict
+        The run report, from :py:meth:`toymc.ToyMC.run`
+    """
+    if args.progress or args.status_file is not None:
+        mc.add_progress_hook(
+            progress.ProgressReporter(
+                sys.stderr if args.progress else None, args.status_file, outfile
+            ),
+            args.progress_interval,
+        )
+    writer = ChecksumWriter(
+        make_writer(mc.output_format, mc.outfile, mc.reco_name, mc.calib_name)
+    )
+    report = mc.run(args.workers, args.shard, writer)
+    output = {
+        "events": writer.events,
+        "first_timestamp": writer.first_timestamp,
+        "last_timestamp": writer.last_timestamp,
+        "sha256": file_sha256(outfile),
+        "content_sha256": writer.digest.hexdigest(),
+    }
+    return output, report
+
+
+def collect_manifests(paths):
+    """Combine shard manifests into a campaign manifest.
+
+    Parameters
+    ----------
+    paths : list of str
+        The shard manifest files, in any order
+
+    Returns
+    -------
+    dict
+        The campaign manifest, with the shared settings of the shards
+        and a list of the shard manifests in shard order
+
+    Raises
+    ------
+    ValueError
+        If the shards come from different campaigns, or if any shard is
+        missing or appears more than once
+    """
+    shards = []
+    for path in paths:
+        with open(path, encoding="utf-8") as manifest_file:
+            shards.append(json.load(manifest_file))
+    if not shards:
+        raise ValueError("No manifests given")
+    shared = ("config_sha256", "seed", "of", "t0", "runtime", "format")
+    for key in shared:
+        values = {shard[key] for shard in shards}
+        if len(values) > 1:
+            raise ValueError(f"Manifests disagree on {key!r}: {sorted(values)}")
+    shards.sort(key=lambda shard: shard["shard"])
+    indices = [shard["shard"] for shard in shards]
+    expected = list(range(shards[0]["of"]))
+    if indices != expected:
+        missing = sorted(set(expected) - set(indices))
+        duplicates = sorted({i for i in indices if indices.count(i) > 1})
+        raise ValueError(
+            f"Incomplete set of shards: missing {missing}, duplicated {duplicates}"
+        )
+    combined = {key: shards[0][key] for key in shared}
+    combined["events"] = sum(shard["events"] for shard in shards)
+    combined["shards"] = shards
+    return combined
+
+
+def manifest(args):
+    """Combine shard manifests (the ``toymc manifest`` subcommand)."""
+    try:
+        combined = collect_manifests(args.manifests)
+    except ValueError as error:
+        sys.exit(f"toymc manifest: error: {error}")
+    if args.output is None:
+        json.dump(combined, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+    else:
+        with open(args.output, "w", encoding="utf-8") as outfile:
+            json.dump(combined, outfile, indent=2)
+            outfile.write("\n")
+    return combined
+
+
+def campaign(args):
+    """Run many runs of a configuration (the ``toymc campaign`` subcommand)."""
+    from toymc import (  # pylint: disable=import-outside-toplevel
+        campaign as campaigns,
+    )
+
+    results = campaigns.run_campaign(
+        args.config,
+        campaigns.read_runs(args.runs),
+        workers=args.workers,
+        retries=args.retries,
+        skip_finished=not args.rerun,
+        report=lambda message: print(message, file=sys.stderr, flush=True),
+        output_format=args.format,
+        chunk_seconds=args.chunk_seconds,
+    )
+    if args.summary is not None:
+        with open(args.summary, "w", encoding="utf-8") as summary:
+            json.dump(results, summary, indent=2)
+            summary.write("\n")
+    failed = [result for result in results if result["status"] == "failed"]
+    if failed:
+        sys.exit(f"toymc campaign: {len(failed)} run(s) failed")
+    return results
+
+
+def cache(args):
+    """List or remove cached output files (the ``toymc cache`` subcommand)."""
+    from toymc import (  # pylint: disable=import-outside-toplevel
+        dataset_cache,
+    )
+
+    datasets = dataset_cache.DatasetCache(args.directory)
+    if args.clear:
+        print(f"Removed {datasets.clear()} cached file(s)")
+        return
+    entries = datasets.entries()
+    if args.remove:
+        for prefix in args.remove:
+            keys = [
+                entry["key"] for entry in entries if entry["key"].startswith(prefix)
+            ]
+            if len(keys) != 1:
+                sys.exit(
+                    f"toymc cache: error: {prefix!r} matches {len(keys)} cached files"
+                )
+            datasets.remove(keys[0])
+        return
+    print(f"{len(entries)} cached file(s) in {datasets.directory}")
+    for entry in reversed(entries):
+        report = entry.get("report", {})
+        last_used = time.strftime("%Y-%m-%d %H:%M", time.localtime(entry["last_used"]))
+        print(
+            f"  {entry['key'][:12]}  {entry['bytes'] / 2**20:>10.1f} MiB  "
+            f"{last_used}  {report.get('outfile')}"
+        )
+    total_mb = sum(entry["bytes"] for entry in entries) / 2**20
+    print(f"Total: {total_mb:.1f} MiB of {datasets.max_bytes / 2**20:.0f} MiB")
+
+
+def make_parser():
+    """Create the argument parser for the ``toymc`` command."""
+    parser = argparse.ArgumentParser(
+        prog="toymc", description="Daya Bay Toy MC by Sam Kohn"
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="run a configuration file")
+    run_parser.set_defaults(func=run)
+    run_parser.add_argument("config", help="Python file defining configure(mc)")
+    run_parser.add_argument("outfile")
+    run_parser.add_argument(
+        "-t", "--runtime", type=float, required=True, help="DAQ runtime in seconds"
+    )
+    run_parser.add_argument(
+        "--t0", type=int, default=0, help="Start time of run in seconds"
+    )
+    run_parser.add_argument("-s", "--seed", type=int, help="random seed")
+    run_parser.add_argument(
+        "--chunk-seconds",
+        type=float,
+        help="generate and write the run in time windows of this length",
+    )
+    run_parser.add_argument(
+        "--format", default="root", choices=sorted(WRITERS), help="output backend"
+    )
+    run_parser.add_argument(
+        "-j", "--workers", type=int, help="number of processes to generate events in"
+    )
+    run_parser.add_argument(
+        "--task-seconds",
+        type=float,
+        help="split each event type into pieces of this length, for --workers",
+    )
+    run_parser.add_argument(
+        "--shard", type=int, help="generate only this shard (0 to N-1) of the run"
+    )
+    run_parser.add_argument("--of", type=int, metavar="N", help="number of shards")
+    run_parser.add_argument(
+        "--profile-callbacks",
+        action="store_true",
+        help="time each generator function of each event type and print a table",
+    )
+    run_parser.add_argument(
+        "--progress", action="store_true", help="show the progress on standard error"
+    )
+    run_parser.add_argument(
+        "--status-file", help="keep a JSON file with the run's progress up to date"
+    )
+    run_parser.add_argument(
+        "--progress-interval",
+        type=float,
+        default=1.0,
+        help="seconds between progress updates (default: 1)",
+    )
+    run_parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="only predict the events, file size, memory and runtime of the run",
+    )
+    run_parser.add_argument(
+        "--cache",
+        action="store_true",
+        default=None,
+        help="reuse the output of an identical earlier run from the dataset cache",
+    )
+    run_parser.add_argument(
+        "--no-cache",
+        dest="cache",
+        action="store_false",
+        help="do not use the dataset cache, even if TOYMC_DATASET_CACHE is set",
+    )
+    run_parser.add_argument(
+        "--refresh-cache",
+        action="store_true",
+        help="regenerate the output and replace it in the dataset cache",
+    )
+    run_parser.add_argument(
+        "--memory-budget",
+        type=float,
+        metavar="MIB",
+        help="with --dry-run, recommend settings that fit in this much memory",
+    )
+
+    campaign_parser = subparsers.add_parser(
+        "campaign", help="run a configuration many times on a pool of processes"
+    )
+    campaign_parser.set_defaults(func=campaign)
+    campaign_parser.add_argument("config", help="Python file defining configure(mc)")
+    campaign_parser.add_argument(
+        "runs", help="CSV or JSON file listing seed, t0, duration and outfile"
+    )
+    campaign_parser.add_argument(
+        "-j", "--workers", type=int, help="number of worker processes"
+    )
+    campaign_parser.add_argument(
+        "--retries", type=int, default=1, help="times to retry a failed run"
+    )
+    campaign_parser.add_argument(
+        "--rerun", action="store_true", help="rerun runs that already finished"
+    )
+    campaign_parser.add_argument(
+        "--format", default="root", choices=sorted(WRITERS), help="output backend"
+    )
+    campaign_parser.add_argument(
+        "--chunk-seconds",
+        type=float,
+        help="generate and write each run in time windows of this length",
+    )
+    campaign_parser.add_argument("--summary", help="write the results to this file")
+
+    cache_parser = subparsers.add_parser(
+        "cache", help="list or remove the output files in the dataset cache"
+    )
+    cache_parser.set_defaults(func=cache)
+    cache_parser.add_argument("--clear", action="store_true", help="remove all")
+    cache_parser.add_argument(
+        "--remove", nargs="+", metavar="KEY", help="remove these (key prefixes)"
+    )
+    cache_parser.add_argument("--directory", help="default: the default cache")
+
+    manifest_parser = subparsers.add_parser(
+        "manifest", help="combine shard manifests into a campaign manifest"
+    )
+    manifest_parser.set_defaults(func=manifest)
+    manifest_parser.add_argument("manifests", nargs="+")
+    manifest_parser.add_argument("-o", "--output", help="default: standard output")
+    return parser
+
+
+def main(argv=None):
+    """Run the ``toymc`` command."""
+    parser = make_parser()
+    args = parser.parse_args(argv)
+    if args.command == "run" and (args.shard is None) != (args.of is None):
+        parser.error("--shard and --of must be given together")
+    if args.command == "run" and args.of is not None and args.seed is None:
+        parser.error("--seed is required with --shard and --of")
+    args.func(args)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,25 @@
+"""Loading Toy MC configuration files.
+
+A configuration file is a Python file that defines a function
+``configure(mc)``, which creates the event types and adds them to the
+:py:class:`~toymc.ToyMC` object ``mc`` (see example.py in the dyb-toymc
+repository). It is used by the ``toymc`` command (see
+:py:mod:`toymc.cli`) and by campaigns (see :py:mod:`toymc.campaign`).
+"""
+
+import importlib.util
+
+
+def load_config(path):
+    """Load a configuration file and return its ``configure`` function."""
+    spec = importlib.util.spec_from_file_location("toymc_config", path)
+    if spec is None:
+        raise ValueError(f"Cannot load configuration file {path!r}")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    try:
+        return module.configure
+    except AttributeError:
+        raise ValueError(
+            f"Configuration file {path!r} does not define configure(mc)"
+        ) from None
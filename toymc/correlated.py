@@ -34,6 +34,16 @@ the position of the correlated prompt event. So that function takes
 2 arguments: the RNG, and then a 3-tuple ``(x, y, z)`` of the prompt
 position, and returns a 3-tuple of the generated delayed position.
 
+High-rate samples are generated by :py:meth:`Correlated.generate_batch`,
+which produces all prompt and delayed events at once. The generator
+functions above are used most efficiently if they are marked with
+:py:func:`toymc.util.vectorized`: the energy and prompt position
+functions should then accept an optional ``size`` argument, and
+``delayed_pos_from_prompt_mm`` should accept an ``(N, 3)`` array of
+prompt positions and return an ``(N, 3)`` array of delayed positions.
+All of the defaults are vectorized. Unmarked functions are called once
+per event.
+
 The helper functions in :py:mod:`toymc.util` may be helpful
 when you go to create your own sophisticated generators. See
 :py:func:`toymc.util.rng_correlated_expo_cylinder` for an example of how
@@ -93,6 +103,15 @@ class Correlated(toymc.EventType):
         3m cylinder.
     """
 
+    EVENT_METHODS = (
+        "generate_events",
+        "new_prompt_event",
+        "new_delayed_event",
+        "prompt_physical_quantities",
+        "delayed_physical_quantities",
+    )
+    """The methods that :py:meth:`Correlated.generate_batch` replaces."""
+
     def __init__(self, name, site, detector, rate_Hz, coincidence_ns):
         super().__init__(name)
         self.rate_hz = rate_Hz
@@ -100,8 +119,12 @@ class Correlated(toymc.EventType):
         self.detector = detector
         self.trigger_type = 0x10001100
         self.coincidence_ns = coincidence_ns
-        self.prompt_energy_spectrum = lambda rng: rng.uniform(0.7, 4)
-        self.delayed_energy_spectrum = lambda rng: rng.uniform(7, 9)
+        self.prompt_energy_spectrum = util.vectorized(
+            lambda rng, size=None: rng.uniform(0.7, 4, size)
+        )
+        self.delayed_energy_spectrum = util.vectorized(
+            lambda rng, size=None: rng.uniform(7, 9, size)
+        )
         default_prompt_delayed_distance_mm = 50
         default_radius = 1500
         self.prompt_position_spectrum_mm = util.rng_uniform_cylinder(
@@ -125,9 +148,7 @@ class Correlated(toymc.EventType):
         end_ns = start_ns + duration_ns
         events = []
         times_prompt = rng.integers(start_ns, end_ns, size=actual_number)
-        delays = rng.exponential(1 / self.coincidence_ns, size=actual_number).astype(
-            int
-        )
+        delays = rng.exponential(self.coincidence_ns, size=actual_number).astype(int)
         times_delayed = times_prompt + delays
         for time_prompt, time_delayed in zip(times_prompt, times_delayed):
             prompt = self.new_prompt_event(rng, time_prompt)
@@ -137,6 +158,80 @@ class Correlated(toymc.EventType):
             events.append(delayed)
         return events
 
+    def generate_batch(self, rng, duration_s, t0_s, count=None):
+        """Generate correlated events over the given duration.
+
+        This is an internal function and is not intended to be called
+        by users of the Toy Monte Carlo.
+
+        This is the array version of
+        :py:meth:`Correlated.generate_events`. All prompt energies and
+        positions are drawn at once, and then all delayed energies and
+        positions, using :py:func:`toymc.util.sample` and
+        :py:func:`toymc.util.sample_correlated`. If given, ``count`` is
+        the number of prompt-delayed pairs to generate.
+
+        Subclasses that override :py:meth:`Correlated.generate_events`
+        or the methods it uses to make each event
+        (:py:meth:`Correlated.new_prompt_event`,
+        :py:meth:`Correlated.new_delayed_event` and their
+        ``physical_quantities`` methods) are generated with those
+        methods instead.
+        """
+        if self.overrides(Correlated, Correlated.EVENT_METHODS):
+            return super().generate_batch(rng, duration_s, t0_s, count)
+        if count is None:
+            count = self.event_count(rng, duration_s)
+        duration_ns = int(1e9) * duration_s
+        start_ns = int(1e9) * t0_s
+        end_ns = start_ns + duration_ns
+        times_prompt = rng.integers(start_ns, end_ns, size=count)
+        delays = rng.exponential(self.coincidence_ns, size=count).astype(int)
+        times_delayed = times_prompt + delays
+        prompt_energies = util.sample(self.prompt_energy_spectrum, rng, count)
+        prompt_positions = util.sample(
+            self.prompt_position_spectrum_mm, rng, count
+        ).reshape(count, 3)
+        delayed_energies = util.sample(self.delayed_energy_spectrum, rng, count)
+        delayed_positions = util.sample_correlated(
+            self.delayed_pos_from_prompt_mm, rng, prompt_positions
+        )
+        prompts = self.new_batch(
+            self.truth_label_prompt, times_prompt, prompt_energies, prompt_positions
+        )
+        delayeds = self.new_batch(
+            self.truth_label_delayed,
+            times_delayed,
+            delayed_energies,
+            delayed_positions,
+        )
+        return toymc.EventBatch.concatenate([prompts, delayeds])
+
+    def event_count(self, rng, duration_s):
+        """Return the number of events to generate over the given duration.
+
+        This is an internal function and is not intended to be called
+        by users of the Toy Monte Carlo.
+
+        Returns ``None`` for subclasses that are generated with
+        :py:meth:`Correlated.generate_events` (see
+        :py:meth:`Correlated.generate_batch`), which determines the
+        number of events itself.
+        """
+        if self.overrides(Correlated, Correlated.EVENT_METHODS):
+            return super().event_count(rng, duration_s)
+        return self.actual_event_count(rng, duration_s, self.rate_hz)
+
+    def subtype_counts(self, count):
+        """Return the numbers of prompt and delayed events for a count of pairs.
+
+        This is an internal function and is not intended to be called
+        by users of the Toy Monte Carlo.
+        """
+        if count is None:
+            return super().subtype_counts(count)
+        return {self.truth_label_prompt: count, self.truth_label_delayed: count}
+
     def labels(self):
         """Return a labels dict mapping the lookup numbers to prompt and
         delayed."""
@@ -145,6 +240,28 @@ class Correlated(toymc.EventType):
             self.truth_label_delayed: "{}_delayed".format(self.name),
         }
 
+    def new_batch(self, truth_label, timestamps, energies, positions):
+        """Assemble an EventBatch from arrays of generated quantities.
+
+        This is an internal function and is not intended to be called
+        by users of the Toy Monte Carlo.
+
+        The remaining physical quantities are filled with the same
+        constant values used by
+        :py:meth:`Correlated.prompt_physical_quantities` and
+        :py:meth:`Correlated.delayed_physical_quantities`.
+        """
+        return toymc.EventBatch.from_energies(
+            len(timestamps),
+            energies,
+            positions,
+            truth_index=truth_label,
+            timestamp=timestamps,
+            detector=self.detector,
+            trigger_type=self.trigger_type,
+            site=self.site,
+        )
+
     def new_prompt_event(self, rng, timestamp):
         """Generate a new prompt Event object with the given timestamp.
 
@@ -0,0 +1,667 @@
+"""A local cache of generated output files.
+
+Tests and analysis notebooks often generate the same toy file, with the
+same configuration, seed and duration, over and over. With the dataset
+cache enabled, :py:meth:`toymc.ToyMC.run` looks the run up by a hash of
+its full configuration, and if the same run was generated before, copies
+(or links) the cached file to ``outfile`` instead of generating it.
+Otherwise it generates the file as usual and adds it to the cache.
+
+The cache is used by :py:class:`~toymc.ToyMC` objects created with
+``cache=True`` (or with a :py:class:`DatasetCache`), and by all of them
+if the ``TOYMC_DATASET_CACHE`` environment variable is set to ``1``.
+``cache=False`` bypasses it. From the command line, use ``toymc run
+--cache`` and ``--no-cache``, and ``toymc cache`` to list or remove the
+cached files::
+
+    toymc run example.py out.root -t 86400 -s 1 --cache
+    toymc cache
+    toymc cache --clear
+
+Runs without a seed are never cached, since they are not reproducible,
+and neither are runs given a custom writer or run with
+``profile_callbacks``. To have a run generated again, remove its entry
+with ``DatasetCache().remove(dataset_key(mc))`` (or ``toymc run
+--refresh-cache``).
+
+The cache key
+-------------
+
+The key (see :py:func:`dataset_key`) is a SHA-256 hash of:
+
+* each event type's class, and the values of its public attributes,
+  including nested event types (e.g. the sources of a
+  :py:class:`~toymc.hall.Hall`) and generator functions;
+* the truth labels;
+* the seed, ``t0``, ``duration``, ``chunk_seconds``, and everything
+  else that changes the generated events or the output file:
+  ``task_seconds``, ``shards`` and ``shard``, the output format and the
+  TTree names (but not the number of workers, which does not change
+  the output; see :py:meth:`toymc.ToyMC.run`);
+* the versions of toymc, Python and NumPy, and a hash of the toymc
+  source files, so that changing toymc itself invalidates the cache.
+
+A generator function is fingerprinted by its compiled code (not its
+name or location), its default arguments, the values of the variables
+it closes over, and the global variables it refers to, so that editing
+a lambda in a configuration file, or a constant it uses, changes the
+key. If any part of the configuration cannot be fingerprinted (e.g. a
+function that refers to a random generator object), the run is
+generated without the cache, with a warning.
+
+Storage
+-------
+
+Each cached file is stored in its own directory in
+``util.cache_dir("datasets")`` (see :py:func:`toymc.util.cache_dir`),
+with a ``metadata.json`` holding the run report and configuration. The
+total size is limited to ``max_mb`` (default: the
+``TOYMC_DATASET_CACHE_MB`` environment variable, or 10240 MiB), and the
+least recently used files are removed to make room for new ones.
+"""
+
+import functools
+import hashlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import types
+import warnings
+
+import numpy as np
+
+import toymc
+from toymc import stats, util
+from toymc.output import collect_labels
+
+DEFAULT_MAX_MB = 10240
+"""The default size limit of the cache, in MiB."""
+
+
+class Uncacheable(Exception):
+    """Raised when part of a run's configuration cannot be fingerprinted."""
+
+
+def toymc_version():
+    """Return the version of the installed toymc package, or ``"unknown"``."""
+    try:
+        from importlib import metadata  # pylint: disable=import-outside-toplevel
+
+        return metadata.version("dyb-toymc")
+    except (ImportError, ValueError):
+        pass
+    version_file = os.path.join(os.path.dirname(util.__file__), os.pardir, "VERSION")
+    try:
+        with open(version_file, encoding="utf-8") as infile:
+            return infile.read().strip()
+    except OSError:
+        return "unknown"
+
+
+@functools.lru_cache(maxsize=None)
+def source_sha256():
+    """Return the SHA-256 hash of the source files of the toymc package."""
+    directory = os.path.dirname(os.path.abspath(toymc.__file__))
+    digest = hashlib.sha256()
+    for name in sorted(os.listdir(directory)):
+        if name.endswith(".py"):
+            digest.update(name.encode())
+            with open(os.path.join(directory, name), "rb") as source:
+                digest.update(source.read())
+    return digest.hexdigest()
+
+
+def _qualified_name(obj):
+    return f"{getattr(obj, '__module__', None)}.{getattr(obj, '__qualname__', None)}"
+
+
+def _is_toymc(obj):
+    module = getattr(obj, "__module__", None) or ""
+    return module == "toymc" or module.startswith("toymc.")
+
+
+def _code_fingerprint(code, active):
+    """Describe a code object by what it does, not where it is."""
+    return [
+        "code",
+        hashlib.sha256(code.co_code).hexdigest(),
+        [
+            (
+                _code_fingerprint(const, active)
+                if isinstance(const, types.CodeType)
+                else fingerprint(const, active)
+            )
+            for const in code.co_consts
+        ],
+        list(code.co_names),
+        code.co_argcount,
+        code.co_kwonlyargcount,
+    ]
+
+
+def _global_names(code):
+    """Return the names used by a code object and the code nested in it."""
+    names = set(code.co_names)
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            names |= _global_names(const)
+    return names
+
+
+def _function_fingerprint(func, active):
+    closure = [
+        fingerprint(cell.cell_contents, active) for cell in func.__closure__ or ()
+    ]
+    globals_used = {}
+    for name in sorted(_global_names(func.__code__)):
+        if name in func.__globals__:
+            globals_used[name] = fingerprint(func.__globals__[name], active)
+    return [
+        "function",
+        _code_fingerprint(func.__code__, active),
+        fingerprint(func.__defaults__, active),
+        fingerprint(func.__kwdefaults__, active),
+        closure,
+        globals_used,
+        fingerprint(vars(func), active),
+    ]
+
+
+def _class_fingerprint(cls, active):
+    """Describe a class by name, and by its methods unless it is part of toymc.
+
+    The code of toymc's own classes is covered by :py:func:`source_sha256`.
+    """
+    methods = {}
+    for base in cls.__mro__:
+        if _is_toymc(base) or base.__module__ in ("builtins", "abc"):
+            continue
+        for name, value in sorted(vars(base).items()):
+            if isinstance(value, (staticmethod, classmethod)):
+                value = value.__func__
+            if isinstance(value, types.FunctionType) and name not in methods:
+                methods[name] = fingerprint(value, active)
+    return ["class", _qualified_name(cls), methods]
+
+
+def fingerprint(value, active=None):
+    """Describe a value of a run's configuration as plain JSON data.
+
+    Two values with the same fingerprint generate the same events. See
+    the module documentation for how functions are described.
+
+    Parameters
+    ----------
+    value : object
+        The value to describe
+    active : set, optional
+        The ``id`` of the objects being described, to detect cycles
+
+    Returns
+    -------
+    object
+        A JSON-compatible description of ``value``
+
+    Raises
+    ------
+    :py:class:`Uncacheable`
+        If the value (or part of it) cannot be described
+    """
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if active is None:
+        active = set()
+    if id(value) in active:
+        return ["cycle", _qualified_name(type(value))]
+    active.add(id(value))
+    try:
+        return _fingerprint(value, active)
+    finally:
+        active.discard(id(value))
+
+
+def _fingerprint(value, active):
+    # pylint: disable=too-many-return-statements
+    if isinstance(value, bytes):
+        return ["bytes", hashlib.sha256(value).hexdigest()]
+    if isinstance(value, np.ndarray):
+        if value.dtype.hasobject:
+            return ["object_array", fingerprint(value.tolist(), active)]
+        data = np.ascontiguousarray(value).tobytes()
+        return [
+            "array",
+            value.dtype.str,
+            list(value.shape),
+            hashlib.sha256(data).hexdigest(),
+        ]
+    if isinstance(value, np.generic):
+        return ["scalar", value.dtype.str, value.item()]
+    if isinstance(value, (list, tuple)):
+        return [type(value).__name__, [fingerprint(item, active) for item in value]]
+    if isinstance(value, (set, frozenset)):
+        items = [fingerprint(item, active) for item in value]
+        return ["set", sorted(items, key=json.dumps)]
+    if isinstance(value, dict):
+        items = [
+            [fingerprint(key, active), fingerprint(item, active)]
+            for key, item in value.items()
+        ]
+        return ["dict", sorted(items, key=json.dumps)]
+    if isinstance(value, types.ModuleType):
+        return ["module", value.__name__]
+    if isinstance(value, type):
+        return _class_fingerprint(value, active)
+    if isinstance(value, types.FunctionType):
+        return _function_fingerprint(value, active)
+    if isinstance(value, types.MethodType):
+        return [
+            "method",
+            fingerprint(value.__func__, active),
+            fingerprint(value.__self__, active),
+        ]
+    if isinstance(value, functools.partial):
+        return [
+            "partial",
+            fingerprint(value.func, active),
+            fingerprint(value.args, active),
+            fingerprint(value.keywords, active),
+        ]
+    if isinstance(value, (types.BuiltinFunctionType, np.ufunc)):
+        owner = getattr(value, "__self__", None)
+        if owner is None or isinstance(owner, types.ModuleType):
+            return ["builtin", _qualified_name(value), getattr(value, "__name__", None)]
+        return ["builtin_method", value.__name__, fingerprint(owner, active)]
+    if isinstance(value, toymc.EventType):
+        attributes = {
+            name: fingerprint(item, active)
+            for name, item in vars(value).items()
+            if not name.startswith("_")
+        }
+        return ["event_type", _class_fingerprint(type(value), active), attributes]
+    try:
+        attributes = vars(value)
+    except TypeError:
+        raise Uncacheable(
+            f"Cannot fingerprint {value!r} of type {_qualified_name(type(value))}"
+        ) from None
+    return [
+        "object",
+        _class_fingerprint(type(value), active),
+        fingerprint(attributes, active),
+    ]
+
+
+def _seconds(value):
+    """Return a number of seconds as a float, so that ``60`` and ``60.0`` match."""
+    return None if value is None else float(value)
+
+
+def describe_run(mc, shard=None):
+    """Describe everything that determines the output of a run.
+
+    Parameters
+    ----------
+    mc : :py:class:`toymc.ToyMC`
+        The run
+    shard : int, optional
+        As for :py:meth:`toymc.ToyMC.run`
+
+    Returns
+    -------
+    dict
+        The description, as plain JSON data
+
+    Raises
+    ------
+    :py:class:`Uncacheable`
+        If the run cannot be cached
+    """
+    return {
+        "toymc": toymc_version(),
+        "toymc_source_sha256": source_sha256(),
+        "python": f"{sys.version_info[0]}.{sys.version_info[1]}",
+        "numpy": np.__version__,
+        "seed": mc.seed,
+        "t0": float(mc.t0),
+        "duration": float(mc.duration),
+        "chunk_seconds": _seconds(mc.chunk_seconds),
+        "task_seconds": _seconds(mc.task_seconds),
+        "shards": mc.shards,
+        "shard": shard,
+        "output_format": mc.output_format,
+        "reco_name": mc.reco_name,
+        "calib_name": mc.calib_name,
+        "labels": fingerprint(collect_labels(mc.event_types)),
+        "event_types": [fingerprint(event_type) for event_type in mc.event_types],
+    }
+
+
+def dataset_key(mc, shard=None):
+    """Return the cache key of a run, or ``None`` if it cannot be cached.
+
+    The key is the hex SHA-256 hash of :py:func:`describe_run`. If the
+    run cannot be cached, a warning says why.
+    """
+    try:
+        description = describe_run(mc, shard)
+    except Uncacheable as error:
+        warnings.warn(f"Not using the dataset cache: {error}")
+        return None
+    encoded = json.dumps(description, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode()).hexdigest()
+
+
+class DatasetCache:
+    """A directory of cached output files, with a size limit.
+
+    Parameters
+    ----------
+    directory : str, optional
+        The cache directory. Default: ``util.cache_dir("datasets")``.
+    max_mb : number, optional
+        The maximum total size of the cached files, in MiB. Default: the
+        ``TOYMC_DATASET_CACHE_MB`` environment variable, or
+        :py:data:`DEFAULT_MAX_MB`.
+    link : bool, optional
+        Whether :py:meth:`fetch` hard-links the cached file to the
+        output file instead of copying it, where possible. This saves
+        time and space, but the output file then shares its contents
+        with the cache, so it must not be modified in place. Default:
+        ``False``.
+    """
+
+    def __init__(self, directory=None, max_mb=None, link=False):
+        if directory is None:
+            directory = util.cache_dir("datasets")
+        if max_mb is None:
+            max_mb = float(os.environ.get("TOYMC_DATASET_CACHE_MB", DEFAULT_MAX_MB))
+        self.directory = directory
+        self.max_bytes = int(max_mb * 2**20)
+        self.link = link
+
+    def entry_path(self, key):
+        """Return the directory of the entry with the given key."""
+        return os.path.join(self.directory, key)
+
+    def fetch(self, key, outfile, required=()):
+        """Put the cached file for ``key`` at ``outfile``, if there is one.
+
+        ``outfile`` is replaced atomically, and the entry is marked as
+        the most recently used.
+
+        Parameters
+        ----------
+        key : str
+            The key, from :py:func:`dataset_key`
+        outfile : str
+            Where to put the file
+        required : iterable of str, optional
+            Only use an entry whose metadata has these keys
+
+        Returns
+        -------
+        dict or None
+            The entry's metadata, as given to :py:meth:`store`, or
+            ``None`` if the key is not in the cache
+        """
+        entry = self.entry_path(key)
+        metadata_path = os.path.join(entry, "metadata.json")
+        data_path = os.path.join(entry, "data")
+        try:
+            with open(metadata_path, encoding="utf-8") as metadata_file:
+                metadata = json.load(metadata_file)
+            if os.path.getsize(data_path) != metadata["bytes"]:
+                # A damaged entry
+                return None
+            if any(name not in metadata for name in required):
+                return None
+            partial_path = outfile + ".partial"
+            if os.path.lexists(partial_path):
+                os.remove(partial_path)
+            try:
+                if not self.link:
+                    raise OSError("Not linking")
+                os.link(data_path, partial_path)
+            except OSError:
+                shutil.copyfile(data_path, partial_path)
+            os.replace(partial_path, outfile)
+            os.utime(metadata_path)
+        except (OSError, ValueError, KeyError):
+            return None
+        return metadata
+
+    def store(self, key, outfile, metadata):
+        """Add a copy of ``outfile`` to the cache under ``key``.
+
+        If the file is larger than the cache's size limit, it is not
+        added. Otherwise, the least recently used entries are removed
+        as needed to keep the cache within its limit. Errors writing to
+        the cache are ignored, since the cache is only an optimization.
+
+        Parameters
+        ----------
+        key : str
+            The key, from :py:func:`dataset_key`
+        outfile : str
+            The file to cache
+        metadata : dict
+            JSON-compatible information to store with the file, returned
+            by :py:meth:`fetch`. Its ``"bytes"`` and ``"key"`` are set
+            by this method.
+
+        Returns
+        -------
+        bool
+            Whether the file was added
+        """
+        try:
+            size = os.path.getsize(outfile)
+            if size > self.max_bytes:
+                return False
+            self.evict(self.max_bytes - size)
+            os.makedirs(self.directory, exist_ok=True)
+            partial = tempfile.mkdtemp(prefix=".partial-", dir=self.directory)
+            try:
+                shutil.copyfile(outfile, os.path.join(partial, "data"))
+                metadata = dict(metadata, key=key, bytes=size)
+                metadata_path = os.path.join(partial, "metadata.json")
+                with open(metadata_path, "w", encoding="utf-8") as output:
+                    json.dump(metadata, output, indent=2)
+                    output.write("\n")
+                entry = self.entry_path(key)
+                if os.path.isdir(entry):
+                    shutil.rmtree(entry)
+                os.rename(partial, entry)
+            finally:
+                if os.path.isdir(partial):
+                    shutil.rmtree(partial)
+        except OSError:
+            return False
+        return True
+
+    def entries(self):
+        """Return the metadata of every entry, least recently used first.
+
+        Each entry's metadata also has its ``last_used`` time (seconds
+        since the epoch).
+        """
+        entries = []
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return entries
+        for name in names:
+            metadata_path = os.path.join(self.directory, name, "metadata.json")
+            try:
+                last_used = os.path.getmtime(metadata_path)
+                with open(metadata_path, encoding="utf-8") as metadata_file:
+                    metadata = json.load(metadata_file)
+            except (OSError, ValueError):
+                continue
+            metadata["last_used"] = last_used
+            entries.append(metadata)
+        entries.sort(key=lambda metadata: metadata["last_used"])
+        return entries
+
+    def size(self):
+        """Return the total size of the cached files, in bytes."""
+        return sum(entry["bytes"] for entry in self.entries())
+
+    def evict(self, max_bytes=None):
+        """Remove the least recently used entries until the cache fits in ``max_bytes``.
+
+        Default: the cache's size limit.
+
+        Returns
+        -------
+        int
+            The number of entries removed
+        """
+        if max_bytes is None:
+            max_bytes = self.max_bytes
+        entries = self.entries()
+        total = sum(entry["bytes"] for entry in entries)
+        removed = 0
+        for entry in entries:
+            if total <= max_bytes:
+                break
+            if self.remove(entry["key"]):
+                removed += 1
+            total -= entry["bytes"]
+        return removed
+
+    def remove(self, key):
+        """Remove the entry with the given key, e.g. to regenerate it.
+
+        Returns
+        -------
+        bool
+            Whether there was such an entry
+        """
+        entry = self.entry_path(key)
+        if not os.path.isdir(entry):
+            return False
+        shutil.rmtree(entry, ignore_errors=True)
+        return True
+
+    def clear(self):
+        """Remove every entry.
+
+        Returns
+        -------
+        int
+            The number of entries removed
+        """
+        entries = self.entries()
+        return sum(self.remove(entry["key"]) for entry in entries)
+
+
+def resolve(cache):
+    """Return the :py:class:`DatasetCache` to use for a ``ToyMC``'s ``cache`` setting.
+
+    ``None`` means the default cache if the ``TOYMC_DATASET_CACHE``
+    environment variable is ``1``, and no cache otherwise. ``True`` means
+    the default cache, and ``False`` no cache.
+
+    Returns
+    -------
+    :py:class:`DatasetCache` or None
+    """
+    if cache is None:
+        cache = os.environ.get("TOYMC_DATASET_CACHE", "") == "1"
+    if cache is True:
+        return DatasetCache()
+    if cache is False:
+        return None
+    return cache
+
+
+def fetch_run(mc, shard=None, required=("report",), refresh=False):
+    """Look up a run in its cache, putting the cached file at its ``outfile``.
+
+    Parameters
+    ----------
+    mc : :py:class:`toymc.ToyMC`
+        The run
+    shard : int, optional
+        As for :py:meth:`toymc.ToyMC.run`
+    required : iterable of str, optional
+        Only use an entry whose metadata has these keys. Default:
+        ``("report",)``.
+    refresh : bool, optional
+        If ``True``, remove the run's entry instead, so that the run is
+        generated and cached again. Default: ``False``.
+
+    Returns
+    -------
+    key : str or None
+        The run's cache key, or ``None`` if the run is not cached
+    metadata : dict or None
+        The cached metadata, if the run was found in the cache
+    """
+    cache = resolve(mc.cache)
+    if cache is None:
+        return None, None
+    key = dataset_key(mc, shard)
+    if key is None:
+        return None, None
+    if refresh:
+        cache.remove(key)
+        return key, None
+    start = time.perf_counter()
+    metadata = cache.fetch(key, mc.outfile, required)
+    if metadata is not None:
+        metadata["fetch_s"] = time.perf_counter() - start
+    return key, metadata
+
+
+def hit_report(mc, key, cached, workers=None):
+    """Return the run report for a run whose output was fetched from its cache.
+
+    The events, subtypes, counters and file size are those of the run
+    that generated the output, and the rest describes the fetch: the
+    wall time is the time taken to fetch the file, and the timing of
+    the stages and event types is empty.
+
+    Parameters
+    ----------
+    mc : :py:class:`toymc.ToyMC`
+        The run
+    key : str
+        The run's cache key
+    cached : dict
+        The metadata from :py:func:`fetch_run`
+    workers : int, optional
+        As for :py:meth:`toymc.ToyMC.run`
+
+    Returns
+    -------
+    dict
+        The run report, as described in :py:mod:`toymc.stats`
+    """
+    return dict(
+        cached["report"],
+        outfile=mc.outfile,
+        workers=workers,
+        wall_s=cached["fetch_s"],
+        cpu_s=None,
+        workers_cpu_s=None,
+        stages={},
+        event_types={
+            name: {"counters": entry["counters"]}
+            for name, entry in cached["report"]["event_types"].items()
+        },
+        peak_rss_mb=stats.peak_rss_mb(),
+        workers_peak_rss_mb=None,
+        cache={"key": key, "hit": True, "fetch_s": cached["fetch_s"]},
+    )
+
+
+def store_run(mc, key, metadata):
+    """Add a run's output file to its cache under ``key``, if it has one."""
+    cache = resolve(mc.cache)
+    if cache is not None and key is not None:
+        cache.store(key, mc.outfile, metadata)
@@ -0,0 +1,369 @@
+"""The Hall event type configures a whole experimental hall at once.
+
+A full Daya Bay configuration has 8 ADs in 3 experimental halls (EHs),
+each with its own singles and correlated-pair rates, and one muon flux
+per hall that is seen by the water pool and all of the hall's ADs.
+Rather than creating and labeling a :py:class:`~toymc.single.Single`
+and a :py:class:`~toymc.correlated.Correlated` object for every AD and
+process by hand, a :py:class:`Hall` creates them from rate tables::
+
+    >>> eh1 = Hall("EH1", 1, singles_Hz={1: 20, 2: 19.5}, muon_rate_Hz=200)
+    >>> eh1.add_correlated("IBD_nGd", 28000, {1: 0.007, 2: 0.0071})
+    >>> eh3 = Hall("EH3", 4, singles_Hz={1: 9, 2: 9, 3: 9, 4: 9}, muon_rate_Hz=11)
+    >>> eh3.add_correlated("IBD_nGd", 28000, {1: 8e-4, 2: 8e-4, 3: 8e-4, 4: 8e-4})
+    >>> next_label = eh1.assign_labels(0)
+    >>> next_label = eh3.assign_labels(next_label)
+    >>> toymc.add_event_type(eh1)
+    >>> toymc.add_event_type(eh3)
+
+The sources it creates are ordinary event type objects, available as
+:py:attr:`Hall.singles`, :py:attr:`Hall.correlated` and
+:py:attr:`Hall.muon`, and can be customized in the usual way (e.g.
+``eh1.singles[2].energy_spectrum = ...``). Their names, and so their
+truth labels, start with the hall's name, e.g. ``EH1_AD2_single`` or
+``EH1_AD1_IBD_nGd_prompt``. :py:meth:`Hall.assign_labels` numbers all of
+the hall's subevent types consecutively.
+
+There is a single :py:class:`~toymc.muon.Muon` per hall, whose AD and
+shower muons are distributed among all of the hall's ADs. The singles
+of all of the hall's ADs are generated together as one block, with one
+call to each distinct spectrum function for the whole hall, unless one
+of them is replaced by a subclass that overrides its event methods (see
+"Creating new event types" in :py:mod:`toymc`). By default, the singles
+of all ADs share the same spectrum functions, so replace them for each
+AD (rather than modifying a shared function) to give ADs different
+spectra.
+"""
+
+import numpy as np
+
+import toymc
+import toymc.util as util
+from toymc.correlated import Correlated
+from toymc.muon import Muon
+from toymc.single import Single
+
+
+class Hall(toymc.EventType):
+    """All of the event sources in one experimental hall.
+
+    Parameters
+    ----------
+    name : str
+        The human-readable name of the hall, e.g. ``"EH1"``, used as the
+        prefix of the names of all of its sources
+    site : number
+        The EH code for this hall (1, 2, or 4)
+    singles_Hz : dict
+        The singles rate of each AD in the hall, **in hertz**, keyed by
+        detector code (1, 2, 3, or 4)
+    muon_rate_Hz : number, optional
+        The rate of WP muons in the hall, **in hertz**. If not given,
+        the hall has no muons.
+
+    Attributes
+    ----------
+    singles : dict
+        The :py:class:`~toymc.single.Single` source of each AD, keyed by
+        detector code
+    correlated : dict
+        The :py:class:`~toymc.correlated.Correlated` sources, keyed by
+        ``(process name, detector code)``
+    muon : :py:class:`~toymc.muon.Muon` or None
+        The hall's muon source
+    """
+
+    def __init__(self, name, site, singles_Hz, muon_rate_Hz=None):
+        super().__init__(name)
+        self.site = site
+        self.singles = {
+            detector: Single(f"{name}_AD{detector}_single", rate_Hz, site, detector)
+            for detector, rate_Hz in sorted(singles_Hz.items())
+        }
+        # Share one set of (identical) default spectra among the ADs so
+        # that singles_batch calls each of them once for the whole hall
+        singles = list(self.singles.values())
+        for single in singles[1:]:
+            first = singles[0]
+            single.energy_spectrum = first.energy_spectrum
+            single.position_spectrum_mm = first.position_spectrum_mm
+        self.correlated = {}
+        self.muon = None
+        if muon_rate_Hz is not None:
+            self.muon = Muon(f"{name}_muon", site, muon_rate_Hz)
+        self.update_muon_ads()
+
+    def add_correlated(self, process, coincidence_ns, rates_Hz):
+        """Add a correlated-pair process to some or all of the hall's ADs.
+
+        Parameters
+        ----------
+        process : str
+            The name of the process, e.g. ``"IBD_nGd"``
+        coincidence_ns : number
+            The coincidence time scale, **in nanoseconds** (see
+            :py:class:`~toymc.correlated.Correlated`)
+        rates_Hz : dict
+            The pair rate in each AD, **in hertz**, keyed by detector code
+
+        Returns
+        -------
+        dict
+            The new :py:class:`~toymc.correlated.Correlated` sources,
+            keyed by detector code
+        """
+        sources = {}
+        for detector, rate_Hz in sorted(rates_Hz.items()):
+            if (process, detector) in self.correlated:
+                raise ValueError(f"{self.name} already has {process} in AD{detector}")
+            sources[detector] = Correlated(
+                f"{self.name}_AD{detector}_{process}",
+                self.site,
+                detector,
+                rate_Hz,
+                coincidence_ns,
+            )
+            self.correlated[process, detector] = sources[detector]
+        self.update_muon_ads()
+        return sources
+
+    @property
+    def detectors(self):
+        """The detector codes of all of the ADs with sources in this hall."""
+        detectors = set(self.singles)
+        detectors.update(detector for _, detector in self.correlated)
+        return tuple(sorted(detectors))
+
+    def update_muon_ads(self):
+        """Distribute the hall's AD and shower muons among all of its ADs."""
+        if self.muon is not None and self.detectors:
+            self.muon.avail_ads = self.detectors
+
+    def sources(self):
+        """Return all of the hall's sources: singles, correlated, then muon."""
+        sources = list(self.singles.values()) + list(self.correlated.values())
+        if self.muon is not None:
+            sources.append(self.muon)
+        return sources
+
+    def assign_labels(self, first=0):
+        """Number all of the hall's subevent types consecutively.
+
+        Parameters
+        ----------
+        first : int, optional
+            The first truth label number to use. Default: 0.
+
+        Returns
+        -------
+        int
+            The next unused number, to pass on to the next hall
+        """
+        number = first
+        for single in self.singles.values():
+            single.truth_label = number
+            number += 1
+        for correlated in self.correlated.values():
+            correlated.truth_label_prompt = number
+            correlated.truth_label_delayed = number + 1
+            number += 2
+        if self.muon is not None:
+            self.muon.truth_label_WP = number
+            self.muon.truth_label_AD = number + 1
+            self.muon.truth_label_shower = number + 2
+            number += 3
+        return number
+
+    def labels(self):
+        """Return the combined labels of all of the hall's sources.
+
+        Raises
+        ------
+        ValueError
+            If two sources use the same truth number or the same label
+        """
+        labels = {}
+        for source in self.sources():
+            for number, label in source.labels().items():
+                if number is not None and number in labels:
+                    raise ValueError(
+                        f"{self.name}: {source.name} uses truth number {number}, "
+                        f"which is already used for {labels[number]!r}"
+                    )
+                if label in labels.values():
+                    raise ValueError(
+                        f"{self.name}: more than one source has the label {label!r}"
+                    )
+                labels[number] = label
+        return labels
+
+    def event_count(self, rng, duration_s):
+        """Return the counts of all of the hall's sources.
+
+        This is an internal function and is not intended to be called
+        by users of the Toy Monte Carlo.
+
+        Returns
+        -------
+        tuple or None
+            The count of each source, in the order of
+            :py:meth:`Hall.sources`, or ``None`` if any source
+            determines its own number of events (e.g. a subclass of a
+            built-in event type that overrides ``generate_events``)
+        """
+        counts = tuple(source.event_count(rng, duration_s) for source in self.sources())
+        if any(count is None for count in counts):
+            return super().event_count(rng, duration_s)
+        return counts
+
+    def split_count(self, rng, count, durations_s):
+        """Divide the counts of all of the hall's sources among pieces of a run.
+
+        This is an internal function and is not intended to be called
+        by users of the Toy Monte Carlo.
+
+        Each source's count is divided with that source's own
+        :py:meth:`~toymc.EventType.split_count`.
+        """
+        if count is None:
+            return super().split_count(rng, count, durations_s)
+        per_source = [
+            source.split_count(rng, source_count, durations_s)
+            for source, source_count in zip(self.sources(), count)
+        ]
+        return [tuple(counts) for counts in zip(*per_source)]
+
+    def subtype_counts(self, count):
+        """Return the number of events of each subtype of all of the hall's sources.
+
+        This is an internal function and is not intended to be called
+        by users of the Toy Monte Carlo.
+
+        Returns ``None`` if any source cannot tell.
+        """
+        if count is None:
+            return super().subtype_counts(count)
+        counts = {}
+        for source, source_count in zip(self.sources(), count):
+            source_counts = source.subtype_counts(source_count)
+            if source_counts is None:
+                return None
+            counts.update(source_counts)
+        return counts
+
+    def generate_batch(self, rng, duration_s, t0_s, count=None):
+        """Generate the events of all of the hall's sources.
+
+        This is an internal function and is not intended to be called
+        by users of the Toy Monte Carlo.
+
+        The singles of all ADs are generated together by
+        :py:meth:`Hall.singles_batch`, and the correlated pairs and
+        muons by their sources' own ``generate_batch`` methods. If
+        given, ``count`` is a tuple as returned by
+        :py:meth:`Hall.event_count`. If any of the singles determines
+        its own number of events, each AD's singles are generated by
+        their own ``generate_batch`` instead.
+        """
+        sources = self.sources()
+        if count is None:
+            count = tuple(source.event_count(rng, duration_s) for source in sources)
+        n_singles = len(self.singles)
+        singles_counts = count[:n_singles]
+        if any(single_count is None for single_count in singles_counts):
+            batches = [
+                single.generate_batch(rng, duration_s, t0_s, single_count)
+                for single, single_count in zip(sources, singles_counts)
+            ]
+        else:
+            batches = [self.singles_batch(rng, duration_s, t0_s, singles_counts)]
+        for source, source_count in zip(sources[n_singles:], count[n_singles:]):
+            batches.append(source.generate_batch(rng, duration_s, t0_s, source_count))
+        return toymc.EventBatch.concatenate(batches)
+
+    def singles_batch(self, rng, duration_s, t0_s, counts):
+        """Generate the singles of all of the hall's ADs as one block.
+
+        This is an internal function and is not intended to be called
+        by users of the Toy Monte Carlo.
+
+        All of the timestamps are drawn at once, and each distinct
+        energy or position function (e.g. a spectrum shared by several
+        ADs) is called once for all of the ADs that use it. The other
+        quantities are the same as for
+        :py:meth:`Single.generate_batch <toymc.single.Single.generate_batch>`.
+
+        Parameters
+        ----------
+        counts : sequence of int
+            The number of singles in each AD, in the order of
+            :py:attr:`Hall.singles`
+        """
+        singles = list(self.singles.values())
+        counts = np.asarray(counts, dtype=np.int64)
+        total = int(counts.sum())
+        start_ns = int(1e9) * t0_s
+        end_ns = start_ns + int(1e9) * duration_s
+        timestamps = rng.integers(start_ns, end_ns, size=total)
+        bounds = np.concatenate([[0], np.cumsum(counts)])
+        energies = self.sample_grouped(
+            rng, [single.energy_spectrum for single in singles], bounds, ()
+        )
+        positions = self.sample_grouped(
+            rng, [single.position_spectrum_mm for single in singles], bounds, (3,)
+        )
+
+        def per_ad(attribute):
+            values = [getattr(single, attribute) for single in singles]
+            return np.repeat(values, counts)
+
+        return toymc.EventBatch.from_energies(
+            total,
+            energies,
+            positions,
+            truth_index=per_ad("truth_label"),
+            timestamp=timestamps,
+            detector=per_ad("detector"),
+            trigger_type=per_ad("trigger_type"),
+            site=self.site,
+        )
+
+    @staticmethod
+    def sample_grouped(rng, spectra, bounds, shape):
+        """Sample values for consecutive blocks, one call per distinct function.
+
+        This is an internal function and is not intended to be called
+        by users of the Toy Monte Carlo.
+
+        Parameters
+        ----------
+        rng : numpy.random.Generator
+            The random number generator to use
+        spectra : list of functions
+            The generator function for each block
+        bounds : numpy.ndarray
+            The start of each block, followed by the end of the last
+            one
+        shape : tuple
+            The shape of each value (``()`` for numbers, ``(3,)`` for
+            positions)
+
+        Returns
+        -------
+        numpy.ndarray
+            The values for all of the blocks, in order
+        """
+        values = np.empty((bounds[-1],) + shape)
+        groups = {}
+        for i, spectrum in enumerate(spectra):
+            groups.setdefault(id(spectrum), (spectrum, []))[1].append(i)
+        for spectrum, blocks in groups.values():
+            slices = [slice(bounds[i], bounds[i + 1]) for i in blocks]
+            size = sum(s.stop - s.start for s in slices)
+            sampled = util.sample(spectrum, rng, size).reshape((size,) + shape)
+            start = 0
+            for block in slices:
+                length = block.stop - block.start
+                values[block] = sampled[start : start + length]
+                start += length
+        return values
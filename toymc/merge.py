@@ -0,0 +1,258 @@
+"""Merging Toy MC output files into one time-ordered file.
+
+Event types are often generated separately, e.g. a large file of
+singles and a smaller file of IBDs, or as the shards of a job array
+(see :py:mod:`toymc.cli`). :py:func:`merge_files` combines any number of
+such files into one, with all events in timestamp order
+(``context.mTimeStamp`` in the ROOT trees)::
+
+    >>> merge_files(["singles.root", "ibd.root"], "combined.root")
+
+or, from the command line::
+
+    toymc-merge combined.root singles.root ibd.root
+
+The output format is chosen from the extension of the output file.
+``.root`` files are written with PyROOT, or with uproot if ROOT is not
+installed; pass ``--format`` (``output_format``) to choose explicitly.
+
+The inputs are read in chunks (see :py:mod:`toymc.readers`) and
+combined with the same k-way merge that the Toy MC uses for event
+types (:py:func:`toymc.batch.merge_sorted`), so memory use depends only
+on the number of inputs and the chunk size, not on the size of the
+files. Each event is read from, and written to, the reco, calib and
+``MCTruth`` trees together, so the trees stay aligned entry by entry.
+Events with identical timestamps are written in the order of the input
+files.
+
+The truth lookup tables of the inputs are combined. The same label may
+appear in several inputs (e.g. shards of one run), but only with the
+same number; anything else raises a :py:class:`LabelCollisionError`.
+"""
+
+import argparse
+import importlib.util
+import os
+import sys
+
+import numpy as np
+
+from toymc.batch import CHUNK_SIZE, merge_sorted
+from toymc.output import WRITERS, make_writer
+from toymc.readers import READERS, format_from_path, open_reader
+
+
+class LabelCollisionError(Exception):
+    """Raised when the truth lookup tables of files to be merged disagree.
+
+    Attributes
+    ----------
+    number : int
+        The truth number of the colliding entry
+    label : str
+        The text label of the colliding entry
+    existing : (int, str)
+        The ``(number, label)`` entry it collides with
+    infile : str
+        The file containing the colliding entry
+    """
+
+    def __init__(self, number, label, existing, infile):
+        self.number = number
+        self.label = label
+        self.existing = existing
+        self.infile = infile
+        super().__init__(repr(self))
+
+    def __repr__(self):
+        return (
+            f"{self.__class__.__qualname__}(number={self.number!r}, "
+            f"label={self.label!r}, existing={self.existing!r}, "
+            f"infile={self.infile!r})"
+        )
+
+
+def union_labels(readers):
+    """Combine the truth lookup tables of the given readers.
+
+    Parameters
+    ----------
+    readers : list of :py:class:`toymc.readers.Reader`
+        The readers for the input files
+
+    Returns
+    -------
+    labels : dict
+        The combined lookup table mapping numbers to text labels
+
+    Raises
+    ------
+    :py:class:`LabelCollisionError`
+        If a number is used for different labels, or a label for
+        different numbers
+    """
+    labels = {}
+    numbers = {}
+    for reader in readers:
+        for number, label in sorted(reader.labels.items()):
+            if number in labels and labels[number] != label:
+                existing = (number, labels[number])
+                raise LabelCollisionError(number, label, existing, reader.infile)
+            if label in numbers and numbers[label] != number:
+                existing = (numbers[label], label)
+                raise LabelCollisionError(number, label, existing, reader.infile)
+            labels[number] = label
+            numbers[label] = number
+    return labels
+
+
+def checked_stream(reader):
+    """Iterate over a reader's chunks, checking that they are in time order.
+
+    Raises
+    ------
+    ValueError
+        If the file's events are not in timestamp order
+    """
+    last = None
+    for batch in reader:
+        timestamps = batch["timestamp"]
+        if len(timestamps) == 0:
+            continue
+        if (last is not None and timestamps[0] < last) or np.any(
+            timestamps[1:] < timestamps[:-1]
+        ):
+            raise ValueError(
+                f"The events in {reader.infile!r} are not in timestamp order"
+            )
+        last = timestamps[-1]
+        yield batch
+
+
+def merge_files(
+    infiles,
+    outfile,
+    output_format=None,
+    input_format=None,
+    *,
+    reco_name="AdSimpleNL",
+    calib_name="CalibStats",
+    chunk_size=CHUNK_SIZE,
+):
+    """Merge output files into one file with all events in timestamp order.
+
+    The output is written to ``outfile + ".partial"`` and renamed to
+    ``outfile`` once it is complete, so a merge that fails or is
+    interrupted does not leave a truncated ``outfile`` behind.
+
+    Parameters
+    ----------
+    infiles : list of str
+        The files to merge. The events in each file must be in
+        timestamp order, as in any file written by the Toy MC.
+    outfile : str
+        The file to write
+    output_format : str, optional
+        One of the keys of :py:data:`toymc.output.WRITERS`. Default:
+        determined from the extension of ``outfile`` (for ``.root``
+        files, ``"root"`` if PyROOT is installed and ``"uproot"``
+        otherwise).
+    input_format : str, optional
+        One of the keys of :py:data:`toymc.readers.READERS`, used for all
+        inputs. Default: determined from each input's extension.
+    reco_name, calib_name : str, optional
+        The names of the reco and calib TTrees, for both the inputs and
+        the output
+    chunk_size : int, optional
+        The number of events to read from each input at a time
+
+    Returns
+    -------
+    int
+        The number of events written
+    """
+    if output_format is None:
+        output_format = format_from_path(outfile)
+        if output_format == "root" and importlib.util.find_spec("ROOT") is None:
+            output_format = "uproot"
+    partial = outfile + ".partial"
+    readers = []
+    try:
+        for infile in infiles:
+            readers.append(
+                open_reader(infile, input_format, reco_name, calib_name, chunk_size)
+            )
+        labels = union_labels(readers)
+        writer = make_writer(output_format, partial, reco_name, calib_name)
+        try:
+            writer.begin(labels)
+            count = 0
+            for batch in merge_sorted([checked_stream(reader) for reader in readers]):
+                writer.add_batch(batch)
+                count += len(batch)
+        except BaseException:
+            writer.abort()
+            raise
+        writer.close()
+        os.replace(partial, outfile)
+    except BaseException:
+        if os.path.exists(partial):
+            os.remove(partial)
+        raise
+    finally:
+        for reader in readers:
+            reader.close()
+    return count
+
+
+def main(argv=None):
+    """Run the ``toymc-merge`` command."""
+    parser = argparse.ArgumentParser(
+        prog="toymc-merge",
+        description="Merge Toy MC output files into one time-ordered file",
+    )
+    parser.add_argument("outfile")
+    parser.add_argument("infiles", nargs="+")
+    parser.add_argument(
+        "--format",
+        choices=sorted(WRITERS),
+        help="output format (default: by extension)",
+    )
+    parser.add_argument(
+        "--input-format",
+        choices=sorted(READERS),
+        help="input format (default: by extension)",
+    )
+    parser.add_argument("--reco-name", default="AdSimpleNL")
+    parser.add_argument("--calib-name", default="CalibStats")
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=CHUNK_SIZE,
+        help="events to read from each input at a time",
+    )
+    args = parser.parse_args(argv)
+    try:
+        count = merge_files(
+            args.infiles,
+            args.outfile,
+            args.format,
+            args.input_format,
+            reco_name=args.reco_name,
+            calib_name=args.calib_name,
+            chunk_size=args.chunk_size,
+        )
+    except (LabelCollisionError, ValueError) as error:
+        parser.exit(1, f"toymc-merge: error: {error}\n")
+    except ImportError as error:
+        parser.exit(
+            1,
+            f"toymc-merge: error: {error}; install it, or choose another output "
+            "format with --format (e.g. --format uproot for ROOT files)\n",
+        )
+    print(f"Wrote {count} events to {args.outfile}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
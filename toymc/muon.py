@@ -41,9 +41,19 @@ signature and return energies, not nHits.
 Lastly, :py:attr:`~Muon.avail_ads` is a tuple specifying which AD
 detector values (1, 2, 3, and/or 4) are available when randomly choosing
 which AD will get a given AD muon or shower muon.
+
+:py:meth:`Muon.generate_batch` generates each of the 3 subtypes as a
+single block, drawing all nHit values, AD assignments and energies at
+once. As with the other event types, the spectrum functions are used
+most efficiently if they are marked with
+:py:func:`toymc.util.vectorized` and accept an optional ``size``
+argument. The defaults are vectorized.
 """
 
+import numpy as np
+
 import toymc
+import toymc.util as util
 
 
 class Muon(toymc.EventType):
@@ -79,13 +89,14 @@ class Muon(toymc.EventType):
         shower muon event
     WP_nHit_spectrum : function(rng) -> int
         The generator for determining the nHit value for WP events.
-        Default: uniform integer between 15 and 100, inclusive.
+        Default: uniform integer between 15 and 100, inclusive
+        (vectorized).
     ADMuon_energy_spectrum : function(rng) -> number
         The AD muon energy generator function. Default: uniform
-        between 20 and 2000.
+        between 20 and 2000 (vectorized).
     shower_energy_spectrum : function(rng) -> number
         The shower muon energy generator function. Default: uniform
-        between 2500 and 5000.
+        between 2500 and 5000 (vectorized).
     avail_ads : tuple
         The available ADs (1, 2, 3, and/or 4) to choose between when
         determining which AD gets any given AD muon or shower muon.
@@ -93,6 +104,17 @@ class Muon(toymc.EventType):
         Error if any other site is given.
     """
 
+    EVENT_METHODS = (
+        "generate_events",
+        "new_WP_event",
+        "new_AD_event",
+        "new_shower_event",
+        "WP_physical_quantities",
+        "AD_muon_physical_quantities",
+        "shower_muon_physical_quantities",
+    )
+    """The methods that :py:meth:`Muon.generate_batch` replaces."""
+
     def __init__(self, name, site, rate_Hz):
         super().__init__(name)
         self.truth_label_WP = None
@@ -106,9 +128,15 @@ class Muon(toymc.EventType):
         self.prob_WP_and_shower = 0.0005
         self.WP_detector = 6
         self.trigger_type = 0x10001100
-        self.WP_nHit_spectrum = lambda rng: rng.integers(15, 100)
-        self.ADMuon_energy_spectrum = lambda rng: rng.uniform(20, 2000)
-        self.shower_energy_spectrum = lambda rng: rng.uniform(2500, 5000)
+        self.WP_nHit_spectrum = util.vectorized(
+            lambda rng, size=None: rng.integers(15, 100, size)
+        )
+        self.ADMuon_energy_spectrum = util.vectorized(
+            lambda rng, size=None: rng.uniform(20, 2000, size)
+        )
+        self.shower_energy_spectrum = util.vectorized(
+            lambda rng, size=None: rng.uniform(2500, 5000, size)
+        )
 
     def generate_events(self, rng, duration_s, t0_s):
         """Generate muon events over the given duration.
@@ -139,6 +167,132 @@ class Muon(toymc.EventType):
             events.append(shower_event)
         return events
 
+    def generate_batch(self, rng, duration_s, t0_s, count=None):
+        """Generate muon events over the given duration.
+
+        This is an internal function and is not intended to be called
+        by users of the Toy Monte Carlo.
+
+        This is the array version of :py:meth:`Muon.generate_events`.
+        The WP, AD muon and shower muon events are each generated as a
+        single block, with the same subevent counts and truth labels.
+
+        If given, ``count`` is a tuple of the number of WP muons, AD
+        muons and shower muons, as returned by :py:meth:`Muon.event_count`.
+
+        Subclasses that override :py:meth:`Muon.generate_events` or the
+        methods it uses to make each event (the ``new_*_event`` and
+        ``*_physical_quantities`` methods) are generated with those
+        methods instead.
+        """
+        if self.overrides(Muon, Muon.EVENT_METHODS):
+            return super().generate_batch(rng, duration_s, t0_s, count)
+        if count is None:
+            count = self.event_count(rng, duration_s)
+        actual_number, number_admuons, number_showermuons = count
+        duration_ns = int(1e9) * duration_s
+        start_ns = int(1e9) * t0_s
+        end_ns = start_ns + duration_ns
+        times_WP = rng.integers(start_ns, end_ns, size=actual_number)
+        ad_delay = 50
+        wp_events = toymc.EventBatch.from_columns(
+            actual_number,
+            truth_index=self.truth_label_WP,
+            trigger_number=1,
+            timestamp=times_WP,
+            detector=self.WP_detector,
+            trigger_type=self.trigger_type,
+            site=self.site,
+            nHit=util.sample(self.WP_nHit_spectrum, rng, actual_number),
+        )
+        avail_ads = np.asarray(self.avail_ads)
+        times_AD = times_WP[:number_admuons] + ad_delay
+        ad_events = self.new_AD_batch(
+            self.truth_label_AD,
+            times_AD,
+            rng.choice(avail_ads, size=number_admuons),
+            util.sample(self.ADMuon_energy_spectrum, rng, number_admuons),
+        )
+        last_shower = number_admuons + number_showermuons
+        times_shower = times_WP[number_admuons:last_shower] + ad_delay
+        shower_events = self.new_AD_batch(
+            self.truth_label_shower,
+            times_shower,
+            rng.choice(avail_ads, size=number_showermuons),
+            util.sample(self.shower_energy_spectrum, rng, number_showermuons),
+        )
+        return toymc.EventBatch.concatenate([wp_events, ad_events, shower_events])
+
+    def event_count(self, rng, duration_s):
+        """Return the numbers of WP, AD and shower muons for the given duration.
+
+        This is an internal function and is not intended to be called
+        by users of the Toy Monte Carlo.
+
+        Returns
+        -------
+        (int, int, int)
+            The number of WP muons, and how many of those also cause an
+            AD muon or a shower muon event, or ``None`` for subclasses
+            that are generated with :py:meth:`Muon.generate_events` (see
+            :py:meth:`Muon.generate_batch`)
+        """
+        if self.overrides(Muon, Muon.EVENT_METHODS):
+            return super().event_count(rng, duration_s)
+        actual_number = self.actual_event_count(rng, duration_s, self.rate_hz)
+        number_admuons = int(actual_number * self.prob_WP_and_AD)
+        number_showermuons = int(actual_number * self.prob_WP_and_shower)
+        return (actual_number, number_admuons, number_showermuons)
+
+    def split_count(self, rng, count, durations_s):
+        """Divide a count from :py:meth:`Muon.event_count` among pieces of a run.
+
+        This is an internal function and is not intended to be called
+        by users of the Toy Monte Carlo.
+
+        The WP muons are divided among the pieces as for any other event
+        type. Since the WP muons that cause AD or shower muons are a
+        random subset of all WP muons, the AD and shower muons are then
+        divided among the pieces by sampling without replacement
+        (a multivariate hypergeometric distribution).
+        """
+        if count is None:
+            return super().split_count(rng, count, durations_s)
+        actual_number, number_admuons, number_showermuons = count
+        wp_counts = super().split_count(rng, actual_number, durations_s)
+        remaining = np.array(
+            [
+                number_admuons,
+                number_showermuons,
+                actual_number - number_admuons - number_showermuons,
+            ]
+        )
+        counts = []
+        for wp_count in wp_counts:
+            ad_count, shower_count, _ = rng.multivariate_hypergeometric(
+                remaining, wp_count
+            )
+            remaining -= (ad_count, shower_count, wp_count - ad_count - shower_count)
+            counts.append((wp_count, int(ad_count), int(shower_count)))
+        return counts
+
+    def subtype_counts(self, count):
+        """Return the numbers of WP, AD and shower muons for a count.
+
+        This is an internal function and is not intended to be called
+        by users of the Toy Monte Carlo.
+
+        ``count`` is a tuple from :py:meth:`Muon.event_count`.
+        """
+        if count is None:
+            return super().subtype_counts(count)
+        actual_number, number_admuons, number_showermuons = count
+        return {
+            self.truth_label_WP: actual_number,
+            self.truth_label_AD: number_admuons,
+            self.truth_label_shower: number_showermuons,
+        }
+
     def labels(self):
         """Return a labels dict with the values noted in the class
         docstring."""
@@ -148,6 +302,27 @@ class Muon(toymc.EventType):
             self.truth_label_shower: self.name + "_shower",
         }
 
+    def new_AD_batch(self, truth_label, timestamps, detectors, energies):
+        """Assemble an EventBatch of AD or shower muon events from arrays.
+
+        This is an internal function and is not intended to be called
+        by users of the Toy Monte Carlo.
+
+        The remaining physical quantities are filled with the same
+        constant values used by
+        :py:meth:`Muon.AD_muon_physical_quantities` and
+        :py:meth:`Muon.shower_muon_physical_quantities`.
+        """
+        return toymc.EventBatch.from_energies(
+            len(timestamps),
+            energies,
+            truth_index=truth_label,
+            timestamp=timestamps,
+            detector=detectors,
+            trigger_type=self.trigger_type,
+            site=self.site,
+        )
+
     def new_WP_event(self, rng, timestamp):
         """Generate a new WP Muon event with the given timestamp.
 
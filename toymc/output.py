@@ -0,0 +1,970 @@
+"""Writing Toy MC events to output files.
+
+The output consists of 4 TTrees:
+
+- ``/Event/Rec/<reco_name>``, holding the reconstructed quantities
+  (:py:data:`RECO_BRANCHES`)
+- ``/Event/Data/<calib_name>``, holding the calibrated statistics
+  (:py:data:`CALIB_BRANCHES`)
+- ``/MCTruth``, holding the truth label of each event
+  (:py:data:`TRUTH_BRANCHES`)
+- ``/MCTruthLookup``, the lookup table for the truth labels
+
+The first 3 TTrees have one entry per event, in the same order.
+
+ROOT, root_util and the other libraries needed by each backend are only
+imported when that backend is used.
+
+Each ``*_BRANCHES`` table lists the TBranches of a TTree as tuples of
+``(branch name, source field, NumPy dtype)``. The source field is either
+the name of an :py:class:`~toymc.Event` field or one of
+``"timestamp_seconds"`` and ``"timestamp_nanoseconds"``, which are
+derived from the event timestamp. The dtypes correspond to the TBranch
+leaf types.
+
+Output backends
+---------------
+
+The output file is written by a :py:class:`Writer`. The available
+backends are listed in :py:data:`WRITERS` and selected with the
+``output_format`` argument of :py:class:`~toymc.ToyMC`:
+
+- ``"root"`` (:py:class:`RootWriter`, the default) uses PyROOT
+- ``"uproot"`` (:py:class:`UprootWriter`) uses the pure-Python
+  `uproot <https://github.com/scikit-hep/uproot5>`_ package, so ROOT
+  does not need to be installed
+
+For analysis code based on NumPy or pandas, there are also backends that
+write the events as plain columns (one per :py:class:`~toymc.Event`
+field, including ``truth_index``) along with the truth lookup table:
+
+- ``"parquet"`` (:py:class:`ParquetWriter`) uses pyarrow
+- ``"hdf5"`` (:py:class:`HDF5Writer`) uses h5py
+- ``"npz"`` (:py:class:`NpzWriter`) needs only NumPy
+
+All backends write events as they are generated, so memory use does
+not grow with the run length.
+
+To add a new backend, subclass :py:class:`Writer` and add it to
+:py:data:`WRITERS`.
+"""
+
+from abc import ABC, abstractmethod
+import contextlib
+import json
+import os
+import shutil
+import tempfile
+import zipfile
+
+import numpy as np
+
+
+import toymc
+from toymc.batch import CHUNK_SIZE, EVENT_DTYPE, EventBatch
+
+RECO_BRANCHES = (
+    ("context.mSite", "site", np.int32),
+    ("triggerType", "trigger_type", np.uint32),
+    ("energy", "energy", np.float32),
+    ("x", "x", np.float32),
+    ("y", "y", np.float32),
+    ("z", "z", np.float32),
+)
+"""The TBranches of the reco (~AdSimple) TTree."""
+
+CALIB_BRANCHES = (
+    ("triggerNumber", "trigger_number", np.int32),
+    ("context.mTimeStamp.mSec", "timestamp_seconds", np.int32),
+    ("context.mTimeStamp.mNanoSec", "timestamp_nanoseconds", np.int32),
+    ("context.mDetId", "detector", np.int32),
+    ("nHit", "nHit", np.int32),
+    ("NominalCharge", "charge", np.float32),
+    ("Quadrant", "fQuad", np.float32),
+    ("MaxQ", "fMax", np.float32),
+    ("time_PSD", "fPSD_t1", np.float32),
+    ("time_PSD1", "fPSD_t2", np.float32),
+    ("MaxQ_2inchPMT", "f2inch_maxQ", np.float32),
+)
+"""The TBranches of the calib (~CalibStats) TTree."""
+
+TRUTH_BRANCHES = (("truth_index", "truth_index", np.uint32),)
+"""The TBranches of the MCTruth TTree."""
+
+
+def branch_columns(batch, branches):
+    """Get the values to fill into each TBranch for a batch of events.
+
+    Parameters
+    ----------
+    batch : :py:class:`~toymc.EventBatch`
+        The events
+    branches : tuple
+        One of the ``*_BRANCHES`` tables
+
+    Returns
+    -------
+    list of (str, numpy.ndarray)
+        The branch name and a contiguous array of values (with the
+        branch's dtype) for each branch, in the order of ``branches``
+    """
+    seconds, nanoseconds = np.divmod(batch["timestamp"], 1000000000)
+    derived = {"timestamp_seconds": seconds, "timestamp_nanoseconds": nanoseconds}
+    columns = []
+    for branch, field, dtype in branches:
+        values = derived[field] if field in derived else batch[field]
+        columns.append((branch, np.ascontiguousarray(values, dtype=dtype)))
+    return columns
+
+
+def collect_labels(event_types):
+    """Build the truth lookup table for the given event types.
+
+    Parameters
+    ----------
+    event_types : list of :py:class:`~toymc.EventType`
+        The event types whose :py:meth:`~toymc.EventType.labels` should
+        be included
+
+    Returns
+    -------
+    labels : dict
+        The lookup table mapping each truth number to its text label
+
+    Raises
+    ------
+    :py:class:`~toymc.InvalidLookupError`
+        If any number is not a non-negative integer, or is used for more
+        than one label
+    """
+    labels = {}
+    for event_type in event_types:
+        event_labels = event_type.labels()
+        for number, label in event_labels.items():
+            if number is None or number < 0 or not isinstance(number, int):
+                raise toymc.InvalidLookupError(event_type.name, label, number)
+            if number in labels:
+                raise toymc.InvalidLookupError(event_type.name, label, number)
+            labels[number] = label
+    return labels
+
+
+class Writer(ABC):
+    """The base class for output backends.
+
+    A writer is used in 3 steps: the constructor creates the output
+    file, :py:meth:`begin` creates the output TTrees (or their
+    equivalent), and then :py:meth:`add_batch` is called for each batch
+    of events, in timestamp order. Finally, :py:meth:`close` finishes
+    writing and closes the file. If writing fails part way,
+    :py:meth:`abort` closes and removes the incomplete file instead.
+
+    Parameters
+    ----------
+    outfile : str
+        The file name/location for the output file
+    reco_name : str
+        The name of the reconstructed data TTree
+    calib_name : str
+        The name of the calibrated statistics TTree
+    """
+
+    def __init__(self, outfile, reco_name, calib_name):
+        self.outfile = outfile
+        self.reco_name = reco_name
+        self.calib_name = calib_name
+
+    @abstractmethod
+    def begin(self, labels):
+        """Create the output data structures.
+
+        Parameters
+        ----------
+        labels : dict
+            The truth lookup table mapping numbers to text labels, as
+            returned by :py:func:`collect_labels`
+        """
+
+    @abstractmethod
+    def add_batch(self, batch):
+        """Write the given events to the output.
+
+        Parameters
+        ----------
+        batch : :py:class:`~toymc.EventBatch`
+            The events to write, in timestamp order
+        """
+
+    @abstractmethod
+    def close(self):
+        """Finish writing and close the output file."""
+
+    def abort(self):
+        """Stop writing after an error and remove the incomplete output file.
+
+        Backends that hold open files or temporary files should release
+        them and then call this method.
+        """
+        if os.path.exists(self.outfile):
+            os.remove(self.outfile)
+
+
+class RootWriter(Writer):
+    """Output backend writing a ROOT file with PyROOT.
+
+    The TTrees are filled by :py:class:`MCOutput`.
+    """
+
+    def __init__(self, outfile, reco_name, calib_name):
+        from ROOT import TFile  # pylint: disable=no-name-in-module
+
+        super().__init__(outfile, reco_name, calib_name)
+        self.file = TFile(outfile, "RECREATE")
+        self.output = None
+
+    def begin(self, labels):
+        """Create the output TTrees using :py:class:`MCOutput`."""
+        self.output = MCOutput(self.file, self.reco_name, self.calib_name, labels)
+
+    def add_batch(self, batch):
+        """Fill the given events into the TTrees."""
+        self.output.add_batch(batch)
+
+    def close(self):
+        """Write and close the ROOT file."""
+        self.file.Write()
+        self.file.Close()
+
+    def abort(self):
+        """Close the ROOT file without writing the TTrees and remove it."""
+        self.file.Close()
+        super().abort()
+
+
+class BufferedWriter(Writer):
+    """Base class for backends that write events in large blocks.
+
+    Batches passed to :py:meth:`add_batch` are collected until at least
+    ``basket_size`` events are waiting, and then passed together to
+    :py:meth:`write_batch`.
+
+    Parameters
+    ----------
+    basket_size : int, optional
+        The minimum number of events per block. Default:
+        :py:data:`toymc.batch.CHUNK_SIZE`.
+    """
+
+    def __init__(self, outfile, reco_name, calib_name, basket_size=CHUNK_SIZE):
+        super().__init__(outfile, reco_name, calib_name)
+        self.basket_size = basket_size
+        self.pending = []
+        self.pending_size = 0
+
+    def add_batch(self, batch):
+        """Buffer the given events, writing a block once enough are buffered."""
+        self.pending.append(batch)
+        self.pending_size += len(batch)
+        if self.pending_size >= self.basket_size:
+            self.flush()
+
+    def flush(self):
+        """Write all buffered events as one block."""
+        if self.pending_size == 0:
+            return
+        self.write_batch(EventBatch.concatenate(self.pending))
+        self.pending = []
+        self.pending_size = 0
+
+    def close(self):
+        """Write any buffered events and close the file."""
+        self.flush()
+        self.finish()
+
+    @abstractmethod
+    def write_batch(self, batch):
+        """Write one block of events to the file."""
+
+    @abstractmethod
+    def finish(self):
+        """Close the file once all events have been written."""
+
+
+class UprootWriter(BufferedWriter):
+    """Output backend writing a ROOT file with uproot.
+
+    The TTrees have the same paths, names, titles, branch names and
+    branch types as those written by :py:class:`RootWriter`, except for
+    the ``_<number>`` branches of ``MCTruthLookup``, which hold the text
+    labels as null-terminated ``Char_t`` arrays rather than C strings.
+    If the run has no truth labels, ``MCTruthLookup`` is not written,
+    since uproot cannot write a TTree without branches.
+
+    Events are written in baskets of at least ``basket_size`` entries
+    (see :py:class:`BufferedWriter`).
+    """
+
+    def __init__(self, outfile, reco_name, calib_name, basket_size=CHUNK_SIZE):
+        import uproot  # pylint: disable=import-outside-toplevel
+
+        super().__init__(outfile, reco_name, calib_name, basket_size)
+        self.file = uproot.recreate(outfile)
+        self.trees = []
+
+    def begin(self, labels):
+        """Create the output TTrees and fill the lookup table."""
+        event_dir = self.file.mkdir("Event")
+        rec_dir = event_dir.mkdir("Rec")
+        data_dir = event_dir.mkdir("Data")
+        reco = rec_dir.mktree(
+            self.reco_name,
+            {name: dtype for name, _, dtype in RECO_BRANCHES},
+            title=f"Tree at /Event/Rec/{self.reco_name} holding Rec_{self.reco_name}",
+        )
+        calib = data_dir.mktree(
+            self.calib_name,
+            {name: dtype for name, _, dtype in CALIB_BRANCHES},
+            title=f"Tree at /Event/Data/{self.calib_name} holding Data_{self.calib_name}",
+        )
+        truth = self.file.mktree(
+            "MCTruth",
+            {name: dtype for name, _, dtype in TRUTH_BRANCHES},
+            title="Monte Carlo Truth information for each entry",
+        )
+        self.trees = [
+            (reco, RECO_BRANCHES),
+            (calib, CALIB_BRANCHES),
+            (truth, TRUTH_BRANCHES),
+        ]
+        if not labels:
+            return
+        buf_size = max(len(label) for label in labels.values()) + 1
+        label_type = np.dtype((np.int8, (buf_size,)))
+        lookup_types = {}
+        lookup = {}
+        for number, label in sorted(labels.items(), key=lambda item: item[1]):
+            lookup_types[label] = np.uint32
+            lookup[label] = np.array([number], dtype=np.uint32)
+        for number, label in sorted(labels.items()):
+            name = f"_{number}"
+            lookup_types[name] = label_type
+            padded = label.encode().ljust(buf_size, b"\0")
+            lookup[name] = np.frombuffer(padded, dtype=np.int8).reshape(1, buf_size)
+        lookup_tree = self.file.mktree(
+            "MCTruthLookup", lookup_types, title="Monte Carlo Truth lookup table"
+        )
+        lookup_tree.extend(lookup)
+
+    def write_batch(self, batch):
+        """Write one basket per TBranch."""
+        for tree, branches in self.trees:
+            tree.extend(dict(branch_columns(batch, branches)))
+
+    def finish(self):
+        """Close the file."""
+        self.file.close()
+
+    def abort(self):
+        """Close the file and remove it."""
+        self.file.close()
+        super().abort()
+
+
+def lookup_table(labels):
+    """Convert a truth lookup table to a structured array.
+
+    This is how the columnar backends (:py:class:`ParquetWriter`,
+    :py:class:`HDF5Writer` and :py:class:`NpzWriter`) store the lookup
+    table.
+
+    Parameters
+    ----------
+    labels : dict
+        The truth lookup table mapping numbers to text labels
+
+    Returns
+    -------
+    numpy.ndarray
+        A structured array with fields ``number`` (``uint32``) and
+        ``label`` (bytes), sorted by number
+    """
+    max_label_length = max([len(label) for label in labels.values()] + [1])
+    dtype = np.dtype([("number", np.uint32), ("label", f"S{max_label_length}")])
+    return np.array(
+        [(number, label.encode()) for number, label in sorted(labels.items())],
+        dtype=dtype,
+    )
+
+
+class ParquetWriter(BufferedWriter):
+    """Output backend writing a Parquet file with pyarrow.
+
+    The file holds one column per :py:class:`~toymc.Event` field (see
+    :py:data:`toymc.batch.EVENT_DTYPE`), with one row per event in
+    timestamp order and one row group per block of ``basket_size``
+    events. The truth lookup table is stored as JSON in the file's
+    key-value metadata under the key ``toymc.truth_lookup``, mapping
+    each number (as a string) to its label.
+
+    The ``reco_name`` and ``calib_name`` parameters are not used.
+    """
+
+    def __init__(self, outfile, reco_name, calib_name, basket_size=CHUNK_SIZE):
+        import pyarrow  # pylint: disable=import-outside-toplevel
+
+        super().__init__(outfile, reco_name, calib_name, basket_size)
+        self.pyarrow = pyarrow
+        fields = [
+            (name, pyarrow.from_numpy_dtype(EVENT_DTYPE[name]))
+            for name in EVENT_DTYPE.names
+        ]
+        self.schema = pyarrow.schema(fields)
+        self.file = None
+
+    def begin(self, labels):
+        """Open the file with the lookup table in its metadata."""
+        import pyarrow.parquet  # pylint: disable=import-outside-toplevel
+
+        lookup = {str(number): label for number, label in sorted(labels.items())}
+        self.schema = self.schema.with_metadata(
+            {"toymc.truth_lookup": json.dumps(lookup)}
+        )
+        self.file = pyarrow.parquet.ParquetWriter(self.outfile, self.schema)
+
+    def write_batch(self, batch):
+        """Write one row group."""
+        columns = [self.pyarrow.array(batch[name]) for name in EVENT_DTYPE.names]
+        table = self.pyarrow.Table.from_arrays(columns, schema=self.schema)
+        self.file.write_table(table, row_group_size=len(batch))
+
+    def finish(self):
+        """Close the file."""
+        self.file.close()
+
+    def abort(self):
+        """Close the file, if it was opened, and remove it."""
+        if self.file is not None:
+            self.file.close()
+        super().abort()
+
+
+class HDF5Writer(BufferedWriter):
+    """Output backend writing an HDF5 file with h5py.
+
+    The file holds one dataset per :py:class:`~toymc.Event` field in
+    the ``/events`` group, with one entry per event in timestamp order.
+    The datasets are chunked (``basket_size`` entries per chunk) and
+    gzip-compressed, and are extended as events are written. The truth
+    lookup table is stored in the ``/truth_lookup`` dataset (see
+    :py:func:`lookup_table`).
+
+    The ``reco_name`` and ``calib_name`` parameters are not used.
+    """
+
+    def __init__(self, outfile, reco_name, calib_name, basket_size=CHUNK_SIZE):
+        import h5py  # pylint: disable=import-outside-toplevel
+
+        super().__init__(outfile, reco_name, calib_name, basket_size)
+        self.file = h5py.File(outfile, "w")
+        self.datasets = {}
+
+    def begin(self, labels):
+        """Create the event datasets and write the lookup table."""
+        events = self.file.create_group("events")
+        for name in EVENT_DTYPE.names:
+            self.datasets[name] = events.create_dataset(
+                name,
+                shape=(0,),
+                maxshape=(None,),
+                dtype=EVENT_DTYPE[name],
+                chunks=(self.basket_size,),
+                compression="gzip",
+                shuffle=True,
+            )
+        self.file.create_dataset("truth_lookup", data=lookup_table(labels))
+
+    def write_batch(self, batch):
+        """Append the events to every dataset."""
+        for name, dataset in self.datasets.items():
+            start = len(dataset)
+            dataset.resize((start + len(batch),))
+            dataset[start:] = batch[name]
+
+    def finish(self):
+        """Close the file."""
+        self.file.close()
+
+    def abort(self):
+        """Close the file and remove it."""
+        self.file.close()
+        super().abort()
+
+
+class NpzWriter(BufferedWriter):
+    """Output backend writing a NumPy ``.npz`` archive.
+
+    The archive holds one array per :py:class:`~toymc.Event` field,
+    named after the field, with one entry per event in timestamp order,
+    plus the ``truth_lookup`` array (see :py:func:`lookup_table`). It
+    can be read with ``numpy.load``.
+
+    Since the length of each array must be known before it can be
+    stored in the archive, the columns are first streamed to temporary
+    files next to the output file and then copied into the archive by
+    :py:meth:`close`, so memory use does not grow with the run length.
+
+    The ``reco_name`` and ``calib_name`` parameters are not used.
+    """
+
+    def __init__(self, outfile, reco_name, calib_name, basket_size=CHUNK_SIZE):
+        super().__init__(outfile, reco_name, calib_name, basket_size)
+        self.tempdir = tempfile.mkdtemp(
+            prefix=".toymc-", dir=os.path.dirname(os.path.abspath(outfile))
+        )
+        self.exit_stack = contextlib.ExitStack()
+        self.column_files = {
+            name: self.exit_stack.enter_context(
+                open(os.path.join(self.tempdir, name), "wb")
+            )
+            for name in EVENT_DTYPE.names
+        }
+        self.size = 0
+        self.labels = None
+
+    def begin(self, labels):
+        """Save the lookup table to be written at the end."""
+        self.labels = labels
+
+    def write_batch(self, batch):
+        """Append the events to the temporary column files."""
+        for name, column_file in self.column_files.items():
+            column_file.write(np.ascontiguousarray(batch[name]).tobytes())
+        self.size += len(batch)
+
+    def finish(self):
+        """Assemble the archive and remove the temporary files."""
+        with zipfile.ZipFile(self.outfile, "w", allowZip64=True) as archive:
+            for name, column_file in self.column_files.items():
+                column_file.close()
+                header = {
+                    "descr": np.lib.format.dtype_to_descr(EVENT_DTYPE[name]),
+                    "fortran_order": False,
+                    "shape": (self.size,),
+                }
+                with archive.open(name + ".npy", "w", force_zip64=True) as member:
+                    np.lib.format.write_array_header_2_0(member, header)
+                    with open(column_file.name, "rb") as source:
+                        shutil.copyfileobj(source, member)
+            with archive.open("truth_lookup.npy", "w") as member:
+                np.save(member, lookup_table(self.labels))
+        shutil.rmtree(self.tempdir)
+
+    def abort(self):
+        """Remove the temporary column files and any partial archive."""
+        self.exit_stack.close()
+        shutil.rmtree(self.tempdir, ignore_errors=True)
+        super().abort()
+
+
+WRITERS = {
+    "root": RootWriter,
+    "uproot": UprootWriter,
+    "parquet": ParquetWriter,
+    "hdf5": HDF5Writer,
+    "npz": NpzWriter,
+}
+"""The available output backends, by ``output_format`` name."""
+
+
+def make_writer(output_format, outfile, reco_name, calib_name):
+    """Create a :py:class:`Writer` for the given output format.
+
+    Parameters
+    ----------
+    output_format : str
+        One of the keys of :py:data:`WRITERS`
+    outfile, reco_name, calib_name : str
+        Passed on to the writer's constructor
+
+    Returns
+    -------
+    :py:class:`Writer`
+        The new writer, with its output file created
+    """
+    try:
+        writer_class = WRITERS[output_format]
+    except KeyError:
+        raise ValueError(
+            f"Unknown output format {output_format!r}, "
+            f"expected one of {sorted(WRITERS)}"
+        ) from None
+    return writer_class(outfile, reco_name, calib_name)
+
+
+_FILL_FROM_COLUMNS_CPP = """
+#include <cstring>
+#include <string>
+#include <vector>
+#include "TBranch.h"
+#include "TTree.h"
+
+namespace toymc {
+void fill_from_columns(TTree* tree, Long64_t n_entries,
+                       const std::vector<std::string>& branch_names,
+                       const std::vector<Long64_t>& column_addresses,
+                       const std::vector<int>& item_sizes) {
+    const std::size_t n_columns = branch_names.size();
+    std::vector<char*> destinations(n_columns);
+    std::vector<const char*> sources(n_columns);
+    for (std::size_t j = 0; j < n_columns; ++j) {
+        destinations[j] = tree->GetBranch(branch_names[j].c_str())->GetAddress();
+        sources[j] = reinterpret_cast<const char*>(column_addresses[j]);
+    }
+    for (Long64_t i = 0; i < n_entries; ++i) {
+        for (std::size_t j = 0; j < n_columns; ++j) {
+            std::memcpy(destinations[j], sources[j] + i * item_sizes[j], item_sizes[j]);
+        }
+        tree->Fill();
+    }
+}
+}
+"""
+
+
+def _root_util():
+    """Import root_util, which loads ROOT, the first time a ROOT file is made."""
+    import root_util  # pylint: disable=import-outside-toplevel
+
+    return root_util
+
+
+def fill_from_columns(ttree, columns):
+    """Fill a TTree with one entry per row of the given columns.
+
+    The loop over entries runs in compiled C++ code (declared to the
+    ROOT interpreter the first time this function is called). For each
+    entry, the values from each column are copied into the buffer that
+    the corresponding TBranch was created with, and then the TTree is
+    filled, exactly as if the buffers had been assigned one by one.
+
+    Parameters
+    ----------
+    ttree : ROOT.TTree
+        The TTree to fill. Its TBranches must already have buffers
+        attached, as done by the ``MCOutput.prep_*`` methods.
+    columns : list of (str, numpy.ndarray)
+        The branch names and their values, as returned by
+        :py:func:`branch_columns`. The arrays must be contiguous, of
+        equal length, and have the dtype matching each TBranch.
+    """
+    import ROOT  # pylint: disable=import-outside-toplevel
+
+    if not hasattr(ROOT, "toymc"):
+        ROOT.gInterpreter.Declare(_FILL_FROM_COLUMNS_CPP)
+    names = ROOT.std.vector("std::string")()
+    addresses = ROOT.std.vector("Long64_t")()
+    item_sizes = ROOT.std.vector("int")()
+    for name, values in columns:
+        names.push_back(name)
+        addresses.push_back(values.ctypes.data)
+        item_sizes.push_back(values.itemsize)
+    n_entries = len(columns[0][1])
+    ROOT.toymc.fill_from_columns(ttree, n_entries, names, addresses, item_sizes)
+
+
+class MCOutput:
+    """The ToyMC output data structure (internal class).
+
+    This class is used internally to prepare and fill the output ROOT
+    TTrees.
+
+    The required ``labels`` parameter is necessary to generate the
+    MC Truth lookup TTree.
+
+    Parameters
+    ----------
+    container : ROOT.TFile
+        The ``TFile`` that will host the ToyMC output data structures
+    reco_name : str
+        The name of the reconstructed data TTree
+    calib_name : str
+        The name of the calibrated statistics TTree
+    labels : dict
+        The truth lookup table mapping numbers to text labels, as
+        returned by :py:func:`collect_labels`
+    """
+
+    def __init__(self, container, reco_name, calib_name, labels):
+        from ROOT import TTree  # pylint: disable=no-name-in-module
+
+        self.container = container
+        self.container.cd()
+        self.reco_ttree, self.reco_buf = self.prep_reco(
+            TTree, self.container, reco_name
+        )
+        self.calib_ttree, self.calib_buf = self.prep_calib(
+            TTree, self.container, calib_name
+        )
+        self.truth_ttree, self.truth_buf = self.prep_truth(TTree, self.container)
+        self.truth_lookup_ttree, _ = self.prep_truth_lookup(
+            TTree, self.container, labels
+        )
+
+    def add(self, event):
+        """Add the given event to the output data structure.
+
+        Parameters
+        ----------
+        event : :py:class:`~toymc.Event`
+            The event to fill into the ToyMC output
+        """
+        root_util = _root_util()
+
+        rb = self.reco_buf
+        cb = self.calib_buf
+        assign_value = root_util.assign_value
+        assign_value(cb.triggerNumber, event.trigger_number)
+        assign_value(cb.detector, event.detector)
+        timestamp_seconds = event.timestamp // 1000000000
+        timestamp_nanoseconds = event.timestamp % 1000000000
+        assign_value(cb.timestamp_seconds, timestamp_seconds)
+        assign_value(cb.timestamp_nanoseconds, timestamp_nanoseconds)
+        assign_value(cb.nHit, event.nHit)
+        assign_value(cb.charge, event.charge)
+        assign_value(cb.fQuad, event.fQuad)
+        assign_value(cb.fMax, event.fMax)
+        assign_value(cb.fPSD_t1, event.fPSD_t1)
+        assign_value(cb.fPSD_t2, event.fPSD_t2)
+        assign_value(cb.f2inch_maxQ, event.f2inch_maxQ)
+
+        assign_value(rb.triggerType, event.trigger_type)
+        assign_value(rb.site, event.site)
+        assign_value(rb.energy, event.energy)
+        assign_value(rb.x, event.x)
+        assign_value(rb.y, event.y)
+        assign_value(rb.z, event.z)
+
+        assign_value(self.truth_buf.truth_index, event.truth_index)
+
+        self.reco_ttree.Fill()
+        self.calib_ttree.Fill()
+        self.truth_ttree.Fill()
+
+    def add_batch(self, batch):
+        """Add every event in the given batch to the output data structure.
+
+        Unlike :py:meth:`MCOutput.add`, this fills the TTrees from whole
+        columns at a time using :py:func:`fill_from_columns`, so there is
+        no per-event Python overhead.
+
+        Parameters
+        ----------
+        batch : :py:class:`~toymc.EventBatch`
+            The events to fill into the ToyMC output, in the order they
+            should appear
+        """
+        if len(batch) == 0:
+            return
+        fill_from_columns(self.reco_ttree, branch_columns(batch, RECO_BRANCHES))
+        fill_from_columns(self.calib_ttree, branch_columns(batch, CALIB_BRANCHES))
+        fill_from_columns(self.truth_ttree, branch_columns(batch, TRUTH_BRANCHES))
+
+    @staticmethod
+    def prep_calib(TTree, host_file, name):
+        """Create the "calib" (~CalibStats) TTree and fill buffer.
+
+        Parameters
+        ----------
+        host_file : ROOT.TFile
+            The TFile that will hold the calib TTree
+        name : str
+            The name of this TTree
+
+        Returns
+        -------
+        (calib_ttree, buffer) : tuple
+            The TTree object and the buffer used to fill its TBranches
+        """
+        root_util = _root_util()
+
+        buf = root_util.TreeBuffer()
+        buf.triggerNumber = root_util.int_value()
+        buf.detector = root_util.int_value()
+        buf.timestamp_seconds = root_util.int_value()
+        buf.timestamp_nanoseconds = root_util.int_value()
+        buf.nHit = root_util.int_value()
+        buf.charge = root_util.float_value()
+        buf.fQuad = root_util.float_value()
+        buf.fMax = root_util.float_value()
+        buf.fPSD_t1 = root_util.float_value()
+        buf.fPSD_t2 = root_util.float_value()
+        buf.f2inch_maxQ = root_util.float_value()
+
+        host_file.cd()
+        event_subdir = host_file.Get("Event")
+        if not bool(event_subdir):
+            event_subdir = host_file.mkdir("Event")
+        event_subdir.cd()
+        data_subdir = event_subdir.Get("Data")
+        if not bool(data_subdir):
+            data_subdir = event_subdir.mkdir("Data")
+        data_subdir.cd()
+        long_name = f"Tree at /Event/Data/{name} holding Data_{name}"
+        calib = TTree(name, long_name)
+        calib.Branch("triggerNumber", buf.triggerNumber, "triggerNumber/I")
+        calib.Branch(
+            "context.mTimeStamp.mSec",
+            buf.timestamp_seconds,
+            "context.mTimeStamp.mSec/I",
+        )
+        calib.Branch(
+            "context.mTimeStamp.mNanoSec",
+            buf.timestamp_nanoseconds,
+            "context.mTimeStamp.mNanoSec/I",
+        )
+        calib.Branch("context.mDetId", buf.detector, "context.mDetId/I")
+        calib.Branch("nHit", buf.nHit, "nHit/I")
+        calib.Branch("NominalCharge", buf.charge, "NominalCharge/F")
+        calib.Branch("Quadrant", buf.fQuad, "Quadrant/F")
+        calib.Branch("MaxQ", buf.fMax, "MaxQ/F")
+        calib.Branch("time_PSD", buf.fPSD_t1, "time_PSD/F")
+        calib.Branch("time_PSD1", buf.fPSD_t2, "time_PSD1/F")
+        calib.Branch("MaxQ_2inchPMT", buf.f2inch_maxQ, "MaxQ_2inchPMT/F")
+        return calib, buf
+
+    @staticmethod
+    def prep_reco(TTree, host_file, name):
+        """Create the "reco" (~AdSimple) TTree and fill buffer.
+
+        Parameters
+        ----------
+        host_file : ROOT.TFile
+            The TFile that will hold the reco TTree
+        name : str
+            The name of this TTree
+
+        Returns
+        -------
+        (reco_ttree, buffer) : tuple
+            The TTree object and the buffer used to fill its TBranches
+        """
+        root_util = _root_util()
+
+        buf = root_util.TreeBuffer()
+        buf.triggerType = root_util.unsigned_int_value()
+        buf.site = root_util.int_value()
+        buf.energy = root_util.float_value()
+        buf.x = root_util.float_value()
+        buf.y = root_util.float_value()
+        buf.z = root_util.float_value()
+
+        host_file.cd()
+        event_subdir = host_file.Get("Event")
+        if not bool(event_subdir):
+            event_subdir = host_file.mkdir("Event")
+        event_subdir.cd()
+        rec_subdir = event_subdir.Get("Rec")
+        if not bool(rec_subdir):
+            rec_subdir = event_subdir.mkdir("Rec")
+        rec_subdir.cd()
+        long_name = f"Tree at /Event/Rec/{name} holding Rec_{name}"
+        reco = TTree(name, long_name)
+        reco.Branch("context.mSite", buf.site, "context.mSite/I")
+        reco.Branch("triggerType", buf.triggerType, "triggerType/i")
+        reco.Branch("energy", buf.energy, "energy/F")
+        reco.Branch("x", buf.x, "x/F")
+        reco.Branch("y", buf.y, "y/F")
+        reco.Branch("z", buf.z, "z/F")
+        return reco, buf
+
+    @staticmethod
+    def prep_truth(TTree, host_file):
+        """Create the MC Truth TTree (named MCTruth) and fill buffer.
+
+        Parameters
+        ----------
+        host_file : ROOT.TFile
+            The TFile that will hold the MC Truth TTree
+
+        Returns
+        -------
+        (mc_truth_ttree, buffer) : tuple
+            The TTree object and the buffer used to fill its TBranches
+        """
+        root_util = _root_util()
+
+        buf = root_util.TreeBuffer()
+        buf.truth_index = root_util.unsigned_int_value()
+        host_file.cd()
+        name = "MCTruth"
+        long_name = "Monte Carlo Truth information for each entry"
+        mc_truth = TTree(name, long_name)
+        mc_truth.Branch("truth_index", buf.truth_index, "truth_index/i")
+        return mc_truth, buf
+
+    @staticmethod
+    def prep_truth_lookup(TTree, host_file, labels):
+        """Create the MC Truth Lookup TTree (named MCTruthLookup) and fill buffer.
+
+        Each TBranch has a name which is either an integer, in which
+        case the value on that TBranch is an array of chars describing
+        the event subtype represented by that integer, or the converse:
+        a subtype name with an integer value. This way the expression
+        ``MCTruthLookup->Show(0)`` will print out both directions of
+        lookup.
+
+        Parameters
+        ----------
+        host_file : ROOT.TFile
+            The TFile that will hold the MC Truth Lookup TTree
+        labels : dict
+            The truth lookup table mapping numbers to text labels, as
+            returned by :py:func:`collect_labels`
+
+
+        Returns
+        -------
+        (mc_truth_lookup ttree, buffer) : tuple
+            The TTree object and the buffer used to fill its TBranches
+        """
+        labels_by_number = sorted(labels.items())
+        numbers_by_label = sorted((label, number) for number, label in labels.items())
+        max_label_length = max(len(x[0]) for x in numbers_by_label)
+        buf_size = max_label_length + 1
+
+        root_util = _root_util()
+
+        buf = root_util.TreeBuffer()
+
+        def new_singleton_array(value):
+            """Return a simple singleton array with value of type
+            char*.
+
+            There's no root-util function for char arrays so I'm making my
+            own here. Further, python's built-in array.arrays are super
+            inconvenient for bytestrings/char arrays so I'm using
+            numpy.array instead. The "S{}" typecode means null-terminated
+            bytes array with max length of buf_size.
+            """
+            type_format = f"S{buf_size}"
+            return np.array([value], type_format)
+
+        # Create and initialize the TreeBuffer buffers to the only
+        # values they'll ever take
+        for label, number in numbers_by_label:
+            setattr(buf, label, root_util.unsigned_int_value())
+            root_util.assign_value(getattr(buf, label), number)
+        for number, label in labels_by_number:
+            setattr(buf, f"_{number}", new_singleton_array(label))
+
+        host_file.cd()
+        name = "MCTruthLookup"
+        long_name = "Monte Carlo Truth lookup table"
+        mc_truth = TTree(name, long_name)
+        for label, number in numbers_by_label:
+            mc_truth.Branch(label, getattr(buf, label), f"{label}/i")
+        for number, label in labels_by_number:
+            name = f"_{number}"
+            mc_truth.Branch(name, getattr(buf, name), f"{name}[{buf_size}]/C")
+        mc_truth.Fill()
+        return mc_truth, buf
@@ -0,0 +1,516 @@
+"""Generating a run's events as independent tasks, in one or more processes.
+
+This module is used by :py:meth:`toymc.ToyMC.run` to generate every
+run. It is an internal module and is not intended to be used directly
+by users of the Toy Monte Carlo.
+
+The run is divided into *tasks*, each of which generates the events of
+one event type within one piece of the run. The pieces are the time
+windows from :py:meth:`toymc.ToyMC.windows`, further divided into
+pieces of at most ``task_seconds`` if that was given to the
+:py:class:`~toymc.ToyMC`, so that a single high-rate event type can be
+spread over several processes.
+
+Reproducibility
+---------------
+
+The output of a run depends only on the seed and on how the run is
+divided into tasks, never on the number of workers (or whether there
+are any) or on the order in which the tasks finish:
+
+    * The number of events of each type is determined for the whole
+      run up front, using :py:meth:`toymc.EventType.event_count` and
+      :py:meth:`toymc.EventType.split_count` with a random generator
+      reserved for that purpose.
+    * Event types that cannot determine their number of events up front
+      (whose ``event_count`` returns ``None``, e.g. subclasses that only
+      implement ``generate_events``) are generated for the whole run at
+      once by :py:func:`pregenerate`, with the seed that the run's first
+      task for the type would get, and their events are divided among
+      the pieces by timestamp. They produce the same events however the
+      run is divided, but are held in memory for the whole run.
+    * Each task gets its own random generator, seeded from a
+      :py:class:`numpy.random.SeedSequence` whose ``spawn_key`` is
+      derived from the event type's position in the run and the piece's
+      position in time.
+    * The task results are merged in task order, regardless of when
+      they arrive.
+
+Without worker processes, the tasks are run one window at a time in the
+current process by :py:func:`task_stream`. In a worker process, each
+task returns its events as a single sorted structured array with dtype
+:py:data:`toymc.batch.EVENT_DTYPE` instead, which is sent back to the
+main process as one block of bytes.
+
+Time shards
+-----------
+
+For very long runs, the run can instead be divided into ``shards``
+consecutive spans of time, each of which is generated from start to
+finish (all event types, one time window at a time) in its own worker
+process by :py:func:`run_shard`. Each shard writes its events, in time
+order, to a temporary file of raw :py:data:`~toymc.batch.EVENT_DTYPE`
+records rather than sending them back, and the main process
+concatenates the files in time order into the output. A shard's file
+includes the events that land past the end of the shard (e.g. the
+delayed events of prompt events near its end, or the AD and shower
+muons of a WP muon), and these are merged into the next shard by
+:py:func:`toymc.batch.merge_windows`. The tasks, seeds and event counts
+are planned for the whole run exactly as described above, so the total
+number of events has the same distribution as for a run that is not
+sharded.
+
+Worker processes are started with the ``"fork"`` start method, so that
+event types configured with lambdas or other functions that cannot be
+pickled are available in the workers without being sent to them.
+"""
+
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+import math
+import multiprocessing
+import os
+import tempfile
+
+import numpy as np
+from numpy.random import SeedSequence, default_rng
+
+from toymc import stats
+from toymc.batch import CHUNK_SIZE, EVENT_DTYPE, EventBatch, merge_windows
+
+COUNT_KEY = 0
+"""The ``spawn_key`` of the random generator used to draw event counts."""
+
+TASK_KEY = 1
+"""The first element of the ``spawn_key`` of each task's random generator."""
+
+Task = namedtuple("Task", ["type_index", "t0", "duration", "count", "seed"])
+Task.__doc__ = """A unit of work: the events of one event type within one piece.
+
+Attributes
+----------
+type_index : int
+    The position of the event type in the run's list of event types
+t0 : number
+    The start of the piece, **in seconds**
+duration : number
+    The length of the piece, **in seconds**
+count : object or None
+    The event count to pass to :py:meth:`toymc.EventType.generate_batch`,
+    or a :py:class:`~toymc.batch.EventBatch` of the piece's events, from
+    :py:func:`pregenerate`
+seed : numpy.random.SeedSequence
+    The seed for this task's random generator
+"""
+
+_worker_event_types = None
+
+
+def divide(t0, duration, length):
+    """Divide a span of time into consecutive pieces of at most ``length``.
+
+    Parameters
+    ----------
+    t0 : number
+        The start of the span, **in seconds**
+    duration : number
+        The length of the span, **in seconds**
+    length : number or None
+        The maximum length of a piece. If ``None``, the whole span is a
+        single piece.
+
+    Returns
+    -------
+    list of (number, number)
+        The ``(t0, duration)`` of each piece (the last one may be
+        shorter)
+    """
+    if length is None:
+        return [(t0, duration)]
+    if length <= 0:
+        raise ValueError(f"Piece length must be positive, got {length}")
+    # Compute each start from its index rather than adding up the
+    # lengths, so that rounding errors cannot add a sliver of a piece
+    count = math.ceil(duration / length - 1e-9)
+    result = []
+    for i in range(count):
+        start = i * length
+        end = duration if i == count - 1 else (i + 1) * length
+        result.append((t0 + start, end - start))
+    return result
+
+
+def shard_spans(t0, duration, shards):
+    """Divide a run into ``shards`` consecutive spans of equal length.
+
+    Returns
+    -------
+    list of (number, number)
+        The ``(t0, duration)`` of each shard
+    """
+    if shards < 1:
+        raise ValueError(f"shards must be at least 1, got {shards}")
+    bounds = [duration * i / shards for i in range(shards)] + [duration]
+    return [(t0 + start, end - start) for start, end in zip(bounds[:-1], bounds[1:])]
+
+
+def pieces(windows, task_seconds):
+    """Divide each time window into pieces of at most ``task_seconds``.
+
+    Parameters
+    ----------
+    windows : list of (number, number)
+        The ``(t0, duration)`` time windows, **in seconds**
+    task_seconds : number or None
+        The maximum length of a piece. If ``None``, each window is a
+        single piece.
+
+    Returns
+    -------
+    list of list of (number, number)
+        The ``(t0, duration)`` pieces of each window
+    """
+    return [divide(t0, duration, task_seconds) for t0, duration in windows]
+
+
+def plan_tasks(event_types, windows, entropy, task_seconds=None):
+    """Divide a run into tasks.
+
+    Parameters
+    ----------
+    event_types : list of :py:class:`toymc.EventType`
+        The event types in the run
+    windows : list of (number, number)
+        The ``(t0, duration)`` time windows of the run, **in seconds**
+    entropy : int
+        The run's seed (the ``entropy`` of its
+        :py:class:`~numpy.random.SeedSequence`)
+    task_seconds : number, optional
+        The maximum length of each task's piece of the run
+
+    Returns
+    -------
+    list of list of :py:class:`Task`
+        The tasks for each window. Within a window, the tasks are
+        ordered by event type and then by time.
+    """
+    window_pieces = pieces(windows, task_seconds)
+    all_pieces = [piece for window in window_pieces for piece in window]
+    durations = [duration for _, duration in all_pieces]
+    run_duration = sum(duration for _, duration in windows)
+    count_rng = default_rng(SeedSequence(entropy, spawn_key=(COUNT_KEY,)))
+    piece_counts = []
+    for type_index, event_type in enumerate(event_types):
+        count = event_type.event_count(count_rng, run_duration)
+        if len(all_pieces) == 1:
+            piece_counts.append([count])
+        elif count is None and all_pieces:
+            seed = SeedSequence(entropy, spawn_key=(TASK_KEY, type_index, 0))
+            piece_counts.append(pregenerate(event_type, seed, all_pieces))
+        else:
+            piece_counts.append(event_type.split_count(count_rng, count, durations))
+    tasks = []
+    piece_index = 0
+    for window in window_pieces:
+        window_tasks = []
+        for type_index, counts in enumerate(piece_counts):
+            for offset, (t0, duration) in enumerate(window):
+                seed = SeedSequence(
+                    entropy, spawn_key=(TASK_KEY, type_index, piece_index + offset)
+                )
+                count = counts[piece_index + offset]
+                window_tasks.append(Task(type_index, t0, duration, count, seed))
+        tasks.append(window_tasks)
+        piece_index += len(window)
+    return tasks
+
+
+def pregenerate(event_type, seed, run_pieces):
+    """Generate an event type's events for a whole run and divide them up.
+
+    This is used by :py:func:`plan_tasks` for event types whose
+    :py:meth:`~toymc.EventType.event_count` returns ``None``. Generating
+    each piece of the run as a short run of its own would not give the
+    same number of events as the whole run (e.g. if the count is the
+    rate times the duration, rounded down), so the whole run is
+    generated at once instead, exactly as when it is not divided.
+
+    Parameters
+    ----------
+    event_type : :py:class:`toymc.EventType`
+        The event type
+    seed : numpy.random.SeedSequence
+        The seed for the random generator
+    run_pieces : list of (number, number)
+        The consecutive ``(t0, duration)`` pieces of the run
+
+    Returns
+    -------
+    list of :py:class:`~toymc.batch.EventBatch`
+        The events in each piece, in timestamp order. Events past the end
+        of the run are in the last piece.
+    """
+    t0 = run_pieces[0][0]
+    duration = sum(piece_duration for _, piece_duration in run_pieces)
+    with stats.stage("generate", event_type.name):
+        batch = event_type.generate_batch(default_rng(seed), duration, t0)
+        with stats.stage("sort"):
+            batch = batch.sorted()
+    starts_ns = [int(1e9) * piece_t0 for piece_t0, _ in run_pieces[1:]]
+    bounds = [0] + np.searchsorted(batch["timestamp"], starts_ns).tolist()
+    bounds.append(len(batch))
+    return [batch[start:end] for start, end in zip(bounds[:-1], bounds[1:])]
+
+
+def _task_events(event_type, task):
+    """Generate the events for one task as a time-ordered stream.
+
+    This is used by :py:func:`task_stream` and :py:func:`run_task`. If
+    the task's events were generated by :py:func:`pregenerate`, they are
+    returned as they are.
+    """
+    if isinstance(task.count, EventBatch):
+        stats.count("events", len(task.count))
+        return task.count.split(CHUNK_SIZE)
+    rng = default_rng(task.seed)
+    return event_type.generate_stream(rng, task.duration, task.t0, task.count)
+
+
+def task_stream(event_types, task):
+    """Generate the events for one task as a time-ordered stream.
+
+    Returns
+    -------
+    iterator of :py:class:`~toymc.batch.EventBatch`
+        The events, in timestamp order across all batches, from
+        :py:meth:`toymc.EventType.generate_stream`
+    """
+    event_type = event_types[task.type_index]
+    with stats.stage("generate", event_type.name):
+        return _task_events(event_type, task)
+
+
+def run_task(event_types, task):
+    """Generate the events for one task as a single array.
+
+    This is used in worker processes instead of :py:func:`task_stream`,
+    so that the events can be sent back as one block.
+
+    Returns
+    -------
+    numpy.ndarray with dtype :py:data:`toymc.batch.EVENT_DTYPE`
+        The events, in timestamp order
+    """
+    event_type = event_types[task.type_index]
+    with stats.stage("generate", event_type.name):
+        return EventBatch.concatenate(_task_events(event_type, task)).array
+
+
+def _init_worker(event_types):
+    """Store the run's event types in a newly started worker process."""
+    global _worker_event_types  # pylint: disable=global-statement
+    _worker_event_types = event_types
+
+
+def _run_worker_task(task):
+    """Run a task in a worker process.
+
+    Returns the task's events and the worker's
+    :py:class:`~toymc.stats.RunStats` for the task, as a dict.
+    """
+    with stats.collecting(stats.RunStats()) as task_stats:
+        array = run_task(_worker_event_types, task)
+    return array, task_stats.to_dict()
+
+
+def _task_result(future):
+    """Wait for a worker's task and record its stats in this process."""
+    with stats.stage("wait"):
+        array, task_stats = future.result()
+    stats.add(task_stats)
+    return array
+
+
+def window_streams(event_types, tasks, workers):
+    """Run the tasks of each window and yield the resulting streams.
+
+    The tasks of the next window are started before the results for the
+    current window are yielded, so that the workers stay busy while the
+    current window is merged and written.
+
+    Parameters
+    ----------
+    event_types : list of :py:class:`toymc.EventType`
+        The event types in the run
+    tasks : list of list of :py:class:`Task`
+        The tasks for each window, from :py:func:`plan_tasks`
+    workers : int
+        The number of processes to use. With 1 worker, the tasks are run
+        in the current process.
+
+    Yields
+    ------
+    list of iterables of :py:class:`~toymc.batch.EventBatch`
+        The time-ordered stream from each task of the window, in task
+        order
+    """
+    if workers < 1:
+        raise ValueError(f"workers must be at least 1, got {workers}")
+    if workers == 1:
+        for window_tasks in tasks:
+            yield [task_stream(event_types, task) for task in window_tasks]
+        return
+    context = multiprocessing.get_context("fork")
+    with ProcessPoolExecutor(
+        workers,
+        mp_context=context,
+        initializer=_init_worker,
+        initargs=(event_types,),
+    ) as executor:
+        pending = deque()
+        next_window = 0
+        for window_index in range(len(tasks)):
+            while next_window < len(tasks) and next_window <= window_index + 1:
+                pending.append(
+                    [
+                        executor.submit(_run_worker_task, task)
+                        for task in tasks[next_window]
+                    ]
+                )
+                next_window += 1
+            futures = pending.popleft()
+            yield [
+                EventBatch(_task_result(future)).split(CHUNK_SIZE) for future in futures
+            ]
+
+
+def run_shard(event_types, windows, tasks, path=None):
+    """Generate the events of one shard of a run.
+
+    Parameters
+    ----------
+    event_types : list of :py:class:`toymc.EventType`
+        The event types in the run
+    windows : list of (number, number)
+        The ``(t0, duration)`` time windows of the shard
+    tasks : list of list of :py:class:`Task`
+        The tasks for each of the shard's windows
+    path : str, optional
+        If given, write the events to this file as raw
+        :py:data:`~toymc.batch.EVENT_DTYPE` records instead of yielding
+        them.
+
+    Returns
+    -------
+    iterator of :py:class:`~toymc.batch.EventBatch`, or int
+        The shard's events in timestamp order, including any that land
+        past the end of the shard. If ``path`` was given, the number of
+        events written instead.
+    """
+    streams = (
+        [task_stream(event_types, task) for task in window_tasks]
+        for window_tasks in tasks
+    )
+    events = merge_windows(windows, streams)
+    if path is None:
+        return events
+    count = 0
+    with open(path, "wb") as shard_file:
+        for batch in stats.timed("merge", events):
+            with stats.stage("shard_io"):
+                batch.array.tofile(shard_file)
+            count += len(batch)
+    return count
+
+
+def _run_worker_shard(windows, tasks, path):
+    """Run a shard in a worker process.
+
+    Returns the number of events written and the worker's
+    :py:class:`~toymc.stats.RunStats` for the shard, as a dict.
+    """
+    with stats.collecting(stats.RunStats()) as shard_stats:
+        count = run_shard(_worker_event_types, windows, tasks, path)
+    return count, shard_stats.to_dict()
+
+
+def read_shard(path, chunk_size=CHUNK_SIZE):
+    """Iterate over the events in a shard file written by :py:func:`run_shard`.
+
+    The file is deleted once all of its events have been read.
+
+    Yields
+    ------
+    :py:class:`~toymc.batch.EventBatch`
+        Chunks of at most ``chunk_size`` events
+    """
+    with open(path, "rb") as shard_file:
+        while True:
+            with stats.stage("shard_io"):
+                array = np.fromfile(shard_file, dtype=EVENT_DTYPE, count=chunk_size)
+            if len(array) == 0:
+                break
+            yield EventBatch(array)
+    os.remove(path)
+
+
+def shard_streams(event_types, shard_windows, tasks, workers, tmpdir=None):
+    """Generate the shards of a run and yield each shard's events.
+
+    With more than one worker, every shard is generated in a worker
+    process, which writes the shard's events to a temporary file in
+    ``tmpdir``. The files are read back (and deleted) in time order,
+    each as soon as its shard is finished, so only one chunk of events
+    per shard is ever sent to or held by the main process.
+
+    Parameters
+    ----------
+    event_types : list of :py:class:`toymc.EventType`
+        The event types in the run
+    shard_windows : list of list of (number, number)
+        The time windows of each shard
+    tasks : list of list of :py:class:`Task`
+        The tasks for each window of the run (all shards), from
+        :py:func:`plan_tasks`
+    workers : int
+        The number of processes to use. With 1 worker, the shards are
+        generated one at a time in the current process.
+    tmpdir : str, optional
+        The directory to create the temporary files in. Default: the
+        system's temporary directory.
+
+    Yields
+    ------
+    list of one iterable of :py:class:`~toymc.batch.EventBatch`
+        The time-ordered stream of each shard, including the events that
+        land past the end of the shard
+    """
+    if workers < 1:
+        raise ValueError(f"workers must be at least 1, got {workers}")
+    shard_tasks = []
+    start = 0
+    for windows in shard_windows:
+        shard_tasks.append(tasks[start : start + len(windows)])
+        start += len(windows)
+    if workers == 1:
+        for windows, wtasks in zip(shard_windows, shard_tasks):
+            yield [run_shard(event_types, windows, wtasks)]
+        return
+    context = multiprocessing.get_context("fork")
+    with tempfile.TemporaryDirectory(prefix=".toymc-shards-", dir=tmpdir) as tmp:
+        with ProcessPoolExecutor(
+            workers,
+            mp_context=context,
+            initializer=_init_worker,
+            initargs=(event_types,),
+        ) as executor:
+            futures = []
+            for i, (windows, wtasks) in enumerate(zip(shard_windows, shard_tasks)):
+                path = os.path.join(tmp, f"shard{i}.bin")
+                future = executor.submit(_run_worker_shard, windows, wtasks, path)
+                futures.append((future, path))
+            for future, path in futures:
+                with stats.stage("wait"):
+                    _, shard_stats = future.result()
+                stats.add(shard_stats)
+                yield [read_shard(path)]
@@ -0,0 +1,609 @@
+"""Predicting the size and cost of a run without generating it.
+
+Before submitting a long run or a campaign, :py:meth:`toymc.ToyMC.plan`
+(or ``toymc run ... --dry-run``) predicts how many events of each
+subtype the run will have, how big the output file will be with each
+backend, and how much memory and time it will take, and recommends a
+``chunk_seconds`` and number of workers that fit in a memory budget::
+
+    toymc run example.py out.root -t 8640000 --dry-run --memory-budget 4000
+
+Event counts
+------------
+
+The number of events of each event type is determined with the event
+type's :py:meth:`~toymc.EventType.event_count` (for the built-in event
+types, the rate times the duration, from
+:py:meth:`~toymc.EventType.actual_event_count`) and divided into
+subtypes with :py:meth:`~toymc.EventType.subtype_counts`, e.g. one
+prompt and one delayed event per :py:class:`~toymc.correlated.Correlated`
+pair, and the AD and shower muons of a :py:class:`~toymc.muon.Muon`
+from ``prob_WP_and_AD`` and ``prob_WP_and_shower``. For event types
+that do not implement ``subtype_counts``, the numbers are scaled up
+from the calibration sample described below.
+
+File size
+---------
+
+The output file size is predicted by :py:func:`file_size_mb` as a fixed
+size per file, :py:data:`FILE_OVERHEAD_BYTES`, plus a size per event,
+:py:data:`BYTES_PER_EVENT`, for each backend, as measured with the
+example configuration. The fixed part dominates for files of up to about
+10,000 events. The compressed backends depend somewhat on the spectra,
+so these are rough numbers. The sizes of the ``"root"`` backend have not
+been measured (see :py:data:`UNMEASURED_FORMATS`), and are marked as
+estimates.
+
+Runtime and memory
+------------------
+
+To calibrate the estimates on the current machine, each event type
+generates a short sample of about ``calibration_events`` events (or the
+whole run, if that is shorter; for event types that cannot tell their
+event counts, a first sample of :py:data:`CALIBRATION_SECONDS`
+determines the rate), timing the generation and sorting, and
+then, in a second pass traced with :py:mod:`tracemalloc`, the peak
+memory used per event. The samples are then merged and written to a
+temporary file with the run's backend, to time the merging and writing.
+The samples are generated with their own random generators, so the
+:py:class:`~toymc.ToyMC`'s own random numbers are not used up.
+
+From these numbers and the event counts, the time windows (see
+``chunk_seconds``) and the workers determine the estimates:
+
+* Without workers (or with one), each window's events of all event
+  types are held in memory at once, plus the temporary arrays of the
+  task being generated. The run takes the generation time plus the
+  merging and writing time.
+* With ``workers``, each worker process holds the events of one task
+  (one event type within one window, or ``task_seconds`` of it) while
+  generating it, and the main process holds the events of up to two
+  windows. The windows are generated in parallel, but no faster than
+  their largest task, while the previous window is merged and written.
+
+The memory estimates are added to the current memory use of this
+process. They are meant for choosing settings, not as guarantees:
+leave some room in batch job requests.
+"""
+
+import math
+import os
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+from numpy.random import default_rng
+
+from toymc import progress
+from toymc.batch import CHUNK_SIZE, EVENT_DTYPE, EventBatch, merge_sorted
+from toymc.output import WRITERS, collect_labels, make_writer
+
+BYTES_PER_EVENT = {
+    "root": 11.6,
+    "uproot": 11.6,
+    "parquet": 16.2,
+    "hdf5": 12.1,
+    "npz": 72.0,
+}
+"""The output file size per event of each backend, in bytes, for large files."""
+
+FILE_OVERHEAD_BYTES = {
+    "root": 44000,
+    "uproot": 44000,
+    "parquet": 5000,
+    "hdf5": 58000,
+    "npz": 4600,
+}
+"""The fixed output file size of each backend, in bytes.
+
+This is the size of the headers, the truth lookup table and the last,
+partly filled block of each column, whatever the number of events.
+"""
+
+UNMEASURED_FORMATS = ("root",)
+"""The backends whose file sizes are estimated rather than measured.
+
+PyROOT was not available to measure the ``"root"`` backend, so its sizes
+are assumed to be those of ``"uproot"``, which writes the same TTrees
+with the same compression.
+"""
+
+CALIBRATION_EVENTS = 50000
+"""The default number of events to generate of each event type to calibrate."""
+
+CALIBRATION_SECONDS = 1.0
+"""The length of the calibration sample of event types that cannot tell
+their event counts, **in seconds**."""
+
+RUNTIME_TOLERANCE = 0.05
+"""Recommend fewer workers if the runtime is within this fraction of the best."""
+
+
+def file_size_mb(output_format, events):
+    """Predict the size of an output file, in MiB.
+
+    Parameters
+    ----------
+    output_format : str
+        The output backend, from :py:data:`toymc.output.WRITERS`
+    events : int
+        The number of events in the file
+
+    Returns
+    -------
+    float
+        The predicted size, from :py:data:`FILE_OVERHEAD_BYTES` and
+        :py:data:`BYTES_PER_EVENT` (0 for a backend without them)
+    """
+    size = FILE_OVERHEAD_BYTES.get(output_format, 0)
+    size += events * BYTES_PER_EVENT.get(output_format, 0)
+    return size / 2**20
+
+
+def predict_counts(event_types, duration):
+    """Predict the number of events of each subtype of each event type.
+
+    Parameters
+    ----------
+    event_types : list of :py:class:`toymc.EventType`
+        The event types of the run
+    duration : number
+        The length of the run, **in seconds**
+
+    Returns
+    -------
+    list of dict or None
+        For each event type, the number of events for each truth label
+        number, or ``None`` if the event type does not implement
+        :py:meth:`~toymc.EventType.subtype_counts`
+    """
+    rng = default_rng(0)
+    return [
+        event_type.subtype_counts(event_type.event_count(rng, duration))
+        for event_type in event_types
+    ]
+
+
+def calibration_span(counts, duration, calibration_events):
+    """Return the length of an event type's calibration sample, **in seconds**.
+
+    The span holds about ``calibration_events`` events, according to the
+    predicted ``counts`` (see :py:func:`predict_counts`), and is no
+    longer than the run.
+    """
+    if counts is None:
+        return min(duration, CALIBRATION_SECONDS)
+    events = sum(counts.values())
+    if events == 0:
+        return min(duration, CALIBRATION_SECONDS)
+    return min(duration, duration * calibration_events / events)
+
+
+def sample_event_type(event_type, t0, span):
+    """Generate a calibration sample of an event type.
+
+    Parameters
+    ----------
+    event_type : :py:class:`toymc.EventType`
+        The event type
+    t0 : number
+        The start of the sample, **in seconds**
+    span : number
+        The length of the sample, **in seconds**
+
+    Returns
+    -------
+    array : numpy.ndarray with dtype :py:data:`toymc.batch.EVENT_DTYPE`
+        The events, in timestamp order
+    wall_s : float
+        The time it took to generate and sort the events, in seconds
+    peak_bytes : int
+        The peak memory allocated while generating and sorting the
+        events (in a separate, traced pass)
+    """
+    start = time.perf_counter()
+    batches = list(event_type.generate_stream(default_rng(0), span, t0))
+    wall = time.perf_counter() - start
+    array = EventBatch.concatenate(batches).array
+    del batches
+    tracing = tracemalloc.is_tracing()
+    if tracing:
+        baseline = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+    else:
+        baseline = 0
+        tracemalloc.start()
+    try:
+        list(event_type.generate_stream(default_rng(0), span, t0))
+        peak = tracemalloc.get_traced_memory()[1] - baseline
+    finally:
+        if not tracing:
+            tracemalloc.stop()
+    return array, wall, peak
+
+
+def time_output(arrays, labels, output_format, mc):
+    """Time merging the calibration samples and writing them to a temporary file.
+
+    The temporary file is created next to the ``outfile`` of the
+    :py:class:`~toymc.ToyMC` ``mc`` (or in the default temporary
+    directory, if that directory does not exist yet), with the same
+    extension and TTree names, and removed afterwards.
+
+    Returns
+    -------
+    float
+        The time taken, in seconds, not counting creating the writer
+        (which may import the backend's libraries)
+    """
+    directory = os.path.dirname(os.path.abspath(mc.outfile))
+    if not os.path.isdir(directory):
+        directory = None
+    extension = os.path.splitext(mc.outfile)[1]
+    with tempfile.TemporaryDirectory(prefix=".toymc-plan-", dir=directory) as tmp:
+        writer = make_writer(
+            output_format,
+            os.path.join(tmp, "calibration" + extension),
+            mc.reco_name,
+            mc.calib_name,
+        )
+        writer.begin(labels)
+        start = time.perf_counter()
+        for batch in merge_sorted([EventBatch(array).split() for array in arrays]):
+            writer.add_batch(batch)
+        writer.close()
+        return time.perf_counter() - start
+
+
+def estimate(costs, output_s, duration, chunk_seconds, workers, *, task_seconds=None):
+    """Estimate the peak memory and runtime of a run.
+
+    Parameters
+    ----------
+    costs : list of (number, number, number)
+        For each event type, the number of events in the run, the time
+        to generate and sort one event (in seconds) and the peak memory
+        used per event while generating (in bytes)
+    output_s : number
+        The time to merge and write one event, in seconds
+    duration : number
+        The length of the run, **in seconds**
+    chunk_seconds : number or None
+        The length of each time window, as for :py:class:`toymc.ToyMC`
+    workers : int or None
+        The number of worker processes, as for :py:meth:`toymc.ToyMC.run`
+    task_seconds : number, optional
+        The maximum length of each task, as for :py:class:`toymc.ToyMC`
+
+    Returns
+    -------
+    dict
+        The number of ``windows``; the memory used by the run in the
+        main process (``main_mb``), in each worker (``worker_mb``) and
+        in total (``memory_mb``), in MiB; and the time spent generating
+        (``generate_s``, added up over all workers), merging and writing
+        (``output_s``), and in total (``runtime_s``), in seconds
+    """
+    costs = np.array(costs, dtype=float).reshape(-1, 3)
+    if len(costs) == 0:
+        costs = np.zeros((1, 3))
+    events, generate_s, memory_bytes = costs.T
+    window = duration if chunk_seconds is None else min(chunk_seconds, duration)
+    windows = max(1, math.ceil(duration / window)) if window > 0 else 1
+    fraction = window / duration if duration > 0 else 1.0
+    if task_seconds is not None and window > 0:
+        task_fraction = fraction * min(task_seconds, window) / window
+    else:
+        task_fraction = fraction
+    window_events = events * fraction
+    task_events = events * task_fraction
+    itemsize = EVENT_DTYPE.itemsize
+    window_generate = float(np.sum(window_events * generate_s))
+    window_output = float(np.sum(window_events)) * output_s
+    # The merged chunk being written, and the writer's pending basket
+    main_bytes = 2 * CHUNK_SIZE * itemsize
+    worker_bytes = 0.0
+    if workers is None or workers == 1:
+        # Every event type's events of the window, and the temporary
+        # arrays of the task being generated
+        main_bytes += np.sum(window_events) * itemsize + np.max(
+            task_events * np.maximum(memory_bytes - itemsize, 0)
+        )
+        runtime = windows * (window_generate + window_output)
+    else:
+        # The events of the window being written and the next one
+        main_bytes += (2 * np.sum(window_events) + np.max(task_events)) * itemsize
+        # The task's events while generating, and their copy being sent
+        worker_bytes = np.max(task_events * (memory_bytes + itemsize))
+        parallel_generate = max(
+            window_generate / workers, float(np.max(task_events * generate_s))
+        )
+        runtime = (
+            parallel_generate
+            + window_output
+            + (windows - 1) * max(parallel_generate, window_output)
+        )
+    main_mb = float(main_bytes) / 2**20
+    worker_mb = float(worker_bytes) / 2**20
+    return {
+        "windows": windows,
+        "main_mb": main_mb,
+        "worker_mb": worker_mb,
+        "memory_mb": main_mb + (workers or 0) * worker_mb,
+        "generate_s": windows * window_generate,
+        "output_s": windows * window_output,
+        "runtime_s": runtime,
+    }
+
+
+def chunk_candidates(duration, events):
+    """Return the window lengths to consider, from longest to shortest.
+
+    These are the whole run, then the round numbers of seconds (1, 2 and
+    5 times a power of 10) below it, down to the length that holds about
+    :py:data:`toymc.batch.CHUNK_SIZE` events, below which windows only
+    add overhead.
+    """
+    candidates = [duration]
+    if events <= CHUNK_SIZE or duration <= 1:
+        return candidates
+    shortest = max(1.0, duration * CHUNK_SIZE / events)
+    exponent = math.floor(math.log10(duration))
+    while True:
+        for mantissa in (5, 2, 1):
+            length = mantissa * 10.0**exponent
+            if length < shortest:
+                return candidates
+            if length < duration:
+                candidates.append(length)
+        exponent -= 1
+
+
+def recommend(
+    costs, output_s, duration, memory_budget_mb, *, base_mb, task_seconds=None
+):
+    """Recommend a ``chunk_seconds`` and number of workers for a memory budget.
+
+    For each number of workers, up to the number of CPUs available, the
+    longest of the :py:func:`chunk_candidates` whose estimated memory fits
+    in the budget is chosen. Of these, the setting with the shortest
+    estimated runtime is recommended, except that fewer workers are
+    preferred if the runtime is within :py:data:`RUNTIME_TOLERANCE` of
+    the shortest.
+
+    Parameters
+    ----------
+    costs, output_s, duration, task_seconds
+        As for :py:func:`estimate`
+    memory_budget_mb : number
+        The memory available to the run, in MiB
+    base_mb : number
+        The memory in use before the run starts, in MiB
+
+    Returns
+    -------
+    dict or None
+        The recommended ``chunk_seconds`` (``None`` for the whole run at
+        once) and ``workers``, and the :py:func:`estimate` for them, or
+        ``None`` if nothing fits in the budget
+    """
+    if hasattr(os, "sched_getaffinity"):
+        cpus = len(os.sched_getaffinity(0))
+    else:
+        cpus = os.cpu_count() or 1
+    events = sum(cost[0] for cost in costs)
+    candidates = chunk_candidates(duration, events)
+    options = []
+    for workers in range(1, cpus + 1):
+        for length in candidates:
+            chunk_seconds = None if length >= duration else length
+            result = estimate(
+                costs,
+                output_s,
+                duration,
+                chunk_seconds,
+                workers,
+                task_seconds=task_seconds,
+            )
+            if base_mb + result["memory_mb"] <= memory_budget_mb:
+                options.append((workers, chunk_seconds, result))
+                break
+    if not options:
+        return None
+    fastest = min(result["runtime_s"] for _, _, result in options)
+    workers, chunk_seconds, result = next(
+        option
+        for option in options
+        if option[2]["runtime_s"] <= fastest * (1 + RUNTIME_TOLERANCE)
+    )
+    recommendation = {"chunk_seconds": chunk_seconds, "workers": workers}
+    recommendation.update(result)
+    recommendation["memory_mb"] += base_mb
+    return recommendation
+
+
+def plan_run(mc, workers=None, memory_budget_mb=None, calibration_events=None):
+    """Predict the size and cost of a run. See :py:meth:`toymc.ToyMC.plan`."""
+    if calibration_events is None:
+        calibration_events = CALIBRATION_EVENTS
+    labels = collect_labels(mc.event_types)
+    notes = []
+    predicted = predict_counts(mc.event_types, mc.duration)
+    arrays = []
+    costs = []
+    event_types = {}
+    subtypes = {}
+    calibration_start = time.perf_counter()
+    for event_type, counts in zip(mc.event_types, predicted):
+        span = calibration_span(counts, mc.duration, calibration_events)
+        array, wall, peak = sample_event_type(event_type, mc.t0, span)
+        sampled = len(array)
+        if counts is None and 0 < sampled < calibration_events and span < mc.duration:
+            # Now that the rate is known, take a sample of the usual size
+            span = min(mc.duration, span * calibration_events / sampled)
+            array, wall, peak = sample_event_type(event_type, mc.t0, span)
+        arrays.append(array)
+        sampled = len(array)
+        if counts is None:
+            numbers, found = np.unique(array["truth_index"], return_counts=True)
+            scale = mc.duration / span if span > 0 else 0
+            counts = {
+                number: int(round(count * scale))
+                for number, count in zip(numbers.tolist(), found.tolist())
+            }
+            notes.append(
+                f"{event_type.name} does not implement subtype_counts; its event "
+                f"counts are scaled up from {span:g} s of events"
+            )
+        for number, count in counts.items():
+            label = labels.get(number, str(number))
+            subtypes[label] = subtypes.get(label, 0) + count
+        events = sum(counts.values())
+        generate_s = wall / sampled if sampled else 0.0
+        memory_bytes = max(peak / sampled, EVENT_DTYPE.itemsize) if sampled else 0.0
+        costs.append((events, generate_s, memory_bytes))
+        event_types[event_type.name] = {
+            "events": events,
+            "calibration_events": sampled,
+            "generate_us_per_event": 1e6 * generate_s,
+            "memory_bytes_per_event": memory_bytes,
+        }
+    calibration_format = mc.output_format
+    try:
+        output_wall = time_output(arrays, labels, calibration_format, mc)
+    except ImportError as error:
+        notes.append(
+            f"Cannot write with the {calibration_format!r} backend here ({error}); "
+            "timed the 'npz' backend instead"
+        )
+        calibration_format = "npz"
+        output_wall = time_output(arrays, labels, calibration_format, mc)
+    sampled = sum(len(array) for array in arrays)
+    output_s = output_wall / sampled if sampled else 0.0
+    calibration_wall = time.perf_counter() - calibration_start
+    del arrays
+    base_mb = progress.current_rss_mb()
+    if base_mb is None:
+        base_mb = 0.0
+        notes.append(
+            "The memory use of this process is not available, so it is not "
+            "included in the memory estimates"
+        )
+    total = sum(subtypes.values())
+    current = estimate(
+        costs,
+        output_s,
+        mc.duration,
+        mc.chunk_seconds,
+        workers,
+        task_seconds=mc.task_seconds,
+    )
+    current["memory_mb"] += base_mb
+    if mc.shards is not None:
+        notes.append(
+            "With shards, each worker generates a whole shard one window at a "
+            "time, so each one needs about the memory estimated for 1 worker"
+        )
+    recommendation = None
+    if memory_budget_mb is not None:
+        recommendation = recommend(
+            costs,
+            output_s,
+            mc.duration,
+            memory_budget_mb,
+            base_mb=base_mb,
+            task_seconds=mc.task_seconds,
+        )
+        if recommendation is None:
+            notes.append(
+                f"Nothing fits in {memory_budget_mb:g} MiB, even with 1 worker and "
+                "the shortest windows"
+            )
+    return {
+        "outfile": mc.outfile,
+        "format": mc.output_format,
+        "t0": mc.t0,
+        "duration": mc.duration,
+        "chunk_seconds": mc.chunk_seconds,
+        "task_seconds": mc.task_seconds,
+        "shards": mc.shards,
+        "workers": workers,
+        "events": total,
+        "subtypes": subtypes,
+        "event_types": event_types,
+        "file_size_mb": {
+            output_format: file_size_mb(output_format, total)
+            for output_format in WRITERS
+        },
+        "calibration": {
+            "events": sampled,
+            "wall_s": calibration_wall,
+            "format": calibration_format,
+            "output_us_per_event": 1e6 * output_s,
+            "base_memory_mb": base_mb,
+        },
+        "estimate": current,
+        "memory_budget_mb": memory_budget_mb,
+        "recommendation": recommendation,
+        "notes": notes,
+    }
+
+
+def format_plan(plan):
+    """Format the result of :py:meth:`toymc.ToyMC.plan` as text."""
+    lines = [
+        f"Plan for {plan['outfile']} ({plan['duration']:g} s from "
+        f"t0 = {plan['t0']:g} s, {plan['format']} format)",
+        "",
+        f"Events: {plan['events']:,}",
+    ]
+    for label, count in plan["subtypes"].items():
+        lines.append(f"  {label:<24} {count:>15,}")
+    lines += ["", "Output file size:"]
+    for output_format, size in plan["file_size_mb"].items():
+        marker = "  <-" if output_format == plan["format"] else ""
+        if output_format in UNMEASURED_FORMATS:
+            marker += "  (unmeasured estimate)"
+        lines.append(f"  {output_format:<24} {size:>12,.1f} MiB{marker}")
+    calibration = plan["calibration"]
+    lines += [
+        "",
+        f"Calibration: {calibration['events']:,} events in "
+        f"{calibration['wall_s']:.2f} s; merging and writing "
+        f"({calibration['format']}) {calibration['output_us_per_event']:.2f} "
+        "us/event",
+    ]
+    for name, entry in plan["event_types"].items():
+        lines.append(
+            f"  {name:<24} {entry['generate_us_per_event']:8.2f} us/event "
+            f"{entry['memory_bytes_per_event']:8.0f} bytes/event"
+        )
+
+    def describe(settings, result):
+        runtime = progress.format_duration(result["runtime_s"])
+        return (
+            f"{settings}: {result['memory_mb']:,.0f} MiB peak memory, "
+            f"{runtime} runtime, {result['windows']} window(s)"
+        )
+
+    lines += [
+        "",
+        describe(
+            f"With chunk_seconds={plan['chunk_seconds']}, workers={plan['workers']}",
+            plan["estimate"],
+        ),
+    ]
+    recommendation = plan["recommendation"]
+    if recommendation is not None:
+        lines.append(
+            describe(
+                f"Recommended for {plan['memory_budget_mb']:g} MiB: "
+                f"chunk_seconds={recommendation['chunk_seconds']}, "
+                f"workers={recommendation['workers']}",
+                recommendation,
+            )
+        )
+    if plan["notes"]:
+        lines += [""] + ["Note: " + note for note in plan["notes"]]
+    return "\n".join(lines)
@@ -0,0 +1,165 @@
+"""Timing the generator functions of event types.
+
+The generator functions stored as attributes of the event types (see
+"Customizing the random generators" in :py:mod:`toymc`) are often
+lambdas, which all look the same in a normal profile. With
+``ToyMC(..., profile_callbacks=True)`` (or ``toymc run
+--profile-callbacks``), every such attribute of every event type is
+replaced for the duration of the run by a wrapper that counts its calls
+and the time spent in them, and a table ranking them by time is printed
+to standard error at the end of the run::
+
+    Generator functions by total time:
+      rank    time (s)   run %     calls   us/call  vec  function
+         1       3.412    41.2%   1000000      3.41   no  IBD_nH.delayed_energy_spectrum
+         2       0.105     1.3%        12   8750.00  yes  Muon.WP_nHit_spectrum
+       ...
+
+A function that is called once per event (``vec`` is ``no``, i.e. it is
+not marked with :py:func:`toymc.util.vectorized`) and that takes a large
+share of the run is the first one to vectorize. The same numbers are
+also included in the run report under ``"callbacks"`` (see
+:py:mod:`toymc.stats`), added up over all worker processes.
+
+The event types nested in other event types (e.g. the sources of a
+:py:class:`~toymc.hall.Hall`) are instrumented too, under their own
+names. A function object that is shared by several attributes is
+counted under the first of them. Wrapping the functions does not change
+the generated events.
+"""
+
+import contextlib
+import functools
+import sys
+import time
+
+import toymc
+from toymc import stats
+from toymc import util
+
+
+def callback_attributes(event_type):
+    """Find the generator functions of an event type and its nested event types.
+
+    Parameters
+    ----------
+    event_type : :py:class:`toymc.EventType`
+        The event type
+
+    Returns
+    -------
+    list of (:py:class:`toymc.EventType`, str)
+        The event type object and attribute name of each public,
+        callable instance attribute, including those of event types
+        stored in the event type's attributes (directly, or in a dict,
+        list or tuple)
+    """
+    found = []
+    for name, value in vars(event_type).items():
+        if name.startswith("_"):
+            continue
+        if isinstance(value, toymc.EventType):
+            found.extend(callback_attributes(value))
+        elif isinstance(value, dict):
+            for nested in value.values():
+                if isinstance(nested, toymc.EventType):
+                    found.extend(callback_attributes(nested))
+        elif isinstance(value, (list, tuple)):
+            for nested in value:
+                if isinstance(nested, toymc.EventType):
+                    found.extend(callback_attributes(nested))
+        elif callable(value) and not isinstance(value, type):
+            found.append((event_type, name))
+    return found
+
+
+def profiled(func, event_type_name, attribute):
+    """Wrap a generator function so that its calls are timed.
+
+    Each call is recorded with :py:func:`toymc.stats.record_callback`.
+    The wrapper keeps the function's :py:func:`~toymc.util.vectorized`
+    marker.
+    """
+    vectorized = util.is_vectorized(func)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            stats.record_callback(
+                event_type_name, attribute, vectorized, time.perf_counter() - start
+            )
+
+    return wrapper
+
+
+@contextlib.contextmanager
+def instrumented(event_types):
+    """Time the generator functions of the given event types within a block.
+
+    The attributes found by :py:func:`callback_attributes` are replaced
+    with :py:func:`profiled` wrappers, and restored when the block ends.
+    """
+    originals = []
+    wrappers = {}
+    try:
+        for event_type in event_types:
+            for owner, attribute in callback_attributes(event_type):
+                func = getattr(owner, attribute)
+                if id(func) not in wrappers:
+                    wrappers[id(func)] = (func, profiled(func, owner.name, attribute))
+                originals.append((owner, attribute, func))
+                setattr(owner, attribute, wrappers[id(func)][1])
+        yield
+    finally:
+        for owner, attribute, func in reversed(originals):
+            setattr(owner, attribute, func)
+
+
+def format_table(callbacks, run_seconds=None, limit=20):
+    """Format the timing of generator functions as a table ranked by time.
+
+    Parameters
+    ----------
+    callbacks : dict
+        The ``callbacks`` of a :py:class:`toymc.stats.RunStats`
+    run_seconds : number, optional
+        The wall time of the whole run, to show each function's share
+    limit : int, optional
+        The maximum number of functions to list. Default: 20.
+
+    Returns
+    -------
+    str
+        The table
+    """
+    ranked = sorted(callbacks.items(), key=lambda item: -item[1]["wall_s"])
+    lines = [
+        "Generator functions by total time:",
+        "  rank    time (s)   run %     calls   us/call  vec  function",
+    ]
+    for rank, (name, entry) in enumerate(ranked[:limit], start=1):
+        share = "-".rjust(8)
+        if run_seconds:
+            share = f"{100 * entry['wall_s'] / run_seconds:7.1f}%"
+        per_call_us = 1e6 * entry["wall_s"] / max(entry["calls"], 1)
+        vectorized = "yes" if entry["vectorized"] else "no"
+        lines.append(
+            f"  {rank:4d}  {entry['wall_s']:10.3f} {share} {entry['calls']:9d} "
+            f"{per_call_us:9.2f}  {vectorized:>3}  {name}"
+        )
+    if len(ranked) > limit:
+        lines.append(f"  ... and {len(ranked) - limit} more")
+    if not ranked:
+        lines.append("  (no generator functions were called)")
+    return "\n".join(lines)
+
+
+def print_table(callbacks, run_seconds=None, limit=20, file=None):
+    """Print :py:func:`format_table` to ``file`` (default: standard error)."""
+    print(
+        format_table(callbacks, run_seconds, limit),
+        file=sys.stderr if file is None else file,
+    )
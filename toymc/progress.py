@@ -0,0 +1,265 @@
+"""Progress reporting for long runs.
+
+A run can take hours, so :py:meth:`toymc.ToyMC.run` can report its
+progress as it goes. Register a *progress hook*, any function of one
+:py:class:`Progress` argument, with
+:py:meth:`ToyMC.add_progress_hook <toymc.ToyMC.add_progress_hook>`::
+
+    >>> def log(progress):
+    ...     print(f"{progress.fraction:.0%} done, ETA {progress.eta_s:.0f} s")
+    >>> toymc.add_progress_hook(log, interval_s=60)
+
+Each hook is called at most once every ``interval_s`` seconds, after a
+chunk of events has been written, and once more at the end of the run
+(with ``state`` ``"finished"`` or ``"failed"``). Checking whether a hook
+is due costs one clock read per chunk of events, so the reporting
+overhead is negligible unless the hooks themselves are slow.
+
+The built-in :py:class:`ProgressReporter` draws a progress bar on a
+terminal (or prints one line per update otherwise, e.g. in a batch
+job's log) and/or keeps a JSON *status file* up to date for a batch
+system to poll. From the command line::
+
+    toymc run example.py out.root -t 864000 --progress --status-file out.status.json
+"""
+
+import json
+import os
+import sys
+import time
+from collections import namedtuple
+
+from toymc import stats
+
+Progress = namedtuple(
+    "Progress",
+    [
+        "state",
+        "simulated_s",
+        "duration_s",
+        "fraction",
+        "events_generated",
+        "events_written",
+        "elapsed_s",
+        "generated_per_s",
+        "written_per_s",
+        "eta_s",
+        "rss_mb",
+    ],
+)
+Progress.__doc__ = """A snapshot of the progress of a run.
+
+Attributes
+----------
+state : str
+    ``"running"``, ``"finished"`` or ``"failed"``
+simulated_s : float
+    The simulated time written so far, **in seconds** from the start of
+    the run (or shard)
+duration_s : float
+    The length of the run (or shard), **in seconds**
+fraction : float
+    ``simulated_s / duration_s``, between 0 and 1
+events_generated, events_written : int
+    The number of events generated and written so far
+elapsed_s : float
+    The wall time since the run started, **in seconds**
+generated_per_s, written_per_s : float
+    The average number of events generated and written per second
+eta_s : float or None
+    The estimated wall time until the run finishes, **in seconds**, or
+    ``None`` before any simulated time has been written
+rss_mb : float or None
+    The current resident set size of this process, in MiB, or ``None``
+    if it is not available
+"""
+
+
+def current_rss_mb():
+    """Return the current resident set size of this process, in MiB.
+
+    Where the current value is not available (it is read from
+    ``/proc/self/statm``, so on Linux only), the peak is returned, or
+    ``None`` if that is not available either (see
+    :py:func:`toymc.stats.peak_rss_mb`).
+    """
+    try:
+        with open("/proc/self/statm", encoding="utf-8") as statm:
+            pages = int(statm.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return stats.peak_rss_mb()
+    return pages * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+
+class ProgressTracker:
+    """Keep track of a run's progress and call the progress hooks.
+
+    This is an internal class and is not intended to be used by users of
+    the Toy Monte Carlo.
+
+    Parameters
+    ----------
+    hooks : list of (function, number)
+        Each progress hook and the minimum number of seconds between its
+        calls
+    t0 : number
+        The start of the run (or shard), **in seconds**
+    duration : number
+        The length of the run (or shard), **in seconds**
+    run_stats : :py:class:`toymc.stats.RunStats`
+        The stats of the run, whose ``events`` counter is the number of
+        events generated
+    """
+
+    def __init__(self, hooks, t0, duration, run_stats):
+        self.hooks = hooks
+        self.t0 = t0
+        self.duration = duration
+        self.run_stats = run_stats
+        self.start = time.monotonic()
+        self.last_called = [self.start] * len(hooks)
+        self.next_due = self.start + min(
+            (interval for _, interval in hooks), default=float("inf")
+        )
+        self.events_written = 0
+        self.last_timestamp = None
+
+    def written(self, batch):
+        """Record that a batch of events was written, calling any hooks that are due."""
+        if len(batch) == 0:
+            return
+        self.events_written += len(batch)
+        self.last_timestamp = int(batch["timestamp"][-1])
+        if time.monotonic() >= self.next_due:
+            self.call_hooks()
+
+    def finish(self, state="finished"):
+        """Call every hook with the final progress."""
+        self.call_hooks(state, force=True)
+
+    def snapshot(self, state="running"):
+        """Return the current :py:class:`Progress`."""
+        elapsed = time.monotonic() - self.start
+        if state == "finished":
+            simulated = self.duration
+        elif self.last_timestamp is None:
+            simulated = 0.0
+        else:
+            simulated = min(self.last_timestamp / 1e9 - self.t0, self.duration)
+        fraction = simulated / self.duration if self.duration > 0 else 1.0
+        generated = self.run_stats.counters.get("events", 0)
+        eta = None
+        if state == "finished":
+            eta = 0.0
+        elif fraction > 0:
+            eta = elapsed * (1 - fraction) / fraction
+        return Progress(
+            state=state,
+            simulated_s=simulated,
+            duration_s=self.duration,
+            fraction=fraction,
+            events_generated=generated,
+            events_written=self.events_written,
+            elapsed_s=elapsed,
+            generated_per_s=generated / elapsed if elapsed > 0 else 0.0,
+            written_per_s=self.events_written / elapsed if elapsed > 0 else 0.0,
+            eta_s=eta,
+            rss_mb=current_rss_mb(),
+        )
+
+    def call_hooks(self, state="running", force=False):
+        """Call the hooks that are due (or all of them, if ``force``)."""
+        now = time.monotonic()
+        progress = None
+        for i, (hook, interval) in enumerate(self.hooks):
+            if force or now - self.last_called[i] >= interval:
+                if progress is None:
+                    progress = self.snapshot(state)
+                hook(progress)
+                self.last_called[i] = now
+        self.next_due = min(
+            (
+                last + interval
+                for last, (_, interval) in zip(self.last_called, self.hooks)
+            ),
+            default=float("inf"),
+        )
+
+
+def format_duration(seconds):
+    """Format a number of seconds as ``H:MM:SS``."""
+    if seconds is None:
+        return "--:--:--"
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}"
+
+
+class ProgressReporter:
+    """A progress hook that shows a progress bar and/or writes a status file.
+
+    Parameters
+    ----------
+    stream : file, optional
+        Where to show the progress. On a terminal, a progress bar is
+        redrawn in place; otherwise one line is printed per update. If
+        ``None``, nothing is shown. Default: standard error.
+    status_file : str, optional
+        If given, write each update to this file as a JSON object with
+        the fields of :py:class:`Progress`, plus the ``outfile``, the
+        process ``pid`` and the ``updated`` time (seconds since the
+        epoch). The file is replaced atomically, so it can be read at
+        any time.
+    outfile : str, optional
+        The run's output file, to include in the status file
+    width : int, optional
+        The width of the progress bar, in characters. Default: 30.
+    """
+
+    def __init__(self, stream=sys.stderr, status_file=None, outfile=None, width=30):
+        self.stream = stream
+        self.status_file = status_file
+        self.outfile = outfile
+        self.width = width
+        self.interactive = stream is not None and stream.isatty()
+
+    def __call__(self, progress):
+        if self.stream is not None:
+            self.show(progress)
+        if self.status_file is not None:
+            self.write_status(progress)
+
+    def format(self, progress):
+        """Return a one-line description of the progress."""
+        filled = int(round(self.width * progress.fraction))
+        rss = "?" if progress.rss_mb is None else f"{progress.rss_mb:.0f}"
+        meter = "#" * filled + "." * (self.width - filled)
+        return (
+            f"[{meter}] {100 * progress.fraction:5.1f}% "
+            f"{progress.simulated_s:.0f}/{progress.duration_s:.0f} s | "
+            f"{progress.generated_per_s:,.0f} ev/s generated, "
+            f"{progress.written_per_s:,.0f} ev/s written | "
+            f"ETA {format_duration(progress.eta_s)} | RSS {rss} MB"
+        )
+
+    def show(self, progress):
+        """Show the progress on the stream."""
+        line = self.format(progress)
+        if progress.state == "failed":
+            line += " | FAILED"
+        if self.interactive:
+            end = "\n" if progress.state != "running" else ""
+            self.stream.write("\r\x1b[K" + line + end)
+        else:
+            self.stream.write(line + "\n")
+        self.stream.flush()
+
+    def write_status(self, progress):
+        """Replace the status file with the current progress."""
+        status = dict(progress._asdict())
+        status.update(outfile=self.outfile, pid=os.getpid(), updated=time.time())
+        partial_path = self.status_file + ".partial"
+        with open(partial_path, "w", encoding="utf-8") as status_file:
+            json.dump(status, status_file, indent=2)
+            status_file.write("\n")
+        os.replace(partial_path, self.status_file)
@@ -0,0 +1,347 @@
+"""Reading Toy MC output files back in.
+
+Each output backend in :py:data:`toymc.output.WRITERS` has a
+corresponding :py:class:`Reader`, listed in :py:data:`READERS`, which
+reads the events of a file as a sequence of
+:py:class:`~toymc.batch.EventBatch` chunks, so that files of any size
+can be processed with a fixed amount of memory. ROOT files (written
+with either PyROOT or uproot) are read with uproot.
+
+Example::
+
+    >>> with open_reader("out.root") as reader:
+    ...     print(reader.labels)
+    ...     for batch in reader:
+    ...         print(len(batch), batch["energy"].mean())
+
+As with the writers, the libraries needed by each reader are only
+imported when that reader is used.
+"""
+
+from abc import ABC, abstractmethod
+import contextlib
+import json
+import os
+import zipfile
+
+import numpy as np
+
+from toymc.batch import CHUNK_SIZE, EVENT_DTYPE, EventBatch
+from toymc.output import CALIB_BRANCHES, RECO_BRANCHES, TRUTH_BRANCHES
+
+
+class Reader(ABC):
+    """The base class for reading output files.
+
+    Iterating over a reader yields the file's events in chunks of at
+    most ``chunk_size`` events, in file order (which is timestamp order
+    for files written by the Toy MC). Readers can be used as context
+    managers, which close the file on exit.
+
+    Parameters
+    ----------
+    infile : str
+        The file name/location of the file to read
+    reco_name : str
+        The name of the reconstructed data TTree
+    calib_name : str
+        The name of the calibrated statistics TTree
+    chunk_size : int, optional
+        The maximum number of events per chunk. Default:
+        :py:data:`toymc.batch.CHUNK_SIZE`.
+
+    Attributes
+    ----------
+    labels : dict
+        The file's truth lookup table, mapping numbers to text labels
+    entries : int
+        The number of events in the file
+    """
+
+    def __init__(self, infile, reco_name, calib_name, chunk_size=CHUNK_SIZE):
+        self.infile = infile
+        self.reco_name = reco_name
+        self.calib_name = calib_name
+        self.chunk_size = chunk_size
+        self.labels = {}
+        self.entries = 0
+
+    def __iter__(self):
+        return self.batches()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @abstractmethod
+    def batches(self):
+        """Iterate over the file's events in chunks.
+
+        Yields
+        ------
+        :py:class:`~toymc.batch.EventBatch`
+            The next chunk of events
+        """
+
+    @abstractmethod
+    def close(self):
+        """Close the file."""
+
+
+def batch_from_branches(size, trees):
+    """Assemble an :py:class:`~toymc.batch.EventBatch` from TBranch values.
+
+    This is the inverse of :py:func:`toymc.output.branch_columns`.
+
+    Parameters
+    ----------
+    size : int
+        The number of events
+    trees : list of (dict, tuple)
+        For each TTree, a dict mapping TBranch names to arrays of
+        values, and the ``*_BRANCHES`` table describing the TTree
+
+    Returns
+    -------
+    :py:class:`~toymc.batch.EventBatch`
+        The events
+    """
+    batch = EventBatch.empty(size)
+    derived = {}
+    for arrays, branches in trees:
+        for branch, field, _ in branches:
+            if field in EVENT_DTYPE.names:
+                batch.array[field] = arrays[branch]
+            else:
+                derived[field] = np.asarray(arrays[branch], dtype=np.int64)
+    batch.array["timestamp"] = (
+        derived["timestamp_seconds"] * 1000000000 + derived["timestamp_nanoseconds"]
+    )
+    return batch
+
+
+class UprootReader(Reader):
+    """Reader for ROOT files, using uproot.
+
+    The events are read from the ``/Event/Rec/<reco_name>``,
+    ``/Event/Data/<calib_name>`` and ``/MCTruth`` TTrees, which must
+    have the same number of entries, and the lookup table from the
+    named (non-``_<number>``) branches of ``/MCTruthLookup``, if there
+    is one.
+    """
+
+    def __init__(self, infile, reco_name, calib_name, chunk_size=CHUNK_SIZE):
+        import uproot  # pylint: disable=import-outside-toplevel
+
+        super().__init__(infile, reco_name, calib_name, chunk_size)
+        self.file = uproot.open(infile)
+        self.trees = [
+            (self.file["Event/Rec/" + reco_name], RECO_BRANCHES),
+            (self.file["Event/Data/" + calib_name], CALIB_BRANCHES),
+            (self.file["MCTruth"], TRUTH_BRANCHES),
+        ]
+        entries = {tree.num_entries for tree, _ in self.trees}
+        if len(entries) != 1:
+            counts = [tree.num_entries for tree, _ in self.trees]
+            raise ValueError(
+                f"The TTrees in {infile!r} have different numbers of entries: "
+                f"{counts}"
+            )
+        self.entries = entries.pop()
+        if "MCTruthLookup" in self.file:
+            lookup = self.file["MCTruthLookup"]
+            names = [name for name in lookup.keys() if not name.startswith("_")]
+            values = lookup.arrays(names, library="np")
+            self.labels = {int(values[name][0]): name for name in names}
+
+    def batches(self):
+        for start in range(0, self.entries, self.chunk_size):
+            stop = min(start + self.chunk_size, self.entries)
+            trees = []
+            for tree, branches in self.trees:
+                arrays = tree.arrays(
+                    [branch for branch, _, _ in branches],
+                    entry_start=start,
+                    entry_stop=stop,
+                    library="np",
+                )
+                trees.append((arrays, branches))
+            yield batch_from_branches(stop - start, trees)
+
+    def close(self):
+        self.file.close()
+
+
+class ParquetReader(Reader):
+    """Reader for Parquet files written by :py:class:`~toymc.output.ParquetWriter`."""
+
+    def __init__(self, infile, reco_name, calib_name, chunk_size=CHUNK_SIZE):
+        import pyarrow.parquet  # pylint: disable=import-outside-toplevel
+
+        super().__init__(infile, reco_name, calib_name, chunk_size)
+        self.file = pyarrow.parquet.ParquetFile(infile)
+        self.entries = self.file.metadata.num_rows
+        metadata = self.file.schema_arrow.metadata or {}
+        lookup = json.loads(metadata.get(b"toymc.truth_lookup", b"{}"))
+        self.labels = {int(number): label for number, label in lookup.items()}
+
+    def batches(self):
+        for table in self.file.iter_batches(
+            batch_size=self.chunk_size, columns=list(EVENT_DTYPE.names)
+        ):
+            columns = {
+                name: table.column(name).to_numpy() for name in EVENT_DTYPE.names
+            }
+            yield EventBatch.from_columns(table.num_rows, **columns)
+
+    def close(self):
+        self.file.close()
+
+
+def labels_from_table(table):
+    """Convert a lookup table from :py:func:`toymc.output.lookup_table` to a dict."""
+    return {int(number): label.decode() for number, label in table.tolist()}
+
+
+class HDF5Reader(Reader):
+    """Reader for HDF5 files written by :py:class:`~toymc.output.HDF5Writer`."""
+
+    def __init__(self, infile, reco_name, calib_name, chunk_size=CHUNK_SIZE):
+        import h5py  # pylint: disable=import-outside-toplevel
+
+        super().__init__(infile, reco_name, calib_name, chunk_size)
+        self.file = h5py.File(infile, "r")
+        self.datasets = {name: self.file["events"][name] for name in EVENT_DTYPE.names}
+        self.entries = len(self.datasets["timestamp"])
+        self.labels = labels_from_table(self.file["truth_lookup"][()])
+
+    def batches(self):
+        for start in range(0, self.entries, self.chunk_size):
+            stop = min(start + self.chunk_size, self.entries)
+            columns = {
+                name: dataset[start:stop] for name, dataset in self.datasets.items()
+            }
+            yield EventBatch.from_columns(stop - start, **columns)
+
+    def close(self):
+        self.file.close()
+
+
+class NpzReader(Reader):
+    """Reader for ``.npz`` archives written by :py:class:`~toymc.output.NpzWriter`.
+
+    Rather than loading whole arrays with ``numpy.load``, the columns
+    are streamed from the archive a chunk at a time.
+    """
+
+    def __init__(self, infile, reco_name, calib_name, chunk_size=CHUNK_SIZE):
+        super().__init__(infile, reco_name, calib_name, chunk_size)
+        self.exit_stack = contextlib.ExitStack()
+        self.file = self.exit_stack.enter_context(zipfile.ZipFile(infile))
+        with self.file.open("truth_lookup.npy") as member:
+            self.labels = labels_from_table(np.load(member))
+        with self.file.open("timestamp.npy") as member:
+            self.entries = self.read_header(member)[0][0]
+
+    @staticmethod
+    def read_header(member):
+        """Read the header of a ``.npy`` file, returning ``(shape, dtype)``."""
+        version = np.lib.format.read_magic(member)
+        if version == (1, 0):
+            shape, _, dtype = np.lib.format.read_array_header_1_0(member)
+        else:
+            shape, _, dtype = np.lib.format.read_array_header_2_0(member)
+        return shape, dtype
+
+    def batches(self):
+        members = {}
+        dtypes = {}
+        with contextlib.ExitStack() as members_stack:
+            for name in EVENT_DTYPE.names:
+                members[name] = members_stack.enter_context(
+                    self.file.open(name + ".npy")
+                )
+                _, dtypes[name] = self.read_header(members[name])
+            for start in range(0, self.entries, self.chunk_size):
+                size = min(self.chunk_size, self.entries - start)
+                columns = {
+                    name: np.frombuffer(
+                        member.read(size * dtypes[name].itemsize), dtype=dtypes[name]
+                    )
+                    for name, member in members.items()
+                }
+                yield EventBatch.from_columns(size, **columns)
+
+    def close(self):
+        self.exit_stack.close()
+
+
+READERS = {
+    "root": UprootReader,
+    "uproot": UprootReader,
+    "parquet": ParquetReader,
+    "hdf5": HDF5Reader,
+    "npz": NpzReader,
+}
+"""The available readers, by the same format names as
+:py:data:`toymc.output.WRITERS`."""
+
+EXTENSIONS = {
+    ".root": "root",
+    ".parquet": "parquet",
+    ".pq": "parquet",
+    ".h5": "hdf5",
+    ".hdf5": "hdf5",
+    ".npz": "npz",
+}
+"""The format names associated with each file name extension."""
+
+
+def format_from_path(path):
+    """Guess a file's format from its extension, using :py:data:`EXTENSIONS`."""
+    ext = os.path.splitext(path)[1].lower()
+    try:
+        return EXTENSIONS[ext]
+    except KeyError:
+        raise ValueError(
+            f"Cannot determine the format of {path!r} from its extension"
+        ) from None
+
+
+def open_reader(
+    infile,
+    input_format=None,
+    reco_name="AdSimpleNL",
+    calib_name="CalibStats",
+    chunk_size=CHUNK_SIZE,
+):
+    """Open an output file for reading.
+
+    Parameters
+    ----------
+    infile : str
+        The file to read
+    input_format : str, optional
+        One of the keys of :py:data:`READERS`. Default: determined from
+        the file name with :py:func:`format_from_path`.
+    reco_name, calib_name : str, optional
+        The names of the TTrees, for ROOT files
+    chunk_size : int, optional
+        The maximum number of events per chunk
+
+    Returns
+    -------
+    :py:class:`Reader`
+        The reader
+    """
+    if input_format is None:
+        input_format = format_from_path(infile)
+    try:
+        reader_class = READERS[input_format]
+    except KeyError:
+        raise ValueError(
+            f"Unknown input format {input_format!r}, expected one of {sorted(READERS)}"
+        ) from None
+    return reader_class(infile, reco_name, calib_name, chunk_size)
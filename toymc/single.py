@@ -27,6 +27,20 @@ generate and return an energy value. Then assign the function to the
 
     >>> single.energy_spectrum = my_energy_function
 
+Singles are usually the highest-rate event type, so
+:py:meth:`Single.generate_batch` draws all of the energies and positions
+at once. For this to work, the spectrum functions need to be able to
+produce many values in a single call: decorate them with
+:py:func:`toymc.util.vectorized` and accept an optional ``size``
+argument, following the NumPy convention::
+
+    >>> @toymc.util.vectorized
+    ... def my_energy_function(rng, size=None):
+    ...     return rng.normal(2, 0.5, size)
+
+Functions without the decorator still work, but are called once per
+event.
+
 The other configurable is :py:attr:`~Single.position_spectrum_mm`.
 This function is called to generate the (x, y, z) position for each
 event (**in millimeters**). Because generating random positions
@@ -65,19 +79,24 @@ class Single(toymc.EventType):
         Events created by this object. Default: ``0x10001100``.
     energy_spectrum : function(rng) -> number
         The energy generator function. Default: uniform between
-        1 and 3.5.
+        1 and 3.5 (vectorized).
     position_spectrum_mm : function(rng) -> (number, number, number)
         The position generator function, **in millimeters**. Default: uniform
-        within a 4m x 4m cylinder.
+        within a 4m x 4m cylinder (vectorized).
     """
 
+    EVENT_METHODS = ("generate_events", "new_event", "physical_quantities")
+    """The methods that :py:meth:`Single.generate_batch` replaces."""
+
     def __init__(self, name, rate_Hz, site, detector):
         super().__init__(name)
         self.rate_hz = rate_Hz
         self.site = site
         self.detector = detector
         self.trigger_type = 0x10001100
-        self.energy_spectrum = lambda rng: rng.uniform(1, 3.5)
+        self.energy_spectrum = util.vectorized(
+            lambda rng, size=None: rng.uniform(1, 3.5, size)
+        )
         default_radius = 2000
         self.position_spectrum_mm = util.rng_uniform_cylinder(
             default_radius, 2 * default_radius
@@ -101,6 +120,69 @@ class Single(toymc.EventType):
             events.append(event)
         return events
 
+    def generate_batch(self, rng, duration_s, t0_s, count=None):
+        """Generate single uncorrelated events over the given duration.
+
+        This is an internal function and is not intended to be called
+        by users of the Toy Monte Carlo.
+
+        This is the array version of :py:meth:`Single.generate_events`.
+        The energies and positions for all events are drawn at once
+        using :py:func:`toymc.util.sample`. If given, ``count`` is the
+        number of events to generate.
+
+        Subclasses that override :py:meth:`Single.generate_events`,
+        :py:meth:`Single.new_event` or
+        :py:meth:`Single.physical_quantities` are generated with those
+        methods instead.
+        """
+        if self.overrides(Single, Single.EVENT_METHODS):
+            return super().generate_batch(rng, duration_s, t0_s, count)
+        if count is None:
+            count = self.event_count(rng, duration_s)
+        duration_ns = int(1e9) * duration_s
+        start_ns = int(1e9) * t0_s
+        end_ns = start_ns + duration_ns
+        timestamps = rng.integers(start_ns, end_ns, size=count)
+        energies = util.sample(self.energy_spectrum, rng, count)
+        positions = util.sample(self.position_spectrum_mm, rng, count)
+        positions = positions.reshape(count, 3)
+        return toymc.EventBatch.from_energies(
+            count,
+            energies,
+            positions,
+            truth_index=self.truth_label,
+            timestamp=timestamps,
+            detector=self.detector,
+            trigger_type=self.trigger_type,
+            site=self.site,
+        )
+
+    def event_count(self, rng, duration_s):
+        """Return the number of events to generate over the given duration.
+
+        This is an internal function and is not intended to be called
+        by users of the Toy Monte Carlo.
+
+        Returns ``None`` for subclasses that are generated with
+        :py:meth:`Single.generate_events` (see
+        :py:meth:`Single.generate_batch`), which determines the number
+        of events itself.
+        """
+        if self.overrides(Single, Single.EVENT_METHODS):
+            return super().event_count(rng, duration_s)
+        return self.actual_event_count(rng, duration_s, self.rate_hz)
+
+    def subtype_counts(self, count):
+        """Return the number of events for a count from :py:meth:`Single.event_count`.
+
+        This is an internal function and is not intended to be called
+        by users of the Toy Monte Carlo.
+        """
+        if count is None:
+            return super().subtype_counts(count)
+        return {self.truth_label: count}
+
     def labels(self):
         """Return a labels dict whose sole value is ``self.name``."""
         return {self.truth_label: self.name}
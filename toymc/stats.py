@@ -0,0 +1,327 @@
+"""Timing and counters for a run of the Toy MC.
+
+While :py:meth:`toymc.ToyMC.run` is running, it collects a
+:py:class:`RunStats` describing where the time went and what was
+generated. The result is returned from ``run()`` and (by default)
+written as JSON next to the output file, e.g. ``out.root.report.json``::
+
+    {
+      "events": 1739418,
+      "wall_s": 12.1,
+      "stages": {"generate": {"wall_s": 4.2, "cpu_s": 4.1, "calls": 12}, ...},
+      "event_types": {"Muon": {"wall_s": 1.9, ..., "counters": {...}}, ...},
+      "subtypes": {"Muon_WP": 1000210, ...},
+      ...
+    }
+
+The memory use and the CPU time of the workers (``peak_rss_mb``,
+``workers_peak_rss_mb`` and ``workers_cpu_s``) are ``None`` where the
+:py:mod:`resource` module is not available (e.g. on Windows).
+
+Stages
+------
+
+The time of each call is assigned to exactly one stage: time spent in a
+nested stage is not counted again for the stage around it. The stages
+are:
+
+``plan``
+    Determining the number of events of each type for each time window
+``generate``
+    Generating events, in :py:meth:`toymc.EventType.generate_batch`
+``sort``
+    Sorting each event type's events by timestamp
+``merge``
+    Merging the sorted streams of all event types into one stream
+``wait``
+    Waiting for worker processes to return their events
+``shard_io``
+    Writing and reading the temporary files of time shards
+``write``
+    Passing events to the output backend, and closing the output file
+
+Stages that run in worker processes are added up over all of the
+workers, so with several workers the total can exceed the wall time of
+the run.
+
+Event types and counters
+------------------------
+
+For each event type (by name), the report has the time spent generating
+and sorting its events, and its counters: the number of ``events``
+generated and, for event types that use rejection sampling (e.g. the
+default delayed positions of :py:class:`~toymc.correlated.Correlated`),
+the number of ``rejection_trials`` and ``rejection_accepted`` values.
+The number of events written for each subtype is reported by truth
+label.
+
+Custom event types and generator functions can add their own counters
+with :py:func:`count`, which does nothing when no run is being
+collected.
+
+With ``ToyMC(..., profile_callbacks=True)``, the report also has the
+number of calls and the time spent in each generator function of each
+event type, under ``callbacks``. See :py:mod:`toymc.profiling`.
+"""
+
+import contextlib
+import sys
+import time
+
+import numpy as np
+
+_active = None
+
+
+def _new_entry():
+    """Return a new, empty timing entry."""
+    return {"wall_s": 0.0, "cpu_s": 0.0, "calls": 0}
+
+
+class RunStats:
+    """Timing and counters collected over (part of) a run.
+
+    Attributes
+    ----------
+    stages : dict
+        For each stage name, the ``wall_s``, ``cpu_s`` and number of
+        ``calls``, excluding time spent in nested stages
+    event_types : dict
+        For each event type name, the ``wall_s``, ``cpu_s`` and number
+        of ``calls`` spent generating its events (including sorting),
+        and its ``counters``
+    counters : dict
+        The total of each counter over all event types
+    truth_counts : dict
+        The number of events written for each truth number
+    callbacks : dict
+        For each ``"<event type name>.<attribute>"`` generator function
+        timed by :py:mod:`toymc.profiling`, the ``event_type``,
+        ``attribute``, whether it is ``vectorized``, and the ``wall_s``
+        and number of ``calls``
+    """
+
+    def __init__(self):
+        self.stages = {}
+        self.event_types = {}
+        self.counters = {}
+        self.truth_counts = {}
+        self.callbacks = {}
+        self._stack = []
+
+    @contextlib.contextmanager
+    def stage(self, name, event_type=None):
+        """Time the code in a ``with`` block as the given stage.
+
+        Parameters
+        ----------
+        name : str
+            The name of the stage
+        event_type : str, optional
+            If given, also count the time (including nested stages) for
+            this event type, and count any counters incremented within
+            the block for it
+        """
+        nested = [0.0, 0.0]
+        self._stack.append((event_type, nested))
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - wall_start
+            cpu = time.process_time() - cpu_start
+            self._stack.pop()
+            if self._stack:
+                outer = self._stack[-1][1]
+                outer[0] += wall
+                outer[1] += cpu
+            self._add_time(self.stages, name, wall - nested[0], cpu - nested[1])
+            if event_type is not None:
+                self._add_time(self.event_types, event_type, wall, cpu)
+
+    def timed(self, name, iterable):
+        """Iterate over ``iterable``, timing each step as the given stage."""
+        iterator = iter(iterable)
+        while True:
+            with self.stage(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def count(self, name, amount=1):
+        """Add ``amount`` to a counter, for the current event type and in total."""
+        self.counters[name] = self.counters.get(name, 0) + amount
+        for event_type, _ in reversed(self._stack):
+            if event_type is not None:
+                counters = self._entry(self.event_types, event_type)["counters"]
+                counters[name] = counters.get(name, 0) + amount
+                break
+
+    def count_truth(self, truth_index):
+        """Count the events written for each truth number."""
+        numbers, counts = np.unique(truth_index, return_counts=True)
+        for number, n in zip(numbers.tolist(), counts.tolist()):
+            self.truth_counts[number] = self.truth_counts.get(number, 0) + n
+
+    def record_callback(self, event_type, attribute, vectorized, wall):
+        """Record one call to a generator function that took ``wall`` seconds."""
+        name = f"{event_type}.{attribute}"
+        entry = self.callbacks.get(name)
+        if entry is None:
+            entry = self.callbacks[name] = {
+                "event_type": event_type,
+                "attribute": attribute,
+                "vectorized": vectorized,
+                "wall_s": 0.0,
+                "calls": 0,
+            }
+        entry["wall_s"] += wall
+        entry["calls"] += 1
+
+    def add(self, other):
+        """Add the results of another :py:meth:`to_dict`, e.g. from a worker."""
+        for table, other_table in (
+            (self.stages, other["stages"]),
+            (self.event_types, other["event_types"]),
+        ):
+            for name, entry in other_table.items():
+                mine = self._entry(table, name)
+                for key in ("wall_s", "cpu_s", "calls"):
+                    mine[key] += entry[key]
+                for counter, amount in entry.get("counters", {}).items():
+                    mine["counters"][counter] = (
+                        mine["counters"].get(counter, 0) + amount
+                    )
+        for name, amount in other["counters"].items():
+            self.counters[name] = self.counters.get(name, 0) + amount
+        for number, n in other["truth_counts"].items():
+            self.truth_counts[number] = self.truth_counts.get(number, 0) + n
+        for name, entry in other["callbacks"].items():
+            if name in self.callbacks:
+                self.callbacks[name]["wall_s"] += entry["wall_s"]
+                self.callbacks[name]["calls"] += entry["calls"]
+            else:
+                self.callbacks[name] = dict(entry)
+
+    def to_dict(self):
+        """Return the collected results as a dict of plain Python values."""
+        return {
+            "stages": self.stages,
+            "event_types": self.event_types,
+            "counters": self.counters,
+            "truth_counts": self.truth_counts,
+            "callbacks": self.callbacks,
+        }
+
+    def _entry(self, table, name):
+        """Return the entry for ``name`` in ``table``, creating it if needed."""
+        if name not in table:
+            table[name] = _new_entry()
+            if table is self.event_types:
+                table[name]["counters"] = {}
+        return table[name]
+
+    def _add_time(self, table, name, wall, cpu):
+        entry = self._entry(table, name)
+        entry["wall_s"] += wall
+        entry["cpu_s"] += cpu
+        entry["calls"] += 1
+
+
+@contextlib.contextmanager
+def collecting(run_stats):
+    """Collect the stages and counters in this process into ``run_stats``."""
+    global _active  # pylint: disable=global-statement
+    previous = _active
+    _active = run_stats
+    try:
+        yield run_stats
+    finally:
+        _active = previous
+
+
+def stage(name, event_type=None):
+    """Time a ``with`` block as a stage of the run being collected, if any.
+
+    See :py:meth:`RunStats.stage`.
+    """
+    if _active is None:
+        return contextlib.nullcontext()
+    return _active.stage(name, event_type)
+
+
+def timed(name, iterable):
+    """Iterate over ``iterable``, timing each step as a stage of the run, if any.
+
+    See :py:meth:`RunStats.timed`.
+    """
+    if _active is None:
+        return iterable
+    return _active.timed(name, iterable)
+
+
+def count(name, amount=1):
+    """Add ``amount`` to a counter of the run being collected, if any."""
+    if _active is not None:
+        _active.count(name, amount)
+
+
+def record_callback(event_type, attribute, vectorized, wall):
+    """Record a call to a generator function in the run being collected, if any.
+
+    See :py:meth:`RunStats.record_callback`.
+    """
+    if _active is not None:
+        _active.record_callback(event_type, attribute, vectorized, wall)
+
+
+def add(other):
+    """Add results from a worker process to the run being collected, if any."""
+    if _active is not None:
+        _active.add(other)
+
+
+def _rusage(children):
+    """Return the resource usage of this process or of its children.
+
+    Returns ``None`` where the :py:mod:`resource` module is not available
+    (e.g. on Windows).
+    """
+    try:
+        import resource  # pylint: disable=import-outside-toplevel
+    except ImportError:
+        return None
+    return resource.getrusage(
+        resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF
+    )
+
+
+def peak_rss_mb(children=False):
+    """Return the peak resident set size, in MiB, or ``None`` if unavailable.
+
+    Parameters
+    ----------
+    children : bool, optional
+        If ``True``, return the peak of the largest finished child
+        process (e.g. a worker) instead of this process. Default:
+        ``False``.
+    """
+    usage = _rusage(children)
+    if usage is None:
+        return None
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    return usage.ru_maxrss / (2**20 if sys.platform == "darwin" else 2**10)
+
+
+def children_cpu_s():
+    """Return the CPU time used by the finished child processes, in seconds.
+
+    Returns ``None`` if it is not available.
+    """
+    usage = _rusage(True)
+    if usage is None:
+        return None
+    return usage.ru_utime + usage.ru_stime
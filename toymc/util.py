@@ -1,6 +1,234 @@
-"""Utility functions for toymc."""
-
+"""Utility functions for toymc.
+
+Most of the generator functions created by this module follow the NumPy
+convention for random sampling: when called as ``func(rng)`` they return
+a single value, and when called as ``func(rng, size)`` they return an
+array of ``size`` values (or a ``(size, 3)`` array for positions). Such
+functions are marked with :py:func:`vectorized` so that event types can
+generate all of the values they need in a single call using
+:py:func:`sample`. Functions that are not marked are adapted by
+:py:func:`as_batch`, which calls them once per value.
+
+Spectra from histograms
+-----------------------
+
+Measured spectra usually come as histograms. :py:func:`rng_histogram`
+creates a generator function that draws from a histogram's distribution
+(uniformly within each bin) using a precomputed inverse-CDF table, and
+:py:func:`rng_discrete` one that draws from a list of weighted values
+(e.g. ADs or nHit values) using a Walker alias table. Both draw ``size``
+values with a fixed number of vectorized NumPy operations. ROOT
+histograms (PyROOT ``TH1`` or uproot) are supported through
+:py:func:`rng_th1`::
+
+    >>> single.energy_spectrum = toymc.util.rng_th1(infile.Get("h_singles"))
+
+The tables are saved in a cache directory (see
+:py:func:`table_cache_dir`), keyed by a SHA-256 hash of the histogram's
+contents, so each table is only built once even across processes and
+runs.
+"""
+
+import functools
+import hashlib
 import math
+import os
+import tempfile
+
+import numpy as np
+
+from toymc import stats
+
+
+def vectorized(func):
+    """Declare that a generator function produces many values per call.
+
+    This decorator is how you opt in to the array-aware generator
+    contract. The decorated function must accept ``(rng, size)`` and
+    return an array whose first dimension has length ``size``. Event
+    types then call it once per batch of events rather than once per
+    event. To also support the one-value-per-call contract (e.g. for
+    :py:meth:`EventType.generate_events <toymc.EventType.generate_events>`),
+    give ``size`` a default of ``None`` and return a single value in
+    that case, just like the NumPy ``Generator`` methods do.
+
+    Example::
+
+        >>> @toymc.util.vectorized
+        ... def energy_spectrum(rng, size=None):
+        ...     return rng.normal(2, 0.5, size)
+
+    For correlated position generators (functions of ``(rng,
+    start_position)``), the decorator means that the function accepts an
+    ``(N, 3)`` array of start positions and returns an ``(N, 3)`` array.
+
+    Parameters
+    ----------
+    func : function of (rng, size)
+        The function to mark
+
+    Returns
+    -------
+    func : function of (rng, size)
+        The same function, now recognized by :py:func:`is_vectorized`.
+        Objects that cannot take new attributes (e.g. bound methods) are
+        wrapped in a new function instead.
+    """
+    try:
+        func.vectorized = True
+    except AttributeError:
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            return func(*args, **kwargs)
+
+        wrapper.vectorized = True
+        return wrapper
+    return func
+
+
+def is_vectorized(func):
+    """Return whether the given function was marked with :py:func:`vectorized`."""
+    return getattr(func, "vectorized", False)
+
+
+def as_batch(spectrum):
+    """Adapt any generator function to the array-aware contract.
+
+    Functions marked with :py:func:`vectorized` are returned unchanged.
+    Other functions are assumed to follow the original contract of
+    returning one value per call, and are wrapped in an adapter that
+    calls them ``size`` times.
+
+    Parameters
+    ----------
+    spectrum : function of rng
+        The generator function, e.g. an ``energy_spectrum`` attribute
+
+    Returns
+    -------
+    batch_spectrum : function of (rng, size=None)
+        A vectorized function drawing from the same distribution
+    """
+    if is_vectorized(spectrum):
+        return spectrum
+
+    @vectorized
+    @functools.wraps(spectrum)
+    def batch_spectrum(rng, size=None):
+        if size is None:
+            return spectrum(rng)
+        return np.array([spectrum(rng) for _ in range(size)])
+
+    return batch_spectrum
+
+
+def as_batch_correlated(generator):
+    """Adapt any correlated position generator to the array-aware contract.
+
+    This is the counterpart of :py:func:`as_batch` for functions of
+    ``(rng, start_position)``. Unmarked functions are wrapped in an
+    adapter that calls them once per row of an ``(N, 3)`` array of
+    start positions.
+
+    Parameters
+    ----------
+    generator : function of (rng, (x, y, z))
+        The correlated position generator function
+
+    Returns
+    -------
+    batch_generator : function of (rng, start_positions)
+        A vectorized function drawing from the same distribution
+    """
+    if is_vectorized(generator):
+        return generator
+
+    @vectorized
+    @functools.wraps(generator)
+    def batch_generator(rng, start_positions):
+        if np.ndim(start_positions) < 2:
+            return generator(rng, start_positions)
+        positions = [generator(rng, tuple(start)) for start in start_positions]
+        return np.array(positions).reshape(len(start_positions), 3)
+
+    return batch_generator
+
+
+def sample(spectrum, rng, size):
+    """Draw ``size`` values from a generator function as an array.
+
+    The function is adapted with :py:func:`as_batch`, so functions
+    marked with :py:func:`vectorized` are called once and other
+    functions are called once per value.
+
+    Parameters
+    ----------
+    spectrum : function of rng
+        The generator function, e.g. an ``energy_spectrum`` attribute
+    rng : numpy.random.Generator
+        The random generator to use
+    size : int
+        The number of values to draw
+
+    Returns
+    -------
+    values : numpy.ndarray
+        The drawn values, with first dimension of length ``size``
+
+    Raises
+    ------
+    ValueError
+        If the function returns the wrong number of values
+    """
+    values = np.asarray(as_batch(spectrum)(rng, size))
+    _check_length(spectrum, values, size)
+    return values
+
+
+def sample_correlated(generator, rng, start_positions):
+    """Draw one correlated position for each of the given start positions.
+
+    This is the counterpart of :py:func:`sample` for generator functions
+    of ``(rng, start_position)``, such as
+    :py:attr:`Correlated.delayed_pos_from_prompt_mm
+    <toymc.correlated.Correlated.delayed_pos_from_prompt_mm>`. The
+    function is adapted with :py:func:`as_batch_correlated`.
+
+    Parameters
+    ----------
+    generator : function of (rng, start_position)
+        The correlated position generator function
+    rng : numpy.random.Generator
+        The random generator to use
+    start_positions : numpy.ndarray of shape (N, 3)
+        The positions that the new positions should be correlated to
+
+    Returns
+    -------
+    positions : numpy.ndarray of shape (N, 3)
+        The generated positions
+
+    Raises
+    ------
+    ValueError
+        If the function returns the wrong number of positions
+    """
+    start_positions = np.asarray(start_positions).reshape(-1, 3)
+    positions = np.asarray(as_batch_correlated(generator)(rng, start_positions))
+    _check_length(generator, positions, len(start_positions))
+    return positions.reshape(len(start_positions), 3)
+
+
+def _check_length(func, values, size):
+    """Raise a ValueError if values does not have length size."""
+    returned = len(values) if np.ndim(values) > 0 else "a single value"
+    if returned != size:
+        name = getattr(func, "__name__", func)
+        raise ValueError(
+            f"Generator {name!r} returned {returned} but {size} values were "
+            "requested"
+        )
 
 
 def within_circle(radius, trial):
@@ -26,6 +254,205 @@ def within_circle(radius, trial):
     return x, y
 
 
+def within_circle_batch(radius, trial, size, max_oversample=16):
+    """Generate trials until each of ``size`` results lies within a circle.
+
+    This is the array version of :py:func:`within_circle`. Rather than
+    repeating one trial at a time, all of the points that are still
+    outside the circle are redrawn together until none remain. After the
+    first round, each remaining point gets several trials at once (based
+    on the acceptance rate observed so far) and keeps the first one that
+    lands inside the circle, so that few rounds are needed even when the
+    acceptance rate is low. Keeping the first accepted trial means the
+    result has exactly the same distribution as repeating single
+    trials.
+
+    Parameters
+    ----------
+    radius : number
+        The radius of the circle to bound the results of ``trial``
+    trial : function of index array returning (array, array)
+        The function to execute repeatedly. It is given the indices of
+        the points that still need to be generated (possibly with
+        repeats) and must return the x and y coordinates of a new,
+        independent trial for each entry.
+    size : int
+        The number of points to generate
+    max_oversample : int, optional
+        The maximum number of trials to draw at once for each remaining
+        point. Default: 16.
+
+    Returns
+    -------
+    coordinates : (numpy.ndarray, numpy.ndarray)
+        The x and y coordinates (each an array of length ``size``) of
+        points generated by the trial function that lie within the
+        given circle
+    """
+    x = np.empty(size)
+    y = np.empty(size)
+    pending = np.arange(size)
+    oversample = 1
+    while pending.size > 0:
+        candidates = np.repeat(pending, oversample)
+        stats.count("rejection_trials", len(candidates))
+        trial_x, trial_y = trial(candidates)
+        inside = np.hypot(trial_x, trial_y) <= radius
+        accepted = candidates[inside]
+        # candidates is sorted, so the first accepted trial for each
+        # point is wherever the index changes
+        first = np.flatnonzero(np.diff(accepted, prepend=-1) != 0)
+        accepted_inside = np.flatnonzero(inside)[first]
+        x[accepted[first]] = trial_x[accepted_inside]
+        y[accepted[first]] = trial_y[accepted_inside]
+        done = np.zeros(size, dtype=bool)
+        done[accepted] = True
+        pending = pending[~done[pending]]
+        acceptance = max(np.count_nonzero(inside), 1) / len(candidates)
+        oversample = min(max_oversample, math.ceil(1.2 / acceptance))
+    stats.count("rejection_accepted", size)
+    return x, y
+
+
+def uniform_circle_batch(rng, radius, size):
+    """Draw points uniformly from within a circle centered at the origin.
+
+    The points are drawn directly (without rejection) by sampling the
+    square of the radius uniformly along with a uniform angle.
+
+    Parameters
+    ----------
+    rng : numpy.random.Generator
+        The random generator to use
+    radius : number
+        The radius of the circle
+    size : int
+        The number of points to draw
+
+    Returns
+    -------
+    points : numpy.ndarray of shape (size, 2)
+        The x and y coordinates of the points
+    """
+    r = radius * np.sqrt(rng.random(size))
+    phi = rng.uniform(0, 2 * np.pi, size)
+    return np.column_stack((r * np.cos(phi), r * np.sin(phi)))
+
+
+def uniform_cylinder_batch(rng, radius, height, size):
+    """Draw points uniformly from within a cylinder centered at the origin.
+
+    The cylinder's axis lies along the Z axis.
+
+    Parameters
+    ----------
+    rng : numpy.random.Generator
+        The random generator to use
+    radius : number
+        The radius of the cylinder
+    height : number
+        The height of the cylinder
+    size : int
+        The number of points to draw
+
+    Returns
+    -------
+    points : numpy.ndarray of shape (size, 3)
+        The x, y and z coordinates of the points
+    """
+    xy = uniform_circle_batch(rng, radius, size)
+    z = rng.uniform(-height / 2, height / 2, size)
+    return np.column_stack((xy, z))
+
+
+def correlated_expo_interval_batch(rng, starts, low, high, exp_scale):
+    """Displace each start value by an exponential amount within an interval.
+
+    Each new value is ``start +/- d``, with ``d`` drawn from an
+    exponential distribution and the sign chosen at random, conditioned
+    on the new value lying within ``[low, high]``. This is the same
+    distribution as repeating unconstrained trials until one lands in
+    the interval, but it is drawn directly using the inverse CDF of the
+    truncated exponential on each side of the start value.
+
+    Parameters
+    ----------
+    rng : numpy.random.Generator
+        The random generator to use
+    starts : numpy.ndarray
+        The values to displace. Should lie within ``[low, high]``.
+    low, high : number
+        The bounds of the interval
+    exp_scale : number
+        The scale parameter for the exponential
+
+    Returns
+    -------
+    values : numpy.ndarray
+        The displaced values, with the same shape as ``starts``
+    """
+    starts = np.asarray(starts, dtype=float)
+    room_up = np.clip(high - starts, 0, None)
+    room_down = np.clip(starts - low, 0, None)
+    # -expm1(-L/s) is the probability that an unconstrained exponential
+    # displacement stays within a distance L
+    mass_up = -np.expm1(-room_up / exp_scale)
+    mass_down = -np.expm1(-room_down / exp_scale)
+    total_mass = mass_up + mass_down
+    prob_up = np.divide(
+        mass_up, total_mass, out=np.full(starts.shape, 0.5), where=total_mass > 0
+    )
+    going_up = rng.random(starts.shape) < prob_up
+    room = np.where(going_up, room_up, room_down)
+    # Inverse CDF of an exponential truncated at distance room
+    truncation = np.expm1(-room / exp_scale)
+    displacement = -exp_scale * np.log1p(rng.random(starts.shape) * truncation)
+    return np.where(going_up, starts + displacement, starts - displacement)
+
+
+def correlated_expo_cylinder_batch(rng, radius, height, exp_scale, start_positions):
+    """Draw points correlated to the start positions within a cylinder.
+
+    This is the array version of the generator created by
+    :py:func:`rng_correlated_expo_cylinder`. The z coordinate is drawn
+    directly with :py:func:`correlated_expo_interval_batch`. The x and y
+    coordinates are drawn together by rejection, since the circular
+    boundary couples them, using :py:func:`within_circle_batch`.
+
+    Parameters
+    ----------
+    rng : numpy.random.Generator
+        The random generator to use
+    radius : number
+        The radius of the cylinder
+    height : number
+        The height of the cylinder
+    exp_scale : number
+        The scale parameter for the exponential displacement
+    start_positions : numpy.ndarray of shape (N, 3)
+        The positions that the new points should be correlated to
+
+    Returns
+    -------
+    points : numpy.ndarray of shape (N, 3)
+        The x, y and z coordinates of the new points
+    """
+    start_positions = np.asarray(start_positions, dtype=float)
+
+    def xy_trial(candidates):
+        displacement = rng.exponential(exp_scale, size=(2, len(candidates)))
+        signs = 2 * rng.integers(0, 2, size=(2, len(candidates))) - 1
+        x = start_positions[candidates, 0] + signs[0] * displacement[0]
+        y = start_positions[candidates, 1] + signs[1] * displacement[1]
+        return (x, y)
+
+    x, y = within_circle_batch(radius, xy_trial, len(start_positions))
+    z = correlated_expo_interval_batch(
+        rng, start_positions[:, 2], -height / 2, height / 2, exp_scale
+    )
+    return np.column_stack((x, y, z))
+
+
 def xy_z_func(xy_func, z_func):
     """Get a function that calls 2 functions and flattens the result.
 
@@ -42,14 +469,21 @@ def xy_z_func(xy_func, z_func):
     -------
     xyz_func : function of any parameters returning (number, number, number)
         A function that calls xy_func and z_func, then aggregates the
-        results in a single tuple
+        results in a single tuple. If xy_func and z_func return arrays
+        of shape ``(N, 2)`` and ``(N,)``, the result is instead an array
+        of shape ``(N, 3)``. The result is marked with
+        :py:func:`vectorized` if both xy_func and z_func are.
     """
 
     def xyz_func(*args, **kwargs):
         xy = xy_func(*args, **kwargs)
         z = z_func(*args, **kwargs)
+        if np.ndim(z) > 0:
+            return np.column_stack((xy, z))
         return (xy[0], xy[1], z)
 
+    if is_vectorized(xy_func) and is_vectorized(z_func):
+        vectorized(xyz_func)
     return xyz_func
 
 
@@ -63,14 +497,18 @@ def rng_uniform_circle(radius):
 
     Returns
     -------
-    generator : function of rng returning (number, number)
+    generator : function of (rng, size=None) returning (number, number)
         A function which, when supplied with an RNG, returns a point
-        drawn uniformly from within the circle of supplied radius
+        drawn uniformly from within the circle of supplied radius. If
+        ``size`` is supplied, returns an array of shape ``(size, 2)``.
 
     """
 
-    def uniform_within_circle(rng):
-        return within_circle(radius, lambda: rng.uniform(-radius, radius, size=2))
+    @vectorized
+    def uniform_within_circle(rng, size=None):
+        if size is None:
+            return tuple(uniform_circle_batch(rng, radius, 1)[0])
+        return uniform_circle_batch(rng, radius, size)
 
     return uniform_within_circle
 
@@ -90,19 +528,25 @@ def rng_uniform_cylinder(radius, height):
 
     Returns
     -------
-    generator : function of rng returning (number, number, number)
+    generator : function of (rng, size=None) returning (number, number, number)
         A function which, when supplied with an RNG, returns a point
         drawn uniformly from within the cylinder of supplied radius and
-        height.
+        height. If ``size`` is supplied, returns an array of shape
+        ``(size, 3)``.
 
     """
-    return xy_z_func(
-        rng_uniform_circle(radius), lambda rng: rng.uniform(-height / 2, height / 2)
-    )
+
+    @vectorized
+    def uniform_within_cylinder(rng, size=None):
+        if size is None:
+            return tuple(uniform_cylinder_batch(rng, radius, height, 1)[0])
+        return uniform_cylinder_batch(rng, radius, height, size)
+
+    return uniform_within_cylinder
 
 
 def rng_correlated_expo_cylinder(radius, height, exp_scale):
-    """Create a that returns a correlated point within a cylinder.
+    """Create a function that returns a correlated point within a cylinder.
 
     The cylinder is assumed to be centered at the origin with its axis
     lying along the Z axis.
@@ -110,7 +554,10 @@ def rng_correlated_expo_cylinder(radius, height, exp_scale):
     The new point's coordinates are determined by drawing from an
     exponential distribution once per coordinate to determine the
     displacement. The procedure is repeated until the new point lies
-    within the specified cylinder volume.
+    within the specified cylinder volume. (In practice, only the x and y
+    coordinates need to be repeated; the z coordinate is drawn directly
+    from the equivalent truncated distribution. See
+    :py:func:`correlated_expo_cylinder_batch`.)
 
     Parameters
     ----------
@@ -128,9 +575,11 @@ def rng_correlated_expo_cylinder(radius, height, exp_scale):
         A function which, when supplied with an RNG, and an original
         point, returns a point drawn from within the cylinder of
         supplied radius and height based on a correlation to the
-        original point.
+        original point. If an ``(N, 3)`` array of original points is
+        supplied instead, returns an ``(N, 3)`` array of new points.
     """
 
+    @vectorized
     def correlated_expo_cylinder(rng, start_position):
         """Generate a new point correlated to the start position.
 
@@ -138,34 +587,319 @@ def rng_correlated_expo_cylinder(radius, height, exp_scale):
         ----------
         rng : numpy random Generator object
             The random generator to use
-        start_position : (number, number, number)
-            The coordinates of the position that the new point should be
-            correlated to
+        start_position : (number, number, number) or array of shape (N, 3)
+            The coordinates of the position(s) that the new point(s)
+            should be correlated to
 
         Returns
         -------
-        position : (number, number, number)
-            The x, y, and z coordinates of the new correlated position
+        position : (number, number, number) or array of shape (N, 3)
+            The x, y, and z coordinates of the new correlated position(s)
         """
+        if np.ndim(start_position) == 2:
+            return correlated_expo_cylinder_batch(
+                rng, radius, height, exp_scale, start_position
+            )
+        position = correlated_expo_cylinder_batch(
+            rng, radius, height, exp_scale, [start_position]
+        )
+        return tuple(position[0])
 
-        def trial():
-            displacement = rng.exponential(exp_scale, size=2)
-            sign_on_x = rng.choice([1, -1])
-            sign_on_y = rng.choice([1, -1])
-            x = start_position[0] + sign_on_x * displacement[0]
-            y = start_position[1] + sign_on_y * displacement[1]
-            return (x, y)
+    return correlated_expo_cylinder
 
-        x, y = within_circle(radius, trial)
 
-        def z_trial_trick():
-            # To iterate on the z coordinate, just return (z, 0)
-            displacement = rng.exponential(exp_scale)
-            sign_on_z = rng.choice([1, -1])
-            z = start_position[2] + sign_on_z * displacement
-            return (z, 0)
+def cache_dir(name):
+    """Return the directory that the Toy MC caches ``name`` in.
 
-        z, _ = within_circle(height / 2, z_trial_trick)
-        return (x, y, z)
+    This is ``$TOYMC_CACHE_DIR/<name>`` if the ``TOYMC_CACHE_DIR``
+    environment variable is set, and otherwise ``toymc/<name>`` within
+    ``$XDG_CACHE_HOME`` (default: ``~/.cache``).
+    """
+    base = os.environ.get("TOYMC_CACHE_DIR")
+    if base is None:
+        cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+            os.path.expanduser("~"), ".cache"
+        )
+        base = os.path.join(cache_home, "toymc")
+    return os.path.join(base, name)
 
-    return correlated_expo_cylinder
+
+def table_cache_dir():
+    """Return the directory that sampling tables are cached in.
+
+    This is ``cache_dir("tables")``; see :py:func:`cache_dir`.
+    """
+    return cache_dir("tables")
+
+
+def cached_table(kind, arrays, build, cache=True):
+    """Return a table built from the given arrays, using the disk cache.
+
+    The table is looked up in :py:func:`table_cache_dir` by a SHA-256
+    hash of ``kind`` and the dtypes, shapes and contents of ``arrays``.
+    If it is not there, it is built with ``build(*arrays)`` and saved.
+    The cache is only an optimization: if it cannot be read or written,
+    the table is simply built.
+
+    Parameters
+    ----------
+    kind : str
+        The name of the kind of table, e.g. ``"inverse_cdf"``
+    arrays : tuple of numpy.ndarray
+        The arrays the table is built from
+    build : function of arrays returning tuple of numpy.ndarray
+        The function that builds the table
+    cache : bool or str, optional
+        Whether to use the cache, or the cache directory to use.
+        Default: ``True`` (use :py:func:`table_cache_dir`).
+
+    Returns
+    -------
+    table : tuple of numpy.ndarray
+        The arrays making up the table
+    """
+    if not cache:
+        return build(*arrays)
+    digest = hashlib.sha256(kind.encode())
+    for array in arrays:
+        digest.update(repr((array.dtype.str, array.shape)).encode())
+        digest.update(np.ascontiguousarray(array).tobytes())
+    directory = cache if isinstance(cache, str) else table_cache_dir()
+    path = os.path.join(directory, f"{kind}-{digest.hexdigest()}.npz")
+    try:
+        with np.load(path) as saved:
+            return tuple(saved[f"arr_{i}"] for i in range(len(saved.files)))
+    except (OSError, ValueError, KeyError):
+        pass
+    table = build(*arrays)
+    try:
+        os.makedirs(directory, exist_ok=True)
+        fd, partial_path = tempfile.mkstemp(dir=directory, suffix=".partial")
+        with os.fdopen(fd, "wb") as outfile:
+            np.savez(outfile, *table)
+        os.replace(partial_path, path)
+    except OSError:
+        pass
+    return table
+
+
+def inverse_cdf_table(counts, edges):
+    """Build the inverse-CDF table of a histogram.
+
+    Parameters
+    ----------
+    counts : numpy.ndarray
+        The contents of each bin. Must be non-negative with a positive
+        sum.
+    edges : numpy.ndarray
+        The bin edges, one more than the number of bins, in increasing
+        order
+
+    Returns
+    -------
+    (cdf, edges) : (numpy.ndarray, numpy.ndarray)
+        The cumulative probability at each bin edge (starting at 0 and
+        ending at 1), and the bin edges, with any empty bins at either
+        end dropped
+    """
+    counts = np.asarray(counts, dtype=float)
+    edges = np.asarray(edges, dtype=float)
+    if counts.ndim != 1 or edges.shape != (len(counts) + 1,):
+        raise ValueError("A histogram needs one more edge than it has bins")
+    if np.any(np.diff(edges) <= 0):
+        raise ValueError("Histogram edges must be increasing")
+    if np.any(counts < 0) or not np.isfinite(counts).all() or counts.sum() <= 0:
+        raise ValueError("Histogram counts must be non-negative with a positive sum")
+    filled = np.flatnonzero(counts)
+    first, last = filled[0], filled[-1]
+    counts = counts[first : last + 1]
+    cdf = np.concatenate([[0], np.cumsum(counts)])
+    cdf /= cdf[-1]
+    return cdf, edges[first : last + 2]
+
+
+def alias_table(weights):
+    """Build a Walker alias table for the given weights.
+
+    This uses Vose's method, which takes time proportional to the number
+    of weights.
+
+    Parameters
+    ----------
+    weights : numpy.ndarray
+        The relative probability of each outcome. Must be non-negative
+        with a positive sum.
+
+    Returns
+    -------
+    (probability, alias) : (numpy.ndarray, numpy.ndarray)
+        For each outcome ``i``, the probability of keeping ``i`` when it
+        is picked uniformly at random, and the outcome to use otherwise
+    """
+    weights = np.asarray(weights, dtype=float)
+    if weights.ndim != 1 or len(weights) == 0:
+        raise ValueError("Weights must be a non-empty 1D array")
+    if np.any(weights < 0) or not np.isfinite(weights).all() or weights.sum() <= 0:
+        raise ValueError("Weights must be non-negative with a positive sum")
+    size = len(weights)
+    scaled = weights * (size / weights.sum())
+    probability = np.ones(size)
+    alias = np.arange(size)
+    small = [i for i in range(size) if scaled[i] < 1]
+    large = [i for i in range(size) if scaled[i] >= 1]
+    while small and large:
+        less = small.pop()
+        more = large.pop()
+        probability[less] = scaled[less]
+        alias[less] = more
+        scaled[more] -= 1 - scaled[less]
+        if scaled[more] < 1:
+            small.append(more)
+        else:
+            large.append(more)
+    # Anything left over is 1 up to rounding errors
+    return probability, alias
+
+
+def rng_histogram(counts, edges, cache=True):
+    """Create a function of an RNG that draws values from a histogram.
+
+    The values are distributed uniformly within each bin, i.e. the
+    inverse CDF is interpolated linearly within each bin, with the bins
+    weighted by their contents. The inverse-CDF table is built once with
+    :py:func:`inverse_cdf_table` and cached with
+    :py:func:`cached_table`.
+
+    Example::
+
+        >>> counts, edges = np.histogram(measured_energies, bins=200)
+        >>> single.energy_spectrum = toymc.util.rng_histogram(counts, edges)
+
+    Parameters
+    ----------
+    counts : array-like
+        The contents of each bin
+    edges : array-like
+        The bin edges, one more than the number of bins
+    cache : bool or str, optional
+        Whether to cache the table on disk, or the directory to cache it
+        in (see :py:func:`cached_table`). Default: ``True``.
+
+    Returns
+    -------
+    generator : function of (rng, size=None) returning number
+        A function which, when supplied with an RNG, returns a value
+        drawn from the histogram. If ``size`` is supplied, returns an
+        array of ``size`` values.
+    """
+    cdf, cdf_edges = cached_table(
+        "inverse_cdf",
+        (np.asarray(counts, dtype=float), np.asarray(edges, dtype=float)),
+        inverse_cdf_table,
+        cache,
+    )
+
+    @vectorized
+    def histogram_spectrum(rng, size=None):
+        return np.interp(rng.random(size), cdf, cdf_edges)
+
+    return histogram_spectrum
+
+
+def rng_discrete(values, weights, cache=True):
+    """Create a function of an RNG that draws from weighted discrete values.
+
+    Values are drawn with a Walker alias table, built once with
+    :py:func:`alias_table` and cached with :py:func:`cached_table`, so
+    each value takes a fixed amount of work no matter how many values
+    there are to choose from.
+
+    Example::
+
+        >>> nhit, counts = np.unique(measured_nhits, return_counts=True)
+        >>> muon.WP_nHit_spectrum = toymc.util.rng_discrete(nhit, counts)
+
+    Parameters
+    ----------
+    values : array-like
+        The possible values
+    weights : array-like
+        The relative probability of each value
+    cache : bool or str, optional
+        Whether to cache the table on disk, or the directory to cache it
+        in (see :py:func:`cached_table`). Default: ``True``.
+
+    Returns
+    -------
+    generator : function of (rng, size=None) returning number
+        A function which, when supplied with an RNG, returns one of the
+        values. If ``size`` is supplied, returns an array of ``size``
+        values.
+    """
+    values = np.asarray(values)
+    weights = np.asarray(weights, dtype=float)
+    if values.shape != weights.shape:
+        raise ValueError("There must be one weight per value")
+    probability, alias = cached_table("alias", (weights,), alias_table, cache)
+
+    @vectorized
+    def discrete_spectrum(rng, size=None):
+        picked = rng.integers(0, len(values), size)
+        keep = rng.random(size) < probability[picked]
+        return values[np.where(keep, picked, alias[picked])]
+
+    return discrete_spectrum
+
+
+def th1_to_numpy(hist):
+    """Return the bin contents and edges of a ROOT 1D histogram.
+
+    Parameters
+    ----------
+    hist : ROOT.TH1 or uproot histogram
+        The histogram. Underflow and overflow are ignored.
+
+    Returns
+    -------
+    (counts, edges) : (numpy.ndarray, numpy.ndarray)
+        The contents of each bin and the bin edges, as from
+        ``numpy.histogram``
+    """
+    if hasattr(hist, "to_numpy"):
+        counts, edges = hist.to_numpy()
+        return np.asarray(counts, dtype=float), np.asarray(edges, dtype=float)
+    bins = hist.GetNbinsX()
+    axis = hist.GetXaxis()
+    counts = np.array([hist.GetBinContent(i) for i in range(1, bins + 1)])
+    edges = np.array([axis.GetBinLowEdge(i) for i in range(1, bins + 2)])
+    return counts, edges
+
+
+def rng_th1(hist, discrete=False, cache=True):
+    """Create a function of an RNG that draws values from a ROOT histogram.
+
+    Parameters
+    ----------
+    hist : ROOT.TH1 or uproot histogram
+        The histogram (see :py:func:`th1_to_numpy`)
+    discrete : bool, optional
+        If ``True``, return integers with :py:func:`rng_discrete` (e.g.
+        for a histogram of nHit with one bin per value) rather than
+        continuous values with :py:func:`rng_histogram`. Each bin's value
+        is its center rounded down, which is the integer in the bin for
+        unit-width bins both of the form ``[n, n + 1)`` and of the form
+        ``[n - 0.5, n + 0.5)``. Default: ``False``.
+    cache : bool or str, optional
+        Whether to cache the table on disk, or the directory to cache it
+        in (see :py:func:`cached_table`). Default: ``True``.
+
+    Returns
+    -------
+    generator : function of (rng, size=None) returning number
+        The generator function, which returns integers if ``discrete``
+    """
+    counts, edges = th1_to_numpy(hist)
+    if discrete:
+        centers = (edges[:-1] + edges[1:]) / 2
+        return rng_discrete(np.floor(centers).astype(np.int64), counts, cache)
+    return rng_histogram(counts, edges, cache)